@@ -0,0 +1,48 @@
+"""
+Compares the time a `logger.info()` call takes with `MWLoggingHandler`
+and with `AsyncMWLoggingHandler` (`MW_LOG_ASYNC`), with the console
+exporter on, as with `console_exporter=True`.
+
+    python benchmarks/async_log_handler.py [count]
+"""
+import logging
+import os
+import sys
+import time
+
+from middleware.log import AsyncMWLoggingHandler, MWLoggingHandler
+from opentelemetry.sdk._logs import LoggerProvider
+from opentelemetry.sdk._logs.export import ConsoleLogExporter, SimpleLogRecordProcessor
+
+
+def _logger(handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"benchmark.{type(handler).__name__}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def main(count: int):
+    with open(os.devnull, "w") as devnull:
+        for handler_class in (logging.NullHandler, MWLoggingHandler, AsyncMWLoggingHandler):
+            if handler_class is logging.NullHandler:
+                handler = handler_class()
+            else:
+                provider = LoggerProvider(shutdown_on_exit=False)
+                provider.add_log_record_processor(
+                    SimpleLogRecordProcessor(ConsoleLogExporter(out=devnull))
+                )
+                handler = handler_class(level=logging.INFO, logger_provider=provider)
+            logger = _logger(handler)
+            start = time.perf_counter()
+            for i in range(count):
+                logger.info("user %s fetched %d items", "alice", i)
+            seconds = time.perf_counter() - start
+            handler.flush()
+            handler.close()
+            print(f"{handler_class.__name__:>22}  {seconds / count * 1e6:7.1f} us per call")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,94 @@
+"""
+Compares the cost of `ExceptionFilteringSpanProcessor.on_end` per span
+before and after exceptions were de-duplicated at record time.
+
+Before, every span was scanned, and a span with a recorded exception held
+both the detailed event and the standard one added by
+`Span.record_exception`. Now only spans with two or more events are
+scanned, and a recorded exception adds a single event.
+
+    python benchmarks/exception_filter.py [iterations]
+"""
+import sys
+import timeit
+
+import middleware  # noqa: F401 installs the record_exception wrapper
+from middleware.distro import _original_record_exception
+from middleware.trace import ExceptionFilteringSpanProcessor
+from opentelemetry.sdk.trace import TracerProvider
+
+
+def _legacy_on_end(span):
+    has_stack_details = any(
+        event.name == "exception" and "exception.stack_details" in event.attributes
+        for event in span.events
+    )
+    if has_stack_details:
+        seen_stack_traces = set()
+        filtered_events = []
+        for event in span.events:
+            if event.name == "exception" and "exception.stack_details" in event.attributes:
+                stack_trace = event.attributes.get("exception.stack_trace")
+                seen_stack_traces.add(stack_trace)
+                filtered_events.append(event)
+            elif event.name == "exception":
+                stack_trace = event.attributes.get("exception.stack_trace")
+                if stack_trace not in seen_stack_traces:
+                    filtered_events.append(event)
+            elif event.name != "exception":
+                filtered_events.append(event)
+        span._events = filtered_events
+
+
+def _fail():
+    raise ValueError("benchmark")
+
+
+def _spans():
+    tracer = TracerProvider().get_tracer(__name__)
+
+    plain = tracer.start_span("plain")
+    plain.end()
+
+    legacy = tracer.start_span("legacy")
+    recorded = tracer.start_span("recorded")
+    try:
+        _fail()
+    except ValueError as e:
+        recorded.record_exception(e)
+        # The standard event the previous wrapper added next to the detailed one.
+        legacy._events.extend(recorded._events)
+        _original_record_exception(legacy, e)
+    legacy.end()
+    recorded.end()
+    return plain._readable_span(), legacy._readable_span(), recorded._readable_span()
+
+
+def _per_span(on_end, span, iterations: int) -> float:
+    events = list(span._events)
+
+    def run():
+        span._events = events
+        on_end(span)
+
+    return min(timeit.repeat(run, number=iterations, repeat=5)) / iterations * 1e9
+
+
+def main(iterations: int):
+    plain, legacy, recorded = _spans()
+    on_end = ExceptionFilteringSpanProcessor().on_end
+    print(f"{'span':>22}  {'before':>10}  {'after':>10}")
+    print(
+        f"{'without exception':>22}  "
+        f"{_per_span(_legacy_on_end, plain, iterations):7.0f} ns  "
+        f"{_per_span(on_end, plain, iterations):7.0f} ns"
+    )
+    print(
+        f"{'with exception':>22}  "
+        f"{_per_span(_legacy_on_end, legacy, iterations):7.0f} ns  "
+        f"{_per_span(on_end, recorded, iterations):7.0f} ns"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,52 @@
+"""
+Compares what recording an exception costs the request thread with what
+building its details costs once the span is exported.
+
+Recording only captures the code objects and lines of the traceback, the
+stack trace, function bodies and stack details JSON are built on the
+export path, so spans that are dropped by tail sampling never pay for it.
+
+    python benchmarks/exception_recording.py [count] [depth]
+"""
+import sys
+import time
+
+from middleware import distro
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+
+
+def _raise(depth: int):
+    if depth == 0:
+        raise ConnectionError("downstream unavailable")
+    _raise(depth - 1)
+
+
+def _exception(depth: int):
+    try:
+        _raise(depth)
+    except ConnectionError as e:
+        return e
+
+
+def main(count: int, depth: int):
+    tracer = TracerProvider(span_limits=SpanLimits(max_events=count)).get_tracer(__name__)
+    exception = _exception(depth)
+    span = tracer.start_span("GET /users/{id}")
+    start = time.perf_counter()
+    for _ in range(count):
+        distro.custom_record_exception(span, exception)
+    recorded = time.perf_counter() - start
+    start = time.perf_counter()
+    for event in span.events:
+        event.attributes
+    exported = time.perf_counter() - start
+    span.end()
+    for label, seconds in (("record", recorded), ("export", exported)):
+        print(f"{label:>7}  {seconds / count * 1e6:8.1f} us per exception of {depth + 2} frames")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10,
+    )
@@ -0,0 +1,60 @@
+"""
+Records the same exception on a span again and again, as a hot error path
+does, with and without the source snippet cache of
+`custom_record_exception`.
+
+    python benchmarks/exception_source_cache.py [count]
+"""
+import sys
+import time
+
+from middleware import distro
+from middleware import exception_event
+from middleware.source_cache import SourceSnippetCache
+from opentelemetry.sdk.trace import SpanLimits, TracerProvider
+
+
+def _query(user_id):
+    raise ConnectionError(f"downstream unavailable for user {user_id}")
+
+
+def _handler(user_id):
+    try:
+        return _query(user_id)
+    except ConnectionError as e:
+        raise RuntimeError("request failed") from e
+
+
+def _exception():
+    try:
+        _handler(42)
+    except RuntimeError as e:
+        return e
+
+
+def _record(count: int) -> float:
+    tracer = TracerProvider(span_limits=SpanLimits(max_events=1)).get_tracer(__name__)
+    exception = _exception()
+    span = tracer.start_span("GET /users/{id}")
+    start = time.perf_counter()
+    for _ in range(count):
+        distro.custom_record_exception(span, exception)
+        # The source is extracted when the event is exported.
+        span.events[-1].attributes
+    seconds = time.perf_counter() - start
+    span.end()
+    return seconds
+
+
+def main(count: int):
+    for label, maxsize in (("uncached", 0), ("cached", 1024)):
+        exception_event._source_cache = SourceSnippetCache(maxsize)
+        seconds = _record(count)
+        print(
+            f"{label:>9}  {seconds:6.2f} s for {count}"
+            f"  {seconds / count * 1e6:7.1f} us per exception  {distro.source_cache_info()}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,80 @@
+"""
+Compares the time `MWLoggingHandler._get_attributes` takes with the
+conversion it did before, one value at a time with `isinstance` and `str`,
+for records with primitive, request and large extra attributes. Reports
+the median of interleaved rounds.
+
+    python benchmarks/log_attributes.py [count]
+"""
+import logging
+import statistics
+import sys
+import time
+
+from middleware.log import MWLoggingHandler
+from opentelemetry.sdk._logs import LoggingHandler
+
+
+def _previous_get_attributes(record: logging.LogRecord):
+    attributes = LoggingHandler._get_attributes(record)
+    for key, value in attributes.items():
+        if key == "request":
+            if hasattr(value, "method") and hasattr(value, "path"):
+                if len(vars(value)) == 2:
+                    attributes[key] = f'{value.method} {value.path}'
+                else:
+                    attributes[key] = str(value)
+            else:
+                attributes[key] = str(value)
+        elif not isinstance(value, (bool, str, bytes, int, float)):
+            attributes[key] = str(value)
+    return attributes
+
+
+class _Request:
+    def __init__(self):
+        self.method = "GET"
+        self.path = "/users/1"
+
+
+def _record(**extra) -> logging.LogRecord:
+    record = logging.LogRecord(
+        "app", logging.INFO, "/app/views.py", 10, "user %s", ("alice",), None, "view"
+    )
+    record.__dict__.update(extra)
+    return record
+
+
+_RECORDS = {
+    "primitives": _record(user_id=7, route="/users/{id}", cached=True, ratio=0.5),
+    "request": _record(request=_Request(), status_code=200),
+    "small containers": _record(tags=["a", "b"], ids=(1, 2, 3), headers={"accept": "*/*"}),
+    "large dict": _record(payload={i: "x" * 20 for i in range(2000)}),
+    "long text object": _record(payload=Exception("x" * 100_000)),
+}
+
+
+def _per_call(get_attributes, record, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        get_attributes(record)
+    return (time.perf_counter() - start) / count
+
+
+def main(count: int, rounds: int = 15):
+    for name, record in _RECORDS.items():
+        # Rounds alternate both conversions, so a noisy host slows both down.
+        before, after = [], []
+        for _ in range(rounds):
+            before.append(_per_call(_previous_get_attributes, record, count))
+            after.append(_per_call(MWLoggingHandler._get_attributes, record, count))
+        before = statistics.median(before)
+        after = statistics.median(after)
+        print(
+            f"{name:>18}  before {before * 1e6:8.2f} us  after {after * 1e6:8.2f} us"
+            f"  ({before / after:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000)
@@ -0,0 +1,77 @@
+"""
+Compares the compressions of the OTLP exporters on an encoded batch of
+spans: CPU time per megabyte of protobuf against the bytes sent.
+
+gRPC always compresses at the library's default level, the level only
+applies to `MW_EXPORTER_PROTOCOL=http/protobuf`.
+
+    python benchmarks/otlp_compression.py [batch size]
+"""
+import gzip
+import sys
+import time
+import zlib
+
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.trace import SpanKind
+
+
+def _spans(count: int):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+    for i in range(count):
+        with tracer.start_as_current_span(
+            "SELECT users",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": "postgresql",
+                "db.statement": "SELECT * FROM users WHERE id = %s",
+                "net.peer.name": "db.internal",
+                "net.peer.port": 5432,
+                "user.id": i,
+            },
+        ):
+            pass
+    return exporter.get_finished_spans()
+
+
+def _cpu_seconds(compress, body: bytes, number: int) -> float:
+    best = None
+    for _ in range(5):
+        start = time.process_time()
+        for _ in range(number):
+            compress(body)
+        seconds = (time.process_time() - start) / number
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main(batch_size: int):
+    body = encode_spans(_spans(batch_size)).SerializeToString()
+    megabytes = len(body) / 1e6
+    print(f"{len(body)} bytes of protobuf for {batch_size} spans")
+    compressions = [("none", None, lambda data: data)]
+    for level in (1, 6, 9):
+        compressions.append(
+            ("deflate", level, lambda data, level=level: zlib.compress(data, level))
+        )
+        compressions.append(
+            ("gzip", level, lambda data, level=level: gzip.compress(data, level))
+        )
+    for name, level, compress in compressions:
+        seconds = _cpu_seconds(compress, body, 20)
+        size = len(compress(body))
+        print(
+            f"{name:>8} {level if level is not None else '-':>2}"
+            f"  {seconds / megabytes * 1e3:8.2f} CPU ms per MB"
+            f"  {size:9d} bytes  {size / len(body):6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 512)
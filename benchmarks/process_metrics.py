@@ -0,0 +1,48 @@
+"""
+Compares the cost of one process-metrics collection cycle (the normal tier
+of `ProcessSnapshot`) between the psutil and the procfs backends.
+
+    python benchmarks/process_metrics.py [iterations]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from middleware.metrics import ProcessSnapshot, TIER_NORMAL
+from middleware.options import METRICS_BACKEND_PROCFS, METRICS_BACKEND_PSUTIL
+
+
+def _snapshot(backend: str) -> ProcessSnapshot:
+    snapshot = ProcessSnapshot(max_age=0)
+    snapshot.set_backend(backend)
+    return snapshot
+
+
+def _peak_bytes(snapshot: ProcessSnapshot) -> int:
+    snapshot.get(TIER_NORMAL)
+    tracemalloc.start()
+    snapshot.get(TIER_NORMAL)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(iterations: int):
+    for backend in (METRICS_BACKEND_PSUTIL, METRICS_BACKEND_PROCFS):
+        snapshot = _snapshot(backend)
+        if backend == METRICS_BACKEND_PROCFS and snapshot._procfs is None:
+            print(f"{backend:>8}: unavailable on {sys.platform}")
+            continue
+        seconds = min(
+            timeit.repeat(
+                lambda: snapshot.get(TIER_NORMAL), number=iterations, repeat=5
+            )
+        )
+        print(
+            f"{backend:>8}: {seconds / iterations * 1e6:8.1f} us/cycle, "
+            f"{_peak_bytes(snapshot):6d} peak bytes allocated/cycle"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,64 @@
+"""
+Compares the work a batch of spans costs the application process when
+exporting in process, OTLP protobuf encoding and gzip, with the `subprocess`
+export mode, which only flattens the spans with `marshal` and copies them
+into shared memory for the export worker.
+
+The time is spent holding the GIL either way, so it is time request
+threads wait for.
+
+    python benchmarks/subprocess_export.py [batch size]
+"""
+import gzip
+import sys
+import timeit
+
+from middleware import export_codec
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.trace import SpanKind
+
+
+def _spans(count: int):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+    for i in range(count):
+        with tracer.start_as_current_span(
+            "GET /users/{id}",
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.method": "GET",
+                "http.route": "/users/{id}",
+                "http.status_code": 200,
+                "http.target": f"/users/{i}",
+                "net.peer.ip": "10.0.0.1",
+            },
+        ):
+            pass
+    return exporter.get_finished_spans()
+
+
+def _in_process(spans):
+    gzip.compress(encode_spans(spans).SerializeToString())
+
+
+def _subprocess(spans):
+    export_codec.encode_spans(spans)
+
+
+def main(batch_size: int):
+    spans = _spans(batch_size)
+    for label, export in (("in process", _in_process), ("subprocess", _subprocess)):
+        seconds = min(timeit.repeat(lambda: export(spans), number=20, repeat=5)) / 20
+        print(
+            f"{label:>12}  {seconds * 1e3:7.2f} ms per batch of {batch_size}"
+            f"  {seconds / batch_size * 1e6:6.2f} us per span"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 512)
@@ -0,0 +1,165 @@
+import collections
+import logging
+import threading
+import time
+import tracemalloc
+from typing import Optional
+from opentelemetry.metrics import CallbackOptions, Meter, Observation
+
+_logger = logging.getLogger(__name__)
+
+# Allocations made by tracemalloc itself and by this module are never
+# reported as growing sites.
+_EXCLUDED_FILES = (tracemalloc.__file__, __file__)
+
+_sampler = None
+
+
+class AllocationSampler:
+    """
+    Finds the allocation sites whose memory grows the most between two
+    `tracemalloc` snapshots, to chase slow leaks in long-lived processes.
+
+    Snapshots are taken from the metrics collection thread, at most once per
+    `interval` seconds, and only the previous snapshot is kept. The time spent
+    taking and diffing a snapshot is measured, and the next one is postponed
+    until that time stays within `overhead_budget` (a fraction of wall time,
+    e.g. 0.01 for 1%). Tracing is started with `frame_depth` frames per trace
+    (1 by default) to keep the per-allocation cost of tracemalloc low.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        top_n: int,
+        frame_depth: int,
+        overhead_budget: float,
+    ):
+        self.interval = interval
+        self.top_n = top_n
+        self.frame_depth = max(1, frame_depth)
+        self.overhead_budget = overhead_budget
+        self.top = []
+        self._filters = [
+            tracemalloc.Filter(False, filename) for filename in _EXCLUDED_FILES
+        ]
+        self._key_type = "lineno" if self.frame_depth == 1 else "traceback"
+        self._previous = None
+        self._next_sample_at = 0.0
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frame_depth)
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._previous = None
+
+    def reset(self):
+        """Drops the previous snapshot, e.g. the one a forked child inherited."""
+        self._previous = None
+        self.top = []
+        self._next_sample_at = 0.0
+
+    def maybe_sample(self):
+        """Takes a new snapshot if one is due and updates `top`."""
+        now = time.monotonic()
+        if now < self._next_sample_at or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._sample()
+            elapsed = time.monotonic() - now
+            delay = self.interval
+            if self.overhead_budget > 0:
+                delay = max(delay, elapsed / self.overhead_budget)
+            self._next_sample_at = now + delay
+        finally:
+            self._lock.release()
+
+    def _sample(self):
+        if not tracemalloc.is_tracing():
+            self.top = []
+            self._previous = None
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return
+        # Tracebacks go from the oldest frame to the allocating one, and
+        # different stacks may allocate at the same line: the growth is
+        # summed per allocating line.
+        sites = collections.defaultdict(lambda: [0, 0])
+        for stat in snapshot.compare_to(previous, self._key_type):
+            frame = stat.traceback[-1]
+            site = sites[f"{frame.filename}:{frame.lineno}"]
+            site[0] += stat.size_diff
+            site[1] += stat.count_diff
+        growing = sorted(
+            ((site, diffs) for site, diffs in sites.items() if diffs[0] > 0),
+            key=lambda item: item[1][0],
+            reverse=True,
+        )
+        self.top = [
+            ({"site": site}, size_diff, count_diff)
+            for site, (size_diff, count_diff) in growing[: self.top_n]
+        ]
+
+    def _growth_bytes_cb(self, options: CallbackOptions):
+        self.maybe_sample()
+        for attributes, size_diff, _ in self.top:
+            yield Observation(value=size_diff, attributes=attributes)
+
+    def _growth_count_cb(self, options: CallbackOptions):
+        for attributes, _, count_diff in self.top:
+            yield Observation(value=count_diff, attributes=attributes)
+
+
+def install_allocation_sampler(
+    meter: Meter,
+    interval: float,
+    top_n: int,
+    frame_depth: int,
+    overhead_budget: float,
+) -> Optional[AllocationSampler]:
+    """
+    Starts tracing allocations and creates the allocation growth instruments
+    on the given meter.
+
+    Args:
+        meter (Meter): the meter to create the instruments with
+        interval (float): minimum seconds between two snapshots
+        top_n (int): number of growing allocation sites to report
+        frame_depth (int): frames stored per allocation trace
+        overhead_budget (float): share of wall time snapshots may take
+
+    Returns:
+        AllocationSampler: the installed sampler, None if it could not be installed
+    """
+    global _sampler
+    if _sampler is not None:
+        return _sampler
+    sampler = AllocationSampler(interval, top_n, frame_depth, overhead_budget)
+    try:
+        meter.create_observable_gauge(
+            "process.memory.allocation_growth.bytes",
+            unit="Bytes",
+            callbacks=[sampler._growth_bytes_cb],
+            description="The will show the memory growth of the top allocation sites between two samples",
+        )
+        meter.create_observable_gauge(
+            "process.memory.allocation_growth.count",
+            unit="Count",
+            callbacks=[sampler._growth_count_cb],
+            description="The will show the growth in allocated blocks of the top allocation sites between two samples",
+        )
+        sampler.start()
+    except Exception as e:
+        _logger.debug(f"Failed to install allocation sampler: {e}")
+        return None
+    _sampler = sampler
+    return sampler
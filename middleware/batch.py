@@ -0,0 +1,134 @@
+import time
+import logging
+from typing import Optional, Sequence
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Bucket boundaries for the number of spans per exported batch.
+_BATCH_SIZE_BUCKETS = (1, 8, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# Bucket boundaries (seconds) for the duration of one export call, retries
+# included.
+_EXPORT_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+_QUEUE_USED_ATTRIBUTES = {"type": "used"}
+_QUEUE_CAPACITY_ATTRIBUTES = {"type": "capacity"}
+_EXPORT_RESULT_ATTRIBUTES = {
+    SpanExportResult.SUCCESS: {"result": "success"},
+    SpanExportResult.FAILURE: {"result": "failure"},
+}
+
+
+class _InstrumentedSpanExporter(SpanExporter):
+    """Records the size and the duration of every batch it exports."""
+
+    def __init__(self, exporter: SpanExporter, batch_size, duration):
+        self._exporter = exporter
+        self._batch_size = batch_size
+        self._duration = duration
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        started_at = time.perf_counter()
+        result = SpanExportResult.FAILURE
+        try:
+            result = self._exporter.export(spans)
+            return result
+        finally:
+            attributes = _EXPORT_RESULT_ATTRIBUTES.get(
+                result, _EXPORT_RESULT_ATTRIBUTES[SpanExportResult.FAILURE]
+            )
+            self._batch_size.record(len(spans), attributes)
+            self._duration.record(time.perf_counter() - started_at, attributes)
+
+    def shutdown(self):
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class ObservableBatchSpanProcessor(BatchSpanProcessor):
+    """
+    A `BatchSpanProcessor` that reports its own queue depth, the spans it
+    dropped because the queue was full, and the size and duration of every
+    exported batch.
+
+    The queue drops its oldest span when a span is added while it is full,
+    so a span counts as dropped when the queue is found full on `on_end`.
+    The check is not synchronised with the export thread, so the count is
+    exact for a single producer and may be off by a few spans when many
+    threads end spans at the same time.
+
+    Instruments come from the global meter provider, so the metrics are
+    exported by the meter provider `mw_tracker` sets up once it exists.
+    """
+
+    def __init__(
+        self,
+        span_exporter: SpanExporter,
+        max_queue_size: Optional[int] = None,
+        schedule_delay_millis: Optional[float] = None,
+        max_export_batch_size: Optional[int] = None,
+        export_timeout_millis: Optional[float] = None,
+    ):
+        meter = metrics.get_meter(__name__)
+        super().__init__(
+            _InstrumentedSpanExporter(
+                span_exporter,
+                batch_size=meter.create_histogram(
+                    "span.export.batch_size",
+                    unit="Count",
+                    description="The will show the number of spans per exported batch",
+                    explicit_bucket_boundaries_advisory=_BATCH_SIZE_BUCKETS,
+                ),
+                duration=meter.create_histogram(
+                    "span.export.duration",
+                    unit="s",
+                    description="The will show the duration of each span batch export",
+                    explicit_bucket_boundaries_advisory=_EXPORT_DURATION_BUCKETS,
+                ),
+            ),
+            max_queue_size=max_queue_size,
+            schedule_delay_millis=schedule_delay_millis,
+            max_export_batch_size=max_export_batch_size,
+            export_timeout_millis=export_timeout_millis,
+        )
+        self.dropped = 0
+        meter.create_observable_gauge(
+            "span.queue.size",
+            unit="Count",
+            callbacks=[self._queue_size_cb],
+            description="The will show the number of spans waiting in the export queue and its capacity",
+        )
+        meter.create_observable_counter(
+            "span.dropped.count",
+            unit="Count",
+            callbacks=[self._dropped_cb],
+            description="The will show the number of spans dropped because the export queue was full",
+        )
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        batch_processor = self._batch_processor
+        if len(batch_processor._queue) >= batch_processor._max_queue_size:
+            self.dropped += 1
+        batch_processor.emit(span)
+
+    def _queue_size_cb(self, options: CallbackOptions):
+        batch_processor = self._batch_processor
+        yield Observation(len(batch_processor._queue), _QUEUE_USED_ATTRIBUTES)
+        yield Observation(batch_processor._max_queue_size, _QUEUE_CAPACITY_ATTRIBUTES)
+
+    def _dropped_cb(self, options: CallbackOptions):
+        yield Observation(self.dropped)
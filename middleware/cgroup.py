@@ -0,0 +1,200 @@
+import os
+import logging
+from typing import Optional
+from middleware.procfs import IS_LINUX, ProcFile
+
+_logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# cgroup v1 reports "no limit" as the largest page-aligned signed 64-bit value.
+_V1_UNLIMITED = 1 << 62
+
+PSI_RESOURCES = ("cpu", "memory", "io")
+
+
+def _cgroup_paths() -> dict:
+    """Maps each controller of /proc/self/cgroup ("" for cgroup v2) to its path."""
+    paths = {}
+    with open("/proc/self/cgroup") as f:
+        for line in f:
+            _, controllers, path = line.rstrip("\n").split(":", 2)
+            for controller in controllers.split(","):
+                paths[controller] = path
+    return paths
+
+
+def _resolve(mount: str, path: str) -> str:
+    """
+    Returns the directory of the process cgroup under `mount`. Inside a
+    container with its own cgroup namespace the cgroup is mounted at the
+    root, so the host path from /proc/self/cgroup may not exist.
+    """
+    candidate = os.path.join(mount, path.lstrip("/"))
+    return candidate if os.path.isdir(candidate) else mount
+
+
+def _open(directory: str, name: str) -> Optional[ProcFile]:
+    try:
+        return ProcFile(os.path.join(directory, name))
+    except OSError:
+        return None
+
+
+def _parse_flat_keyed(data: bytes) -> dict:
+    values = {}
+    for line in data.splitlines():
+        key, _, value = line.partition(b" ")
+        if value:
+            values[key] = int(value)
+    return values
+
+
+def _parse_pressure(data: bytes) -> dict:
+    """Parses PSI lines like `some avg10=0.00 avg60=0.00 avg300=0.00 total=0`."""
+    values = {}
+    for line in data.splitlines():
+        kind, _, fields = line.partition(b" ")
+        entry = {}
+        for field in fields.split():
+            key, _, value = field.partition(b"=")
+            entry[key.decode()] = float(value)
+        values[kind.decode()] = entry
+    return values
+
+
+class CgroupReader:
+    """
+    Reads the resource usage and limits of the cgroup the process runs in,
+    for both cgroup v2 (unified) and cgroup v1 hierarchies.
+
+    Files are opened once and re-read in place with `ProcFile`, so a refresh
+    costs one `pread` per file. Values that are not available (no limit set,
+    controller not mounted, PSI disabled) are left as `None`.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT):
+        if not IS_LINUX:
+            raise OSError("cgroup metrics are only available on Linux")
+        self.version = None
+        self._files = {}
+        self._psi = {}
+        paths = _cgroup_paths()
+        if os.path.exists(os.path.join(root, "cgroup.controllers")):
+            self._open_v2(_resolve(root, paths.get("", "/")))
+        elif os.path.isdir(os.path.join(root, "memory")) or os.path.isdir(
+            os.path.join(root, "cpu")
+        ):
+            self._open_v1(root, paths)
+        else:
+            raise OSError(f"no cgroup hierarchy found under {root}")
+        self._clear()
+
+    def _open_v2(self, directory: str):
+        self.version = 2
+        for name in ("memory.current", "memory.max", "cpu.stat", "cpu.max"):
+            self._files[name] = _open(directory, name)
+        self._open_psi(directory)
+
+    def _open_v1(self, root: str, paths: dict):
+        self.version = 1
+        memory = _resolve(os.path.join(root, "memory"), paths.get("memory", "/"))
+        cpu = _resolve(os.path.join(root, "cpu"), paths.get("cpu", "/"))
+        for name in ("memory.usage_in_bytes", "memory.limit_in_bytes"):
+            self._files[name] = _open(memory, name)
+        for name in ("cpu.stat", "cpu.cfs_quota_us", "cpu.cfs_period_us"):
+            self._files[name] = _open(cpu, name)
+        # Hybrid hosts expose pressure stall information on the unified mount.
+        unified = os.path.join(root, "unified")
+        if os.path.isdir(unified):
+            self._open_psi(_resolve(unified, paths.get("", "/")))
+
+    def _open_psi(self, directory: str):
+        for resource in PSI_RESOURCES:
+            psi_file = _open(directory, f"{resource}.pressure")
+            if psi_file is not None:
+                self._psi[resource] = psi_file
+
+    def close(self):
+        for cgroup_file in list(self._files.values()) + list(self._psi.values()):
+            if cgroup_file is not None:
+                cgroup_file.close()
+        self._files = {}
+        self._psi = {}
+
+    def _clear(self):
+        self.memory_usage = None
+        self.memory_limit = None
+        self.cpu_periods = None
+        self.cpu_throttled_periods = None
+        self.cpu_throttled_time = None
+        self.cpu_quota = None
+        self.pressure = {}
+
+    def _read(self, name: str) -> Optional[bytes]:
+        cgroup_file = self._files.get(name)
+        if cgroup_file is None:
+            return None
+        try:
+            return cgroup_file.read().strip()
+        except OSError as e:
+            _logger.debug(f"Failed to read cgroup file {cgroup_file.path}: {e}")
+            return None
+
+    def refresh(self):
+        self._clear()
+        if self.version == 2:
+            self._refresh_v2()
+        else:
+            self._refresh_v1()
+        for resource, psi_file in self._psi.items():
+            try:
+                self.pressure[resource] = _parse_pressure(psi_file.read())
+            except (OSError, ValueError) as e:
+                # Reading a pressure file fails when PSI is disabled at boot.
+                _logger.debug(f"Failed to read {psi_file.path}: {e}")
+
+    def _refresh_v2(self):
+        current = self._read("memory.current")
+        if current is not None:
+            self.memory_usage = int(current)
+        limit = self._read("memory.max")
+        if limit is not None and limit != b"max":
+            self.memory_limit = int(limit)
+
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat is not None:
+            stat = _parse_flat_keyed(cpu_stat)
+            self.cpu_periods = stat.get(b"nr_periods")
+            self.cpu_throttled_periods = stat.get(b"nr_throttled")
+            throttled_usec = stat.get(b"throttled_usec")
+            if throttled_usec is not None:
+                self.cpu_throttled_time = throttled_usec / 1e6
+
+        cpu_max = self._read("cpu.max")
+        if cpu_max is not None:
+            quota, _, period = cpu_max.partition(b" ")
+            if quota != b"max" and period:
+                self.cpu_quota = int(quota) / int(period)
+
+    def _refresh_v1(self):
+        usage = self._read("memory.usage_in_bytes")
+        if usage is not None:
+            self.memory_usage = int(usage)
+        limit = self._read("memory.limit_in_bytes")
+        if limit is not None and int(limit) < _V1_UNLIMITED:
+            self.memory_limit = int(limit)
+
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat is not None:
+            stat = _parse_flat_keyed(cpu_stat)
+            self.cpu_periods = stat.get(b"nr_periods")
+            self.cpu_throttled_periods = stat.get(b"nr_throttled")
+            throttled_ns = stat.get(b"throttled_time")
+            if throttled_ns is not None:
+                self.cpu_throttled_time = throttled_ns / 1e9
+
+        quota = self._read("cpu.cfs_quota_us")
+        period = self._read("cpu.cfs_period_us")
+        if quota is not None and period is not None and int(quota) > 0:
+            self.cpu_quota = int(quota) / int(period)
@@ -0,0 +1,313 @@
+import collections
+import os
+import socket
+import threading
+import time
+import logging
+from typing import Optional
+from urllib.parse import urlparse
+from opentelemetry.metrics import CallbackOptions, Meter, Observation
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from middleware.export_errors import reset_rejection, was_rejected
+from middleware.persistent_queue import (
+    SIGNAL_LOGS,
+    SIGNAL_METRICS,
+    SIGNAL_SPANS,
+    replaying,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Circuit states, also the values of the `process.export.circuit.state` gauge.
+STATE_CLOSED = 0
+STATE_OPEN = 1
+STATE_HALF_OPEN = 2
+
+_STATE_NAMES = {
+    STATE_CLOSED: "closed",
+    STATE_OPEN: "open",
+    STATE_HALF_OPEN: "half_open",
+}
+
+# Seconds a connection probe waits for the target to accept.
+_PROBE_TIMEOUT = 1.0
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_circuit = None
+_circuit_lock = threading.Lock()
+
+
+def _probe_address(target: str):
+    url = urlparse(target if "://" in target else f"http://{target}")
+    return url.hostname or "localhost", url.port or _DEFAULT_PORTS.get(url.scheme, 80)
+
+
+class ExportCircuit:
+    """
+    Export health shared by the exporters of every signal.
+
+    The circuit opens after `failure_threshold` consecutive failed exports,
+    from then on exports are refused before any encoding happens. Every
+    `probe_interval` seconds one export attempt first opens a TCP connection
+    to the target: once it connects, the circuit is half open and lets
+    exports through, the first success closes it and a failure opens it
+    again.
+    """
+
+    def __init__(
+        self,
+        target: str,
+        failure_threshold: int,
+        probe_interval: float,
+        probe_timeout: float = _PROBE_TIMEOUT,
+    ):
+        self.address = _probe_address(target)
+        self.state = STATE_CLOSED
+        self.transitions = collections.Counter()
+        self.refused = collections.Counter()
+        self._failure_threshold = max(failure_threshold, 1)
+        self._probe_interval = probe_interval
+        self._probe_timeout = probe_timeout
+        self._failures = 0
+        self._next_probe = 0.0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: int):
+        """Moves to `state`, must hold the lock."""
+        _logger.debug(
+            f"Export circuit {_STATE_NAMES[self.state]} -> {_STATE_NAMES[state]}"
+        )
+        self.state = state
+        self.transitions[state] += 1
+        if state == STATE_OPEN:
+            self._next_probe = time.monotonic() + self._probe_interval
+
+    def _probe(self) -> bool:
+        try:
+            socket.create_connection(self.address, timeout=self._probe_timeout).close()
+            return True
+        except OSError as e:
+            _logger.debug(f"Export circuit probe of {self.address} failed: {e}")
+            return False
+
+    def allow(self) -> bool:
+        """Returns whether an export may go ahead, probing the target when due."""
+        if self.state != STATE_OPEN:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state != STATE_OPEN:
+                return True
+            if now < self._next_probe:
+                return False
+            # Other exporters keep being refused while this one probes.
+            self._next_probe = now + self._probe_interval
+        if not self._probe():
+            return False
+        with self._lock:
+            if self.state == STATE_OPEN:
+                self._transition(STATE_HALF_OPEN)
+        return True
+
+    def record(self, success: bool):
+        """Records the outcome of an export allowed by `allow`."""
+        if success:
+            if self.state == STATE_CLOSED and not self._failures:
+                return
+            with self._lock:
+                self._failures = 0
+                if self.state != STATE_CLOSED:
+                    self._transition(STATE_CLOSED)
+            return
+        with self._lock:
+            self._failures += 1
+            if self.state == STATE_HALF_OPEN or (
+                self.state == STATE_CLOSED and self._failures >= self._failure_threshold
+            ):
+                self._transition(STATE_OPEN)
+
+    def refuse(self, signal: str):
+        self.refused[signal] += 1
+
+    def _at_fork_reinit(self):
+        self._lock = threading.Lock()
+
+
+def get_export_circuit(options) -> Optional[ExportCircuit]:
+    """
+    Returns the export circuit of the process, None if the circuit breaker
+    is disabled. The exporters of every signal share it, a forked child
+    inherits its state.
+    """
+    global _circuit
+    if not options.export_circuit_breaker:
+        return None
+    with _circuit_lock:
+        if _circuit is None:
+            _circuit = ExportCircuit(
+                options.target,
+                options.export_circuit_failure_threshold,
+                options.export_circuit_probe_interval,
+            )
+        return _circuit
+
+
+def _reinit_after_fork():
+    global _circuit_lock
+    _circuit_lock = threading.Lock()
+    if _circuit is not None:
+        _circuit._at_fork_reinit()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+class _CircuitBreakerExporter:
+    _signal = None
+
+    def __init__(self, exporter, circuit: ExportCircuit):
+        self._exporter = exporter
+        self._circuit = circuit
+
+    def _export(self, export, data, success, failure):
+        if not self._circuit.allow():
+            # A queued batch was counted when it was first refused, not on
+            # each replay attempt.
+            if not replaying():
+                self._circuit.refuse(self._signal)
+            return failure
+        reset_rejection()
+        result = export(data)
+        # The target answered a batch it rejected, it is not down.
+        self._circuit.record(result is success or was_rejected())
+        return result
+
+
+class CircuitBreakerSpanExporter(_CircuitBreakerExporter, SpanExporter):
+    _signal = SIGNAL_SPANS
+
+    def export(self, spans):
+        return self._export(
+            self._exporter.export, spans, SpanExportResult.SUCCESS, SpanExportResult.FAILURE
+        )
+
+    def shutdown(self):
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class CircuitBreakerMetricExporter(_CircuitBreakerExporter, MetricExporter):
+    _signal = SIGNAL_METRICS
+
+    def __init__(self, exporter: MetricExporter, circuit: ExportCircuit):
+        _CircuitBreakerExporter.__init__(self, exporter, circuit)
+        MetricExporter.__init__(
+            self,
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs):
+        return self._export(
+            lambda data: self._exporter.export(data, timeout_millis=timeout_millis, **kwargs),
+            metrics_data,
+            MetricExportResult.SUCCESS,
+            MetricExportResult.FAILURE,
+        )
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        return self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class CircuitBreakerLogExporter(_CircuitBreakerExporter, LogExporter):
+    _signal = SIGNAL_LOGS
+
+    def export(self, batch):
+        return self._export(
+            self._exporter.export, batch, LogExportResult.SUCCESS, LogExportResult.FAILURE
+        )
+
+    def shutdown(self):
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+_CIRCUIT_BREAKER_EXPORTERS = {
+    SIGNAL_SPANS: CircuitBreakerSpanExporter,
+    SIGNAL_METRICS: CircuitBreakerMetricExporter,
+    SIGNAL_LOGS: CircuitBreakerLogExporter,
+}
+
+
+def circuit_breaker(exporter, signal: str, options):
+    """
+    Returns `exporter` refusing batches of `signal` while the export circuit
+    is open, or `exporter` itself if the circuit breaker is disabled.
+
+    The refused batches are dropped, or spilled by a persistent exporter
+    wrapping the returned one, without being encoded for the target.
+    """
+    circuit = get_export_circuit(options)
+    if circuit is None:
+        return exporter
+    return _CIRCUIT_BREAKER_EXPORTERS[signal](exporter, circuit)
+
+
+def _state_cb(options: CallbackOptions):
+    circuit = _circuit
+    if circuit is not None:
+        yield Observation(value=circuit.state)
+
+
+def _transitions_cb(options: CallbackOptions):
+    circuit = _circuit
+    if circuit is not None:
+        for state, count in list(circuit.transitions.items()):
+            yield Observation(value=count, attributes={"state": _STATE_NAMES[state]})
+
+
+def _refused_cb(options: CallbackOptions):
+    circuit = _circuit
+    if circuit is not None:
+        for signal, count in list(circuit.refused.items()):
+            yield Observation(value=count, attributes={"signal": signal})
+
+
+def install_circuit_metrics(meter: Meter):
+    """
+    Creates the export circuit instruments on the given meter. Batches are
+    refused while the circuit is open, so what happened during an outage is
+    exported once the circuit closes again.
+    """
+    try:
+        meter.create_observable_gauge(
+            "process.export.circuit.state",
+            unit="Count",
+            callbacks=[_state_cb],
+            description="The will show the state of the export circuit, 0 closed, 1 open and 2 half open",
+        )
+        meter.create_observable_counter(
+            "process.export.circuit.transitions.count",
+            unit="Count",
+            callbacks=[_transitions_cb],
+            description="The will show the number of times the export circuit moved to each state",
+        )
+        meter.create_observable_counter(
+            "process.export.circuit.refused.count",
+            unit="Count",
+            callbacks=[_refused_cb],
+            description="The will show the number of batches refused per signal while the export circuit was open, dropped unless spilled to the persistent export queue",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create export circuit metrics: {e}")
@@ -1,6 +1,4 @@
 import logging
-import inspect
-import traceback
 from typing import Optional, Type
 import sys
 from logging import getLogger
@@ -9,16 +7,28 @@ from typing import Optional
 import pkg_resources
 from opentelemetry.instrumentation.distro import BaseDistro
 from middleware.metrics import create_meter_provider
-from middleware.options import MWOptions, parse_bool
+from middleware.options import (
+    MWOptions,
+    parse_bool,
+    DEFAULT_EXCEPTION_DETAIL_LIMIT,
+    DEFAULT_EXCEPTION_DETAIL_WINDOW,
+)
 from middleware.resource import create_resource
 from middleware.trace import create_tracer_provider
 from middleware.log import create_logger_handler
 from middleware.profiler import collect_profiling
+from middleware.fork import register_fork_handlers
+from middleware.exception_event import (
+    ExceptionEvent,
+    extract_function_code,
+    source_cache_info,
+)
+from middleware.exception_throttle import ExceptionThrottle
 from opentelemetry import trace
 from opentelemetry.trace import Tracer, get_current_span, get_tracer, get_tracer, Status, StatusCode
 from opentelemetry.sdk.trace import Span
 import os
-import json
+import hashlib
 
 _logger = getLogger(__name__)
 
@@ -76,6 +86,8 @@ def mw_tracker_internal(
         options = MWOptions()
 
     _logger.debug(vars(options))
+    _exception_throttle.limit = options.exception_detail_limit
+    _exception_throttle.window = options.exception_detail_window
     resource = create_resource(options)
     if options.collect_traces:
         create_tracer_provider(options, resource)
@@ -86,6 +98,7 @@ def mw_tracker_internal(
         logging.getLogger().addHandler(handler)
     if options.collect_profiling:
         collect_profiling(options)    
+    register_fork_handlers(options, resource)
 
     mw_tracker_called = True
 
@@ -122,49 +135,28 @@ def record_exception(exc: Exception, span_name: Optional[str] = None) -> None:
     span.set_status(trace.Status(trace.StatusCode.ERROR, str(exc)))
     span.end()
 
-def extract_function_code(tb_frame, lineno):
-    """Extracts the full function body where the exception occurred."""
-    try:
-        # Get the source lines and the starting line number of the function
-        source_lines, start_line = inspect.getsourcelines(tb_frame)
-        end_line = start_line + len(source_lines) - 1
-
-        # If the function body is too long, limit the number of lines
-        if len(source_lines) > 20:
-            # Define the number of lines to show before and after the exception line
-            lines_before = 10
-            lines_after = 10
-
-            # Calculate the start and end indices for slicing
-            start_idx = max(0, lineno - start_line - lines_before)
-            end_idx = min(len(source_lines), lineno - start_line + lines_after)
-
-            # Extract the relevant lines
-            source_lines = source_lines[start_idx:end_idx]
-
-            # Adjust the start and end line numbers
-            start_line += start_idx
-            end_line = start_line + len(source_lines) - 1
-
-        # Convert the list of lines to a single string
-        function_code = "".join(source_lines)
-
-        return {
-            "function_code": function_code,
-            "function_start_line": start_line,
-            "function_end_line": end_line,
-        }
-
-    except Exception as e:
-        # Handle cases where the source code cannot be extracted
-        return {
-            "function_code": f"Error extracting function code: {e}",
-            "function_start_line": None,
-            "function_end_line": None,
-        }
-
 _original_record_exception = Span.record_exception
 
+_exception_throttle = ExceptionThrottle(
+    DEFAULT_EXCEPTION_DETAIL_LIMIT, DEFAULT_EXCEPTION_DETAIL_WINDOW
+)
+
+def exception_fingerprint(exc: BaseException) -> int:
+    """
+    Identifies an exception by its type and the (filename, lineno) of every
+    frame of its traceback, so the same error raised from the same stack
+    gets the same fingerprint, in every process.
+    """
+    frames = []
+    tb = exc.__traceback__
+    while tb is not None:
+        frames.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+        tb = tb.tb_next
+    digest = hashlib.blake2b(
+        repr((type(exc).__qualname__, frames)).encode(), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big")
+
 def custom_record_exception_wrapper(self: Span,
                                     exception: BaseException,
                                     attributes=None,
@@ -172,82 +164,111 @@ def custom_record_exception_wrapper(self: Span,
                                     escaped: bool = False) -> None:
     """
     Custom wrapper for Span.record_exception.
-    This calls our custom_record_exception to add extra details before delegating
-    to the original record_exception method.
+    Records each exception once per span: an exception that was already
+    recorded on the span (the same object, e.g. recorded by the application
+    and again when it escapes the span, or one with the same fingerprint and
+    message) is skipped. The recorded event carries the standard exception attributes
+    along with our extra details, so no standard event is added next to it.
+    Past `exception_detail_limit` occurrences of the same fingerprint in a
+    window, the event only carries the fingerprint and the occurrence count.
+    Unsampled spans only get that light event and are not counted.
     """
-    # Check for a recursion marker
-    if self.attributes.get("exception.is_recursion") == "true":
-        return _original_record_exception(self, exception, attributes, timestamp, escaped)
-
-    # Mark the span to prevent infinite recursion.
-    self.set_attribute("exception.is_recursion", "true")
-    
-    # Call our custom exception recording logic.
-    custom_record_exception(self, exception)
-    
-    # Optionally, call the original record_exception for default behavior.
-    return _original_record_exception(self, exception, attributes, timestamp, escaped)
-
-# Replacement of span.record_exception to include function source code
-def custom_record_exception(span: Span, exc: Exception):
-    """Custom exception recording that captures function source code."""
-    exc_type, exc_value, exc_tb = exc.__class__, str(exc), exc.__traceback__
+    if not self.is_recording():
+        return
 
-    if exc_tb is None:
-        # span.set_attribute("exception.warning", "No traceback available")
-        span.record_exception(exc)
+    # The same exception object is recognized through the ids of the spans it
+    # was recorded on, which are kept on the exception itself.
+    span_id = self.get_span_context().span_id
+    recorded_on = getattr(exception, "_mw_recorded_on", None)
+    if recorded_on is not None and span_id in recorded_on:
+        return
+    # Another object is the same exception if it was raised from the same
+    # stack with the same message, the fingerprint alone does not tell
+    # different errors raised from one line apart.
+    recorded = getattr(self, "_mw_recorded_exceptions", None)
+    if recorded is None:
+        recorded = self._mw_recorded_exceptions = set()
+    fingerprint = exception_fingerprint(exception)
+    try:
+        message = str(exception)
+    except Exception:
+        message = None
+    if (fingerprint, message) in recorded:
+        return
+    recorded.add((fingerprint, message))
+    try:
+        if recorded_on is None:
+            exception._mw_recorded_on = recorded_on = set()
+        recorded_on.add(span_id)
+    except AttributeError:
+        pass
+
+    # Spans that are recorded but not sampled (RECORD_ONLY) are never
+    # exported: they get the light event, without counting towards the
+    # throttle of the sampled ones.
+    if not self.get_span_context().trace_flags.sampled:
+        light_attributes = {"exception.fingerprint": f"{fingerprint:016x}"}
+        if attributes:
+            light_attributes.update(attributes)
+        _record_exception_occurrence(self, exception, light_attributes, timestamp, escaped)
         return
 
-    tb_details = traceback.extract_tb(exc_tb)
-    
-    if not tb_details:
-        # span.set_attribute("exception.warning", "Traceback is empty")
-        span.record_exception(exc)
+    # Past the first occurrences of the same exception in the window, only
+    # the fingerprint and the count are recorded.
+    occurrences = _exception_throttle.occurrence(fingerprint)
+    throttle_attributes = {
+        "exception.fingerprint": f"{fingerprint:016x}",
+        "exception.occurrences": occurrences,
+    }
+    if attributes:
+        throttle_attributes.update(attributes)
+    if not _exception_throttle.detailed(occurrences):
+        _record_exception_occurrence(self, exception, throttle_attributes, timestamp, escaped)
         return
 
-    stack_info = []
-    
-    for (frame, _), (filename, lineno, func_name, _) in zip(traceback.walk_tb(exc_tb), tb_details):
-        function_details = extract_function_code(frame, lineno) if frame else "Function source not found."
-  
-        stack_entry = {
-            "exception.file": filename,
-            "exception.line": lineno,
-            "exception.function_name": func_name,
-            "exception.function_body": function_details["function_code"],
-            "exception.start_line": function_details["function_start_line"],
-            "exception.end_line": function_details["function_end_line"],
-        }
-
-        # Check if the file is from site-packages
-        if "site-packages" in filename:
-            stack_entry["exception.is_file_external"] = "true"
-        else:
-            stack_entry["exception.is_file_external"] = "false"
-
-        stack_info.insert(0, stack_entry)  # Prepend instead of append
+    custom_record_exception(self, exception, throttle_attributes, timestamp, escaped)
+
+def _record_exception_occurrence(span: Span,
+                                 exc: BaseException,
+                                 attributes,
+                                 timestamp: int = None,
+                                 escaped: bool = False):
+    """Records an exception event without the stack trace and stack details."""
+    event_attributes = {
+        "exception.type": str(exc.__class__.__name__),
+        "exception.message": str(exc),
+        "exception.language": "python",
+        "exception.escaped": escaped or sys.exc_info()[1] is exc,
+    }
+    event_attributes.update(attributes)
+    span.add_event("exception", event_attributes, timestamp)
+
+# Replacement of span.record_exception to include function source code
+def custom_record_exception(span: Span,
+                            exc: Exception,
+                            attributes=None,
+                            timestamp: int = None,
+                            escaped: bool = False):
+    """
+    Custom exception recording that captures function source code.
+    Only the code objects and lines of the traceback are captured here, the
+    source code and stack details are built when the span is exported (see
+    `ExceptionEvent`).
+    """
+    if exc.__traceback__ is None:
+        # span.set_attribute("exception.warning", "No traceback available")
+        _original_record_exception(span, exc, attributes, timestamp, escaped)
+        return
 
     # Determine if the exception is escaping
     current_exc = sys.exc_info()[1]  # Get the currently active exception
-    exception_escaped = current_exc is exc  # True if it's still propagating
-  
-    # Serialize stack info as JSON string since OpenTelemetry only supports string values
-    stack_info_str = json.dumps(stack_info, indent=2)
-    
+    exception_escaped = escaped or current_exc is exc  # True if it's still propagating
+
     # Add extra details in the existing "exception" event
-    span.add_event(
-        "exception",  
-        {
-            "exception.type": str(exc_type.__name__),
-            "exception.message": exc_value,
-            "exception.language": "python",
-            "exception.stacktrace": traceback.format_exc(),
-            "exception.escaped": exception_escaped,
-            "exception.stack_details": stack_info_str,  # Attach full stacktrace details
-        }
+    span._add_event(
+        ExceptionEvent(exc, exception_escaped, attributes, span._limits, timestamp)
     )
 
-
 def mw_tracker(options: Optional[MWOptions] = None):
     """
     Configures the OpenTelemetry SDK to send telemetry to middleware.
@@ -0,0 +1,208 @@
+import asyncio
+import functools
+import logging
+import threading
+import weakref
+from typing import Optional
+from opentelemetry.metrics import CallbackOptions, Meter, Observation
+
+_logger = logging.getLogger(__name__)
+
+# Bucket boundaries (seconds) for the scheduling lag of the probe.
+_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_monitor = None
+
+
+class _LoopProbe:
+    """
+    A timer callback that re-arms itself on one event loop and measures how
+    late the loop runs it. A late probe means some callback or coroutine step
+    held the loop for at least that long.
+    """
+
+    __slots__ = ("monitor", "_loop", "attributes", "slow_callbacks", "_expected", "_handle")
+
+    def __init__(self, monitor: "EventLoopMonitor", loop: asyncio.AbstractEventLoop):
+        self.monitor = monitor
+        # The probe is the value of its loop in `EventLoopMonitor._probes`,
+        # a strong reference would keep the entry forever.
+        self._loop = weakref.ref(loop)
+        self.attributes = {"thread.name": threading.current_thread().name}
+        self.slow_callbacks = 0
+        self._expected = None
+        self._handle = None
+
+    def start(self):
+        if self._handle is None:
+            self._schedule()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        loop = self._loop()
+        if loop is None or loop.is_closed():
+            self._handle = None
+            return
+        self._expected = loop.time() + self.monitor.interval
+        self._handle = loop.call_at(self._expected, self._run)
+
+    def _run(self):
+        loop = self._loop()
+        if loop is None:
+            return
+        lag = max(0.0, loop.time() - self._expected)
+        if lag > self.monitor.slow_threshold:
+            self.slow_callbacks += 1
+        histogram = self.monitor.histogram
+        if histogram is not None:
+            histogram.record(lag, self.attributes)
+        self._schedule()
+
+
+class EventLoopMonitor:
+    """
+    Measures the health of every running asyncio event loop: the scheduling
+    lag of a periodic probe, the number of pending tasks and the number of
+    probes delayed by more than `slow_threshold` seconds (each one means a
+    callback blocked the loop for at least that long).
+
+    Loops are discovered by wrapping `asyncio.BaseEventLoop.run_forever`,
+    which `asyncio.run` and `run_until_complete` go through. Loops that do
+    not derive from it (e.g. uvloop) can be added with `monitor_event_loop`.
+    The probe is a single timer per loop, so the cost is one callback per
+    `interval` regardless of the traffic the loop serves.
+    """
+
+    def __init__(self, interval: float, slow_threshold: float):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.histogram = None
+        self._probes = weakref.WeakKeyDictionary()
+        self._probes_lock = threading.Lock()
+        self._original_run_forever = None
+
+    def monitor(self, loop: asyncio.AbstractEventLoop):
+        with self._probes_lock:
+            probe = self._probes.get(loop)
+            if probe is None:
+                probe = self._probes[loop] = _LoopProbe(self, loop)
+        probe.start()
+        return probe
+
+    def _probe_items(self):
+        with self._probes_lock:
+            return list(self._probes.items())
+
+    def unmonitor(self, loop: asyncio.AbstractEventLoop):
+        probe = self._probes.get(loop)
+        if probe is not None:
+            probe.stop()
+
+    def install(self):
+        if self._original_run_forever is not None:
+            return
+        original = asyncio.BaseEventLoop.run_forever
+        monitor = self
+
+        @functools.wraps(original)
+        def run_forever(loop, *args, **kwargs):
+            try:
+                monitor.monitor(loop)
+            except Exception as e:
+                _logger.debug(f"Failed to monitor event loop: {e}")
+            try:
+                return original(loop, *args, **kwargs)
+            finally:
+                monitor.unmonitor(loop)
+
+        self._original_run_forever = original
+        asyncio.BaseEventLoop.run_forever = run_forever
+
+        # mw_tracker may be called from inside a loop that is already running.
+        try:
+            self.monitor(asyncio.get_running_loop())
+        except RuntimeError:
+            pass
+
+    def uninstall(self):
+        if self._original_run_forever is not None:
+            asyncio.BaseEventLoop.run_forever = self._original_run_forever
+            self._original_run_forever = None
+        for _, probe in self._probe_items():
+            probe.stop()
+
+    def _tasks_cb(self, options: CallbackOptions):
+        for loop, probe in self._probe_items():
+            if loop.is_closed():
+                continue
+            try:
+                pending = len(asyncio.all_tasks(loop))
+            except Exception as e:
+                _logger.debug(f"Failed to count event loop tasks: {e}")
+                continue
+            yield Observation(value=pending, attributes=probe.attributes)
+
+    def _slow_callbacks_cb(self, options: CallbackOptions):
+        for loop, probe in self._probe_items():
+            if loop.is_closed():
+                continue
+            yield Observation(value=probe.slow_callbacks, attributes=probe.attributes)
+
+
+def install_event_loop_monitor(
+    meter: Meter, interval: float, slow_threshold: float
+) -> Optional[EventLoopMonitor]:
+    """
+    Creates the event loop instruments on the given meter and starts
+    probing running loops.
+
+    Args:
+        meter (Meter): the meter to create the instruments with
+        interval (float): seconds between two probes of the same loop
+        slow_threshold (float): lag in seconds above which a probe counts as slow
+
+    Returns:
+        EventLoopMonitor: the installed monitor, None if it could not be installed
+    """
+    global _monitor
+    if _monitor is not None:
+        return _monitor
+    monitor = EventLoopMonitor(interval, slow_threshold)
+    try:
+        monitor.histogram = meter.create_histogram(
+            "process.event_loop.lag",
+            unit="s",
+            description="The will show the scheduling lag of the asyncio event loop",
+            explicit_bucket_boundaries_advisory=_LAG_BUCKETS,
+        )
+        meter.create_observable_gauge(
+            "process.event_loop.tasks.count",
+            unit="Count",
+            callbacks=[monitor._tasks_cb],
+            description="The will show the number of pending tasks of the asyncio event loop",
+        )
+        meter.create_observable_counter(
+            "process.event_loop.slow_callbacks.count",
+            unit="Count",
+            callbacks=[monitor._slow_callbacks_cb],
+            description="The will show the number of times the asyncio event loop was blocked longer than the threshold",
+        )
+        monitor.install()
+    except Exception as e:
+        _logger.debug(f"Failed to install event loop monitor: {e}")
+        return None
+    _monitor = monitor
+    return monitor
+
+
+def monitor_event_loop(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Starts probing a loop that is not discovered automatically, e.g. a uvloop
+    loop. Does nothing unless event loop metrics are enabled.
+    """
+    if _monitor is not None:
+        loop.call_soon_threadsafe(_monitor.monitor, loop)
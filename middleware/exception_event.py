@@ -0,0 +1,236 @@
+import inspect
+import json
+import linecache
+import threading
+import logging
+from opentelemetry.sdk.trace import Event, SpanLimits
+from opentelemetry.attributes import BoundedAttributes
+from middleware.source_cache import CacheInfo, SourceSnippetCache
+
+_logger = logging.getLogger(__name__)
+
+_source_cache = SourceSnippetCache()
+
+
+def extract_function_code(tb_frame, lineno):
+    """
+    Extracts the function body where the exception occurred, from a cache
+    of the snippets already extracted for the same code object and line.
+    """
+    return _source_cache.get(tb_frame.f_code, lineno, _extract_function_code)
+
+
+def source_cache_info() -> CacheInfo:
+    """Returns the hits, misses and size of the source snippet cache."""
+    return _source_cache.cache_info()
+
+
+def _getsourcelines(code):
+    # Same as `inspect.getsourcelines` of a frame running `code`: the whole
+    # file for module level code.
+    if code.co_name == "<module>":
+        return inspect.findsource(code)[0], 0
+    return inspect.getsourcelines(code)
+
+
+def _extract_function_code(code, lineno):
+    """Extracts the full function body where the exception occurred."""
+    try:
+        # Get the source lines and the starting line number of the function
+        source_lines, start_line = _getsourcelines(code)
+        end_line = start_line + len(source_lines) - 1
+
+        # If the function body is too long, limit the number of lines
+        if len(source_lines) > 20:
+            # Define the number of lines to show before and after the exception line
+            lines_before = 10
+            lines_after = 10
+
+            # Calculate the start and end indices for slicing
+            start_idx = max(0, lineno - start_line - lines_before)
+            end_idx = min(len(source_lines), lineno - start_line + lines_after)
+
+            # Extract the relevant lines
+            source_lines = source_lines[start_idx:end_idx]
+
+            # Adjust the start and end line numbers
+            start_line += start_idx
+            end_line = start_line + len(source_lines) - 1
+
+        # Convert the list of lines to a single string
+        function_code = "".join(source_lines)
+
+        return {
+            "function_code": function_code,
+            "function_start_line": start_line,
+            "function_end_line": end_line,
+        }
+
+    except Exception as e:
+        # Handle cases where the source code cannot be extracted
+        return {
+            "function_code": f"Error extracting function code: {e}",
+            "function_start_line": None,
+            "function_end_line": None,
+        }
+
+
+def _stack_details(frames) -> str:
+    stack_info = []
+    for code, lineno in frames:
+        function_details = _source_cache.get(code, lineno, _extract_function_code)
+        filename = code.co_filename
+        stack_info.insert(
+            0,  # Prepend instead of append
+            {
+                "exception.file": filename,
+                "exception.line": lineno,
+                "exception.function_name": code.co_name,
+                "exception.function_body": function_details["function_code"],
+                "exception.start_line": function_details["function_start_line"],
+                "exception.end_line": function_details["function_end_line"],
+                # Check if the file is from site-packages
+                "exception.is_file_external": "true" if "site-packages" in filename else "false",
+            },
+        )
+    # Serialize stack info as JSON string since OpenTelemetry only supports string values
+    return json.dumps(stack_info, indent=2)
+
+
+_CAUSE_MESSAGE = (
+    "\nThe above exception was the direct cause of the following exception:\n\n"
+)
+_CONTEXT_MESSAGE = (
+    "\nDuring handling of the above exception, another exception occurred:\n\n"
+)
+
+
+def _frames(tb) -> tuple:
+    frames = []
+    while tb is not None:
+        frames.append((tb.tb_frame.f_code, tb.tb_lineno))
+        tb = tb.tb_next
+    return tuple(frames)
+
+
+def _type_name(exc: BaseException) -> str:
+    exc_type = type(exc)
+    module = exc_type.__module__
+    if module in ("__main__", "builtins"):
+        return exc_type.__qualname__
+    return f"{module}.{exc_type.__qualname__}"
+
+
+def _capture_chain(exc: BaseException) -> list:
+    """
+    Returns the exceptions `traceback.format_exception` would print for
+    `exc` as (link to the next one, type, message, frames), the outermost
+    first.
+    """
+    chain = []
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if exc.__cause__ is not None:
+            link, following = _CAUSE_MESSAGE, exc.__cause__
+        elif exc.__context__ is not None and not exc.__suppress_context__:
+            link, following = _CONTEXT_MESSAGE, exc.__context__
+        else:
+            link, following = None, None
+        try:
+            message = str(exc)
+        except Exception:
+            message = "<exception str() failed>"
+        chain.append((link, _type_name(exc), message, _frames(exc.__traceback__)))
+        exc = following
+    return chain
+
+
+def _format_chain(chain: list) -> str:
+    """Formats a chain captured by `_capture_chain` like `traceback.format_exc`."""
+    parts = []
+    for link, type_name, message, frames in reversed(chain):
+        # The link to the exception it was raised from, printed above.
+        if link:
+            parts.append(link)
+        if frames:
+            parts.append("Traceback (most recent call last):\n")
+        for code, lineno in frames:
+            parts.append(f'  File "{code.co_filename}", line {lineno}, in {code.co_name}\n')
+            line = linecache.getline(code.co_filename, lineno).strip()
+            if line:
+                parts.append(f"    {line}\n")
+        parts.append(f"{type_name}: {message}\n" if message else f"{type_name}\n")
+    return "".join(parts)
+
+
+class ExceptionEvent(Event):
+    """
+    The "exception" event recorded by `custom_record_exception`.
+
+    Recording only keeps the type, message, code objects and lines of the
+    exception and of the exceptions it was raised from, no frame or source.
+    The stack trace, the function bodies and the stack details JSON are
+    built the first time the attributes are read, which is when the span is
+    exported, so spans that are never exported do not pay for them.
+    """
+
+    def __init__(
+        self,
+        exc: BaseException,
+        escaped: bool,
+        attributes=None,
+        limits: SpanLimits = None,
+        timestamp: int = None,
+    ):
+        super().__init__("exception", None, timestamp)
+        self._type = str(exc.__class__.__name__)
+        self._message = str(exc)
+        self._escaped = escaped
+        self._extra_attributes = attributes
+        self._limits = limits or SpanLimits()
+        self._chain = _capture_chain(exc)
+        self._stacktrace = None
+        self._lock = threading.Lock()
+
+    @property
+    def stacktrace(self) -> str:
+        """The formatted stack trace, without building the other attributes."""
+        if self._stacktrace is None and self._chain is not None:
+            self._stacktrace = _format_chain(self._chain)
+        return self._stacktrace
+
+    @property
+    def attributes(self) -> BoundedAttributes:
+        if self._attributes is None:
+            with self._lock:
+                if self._attributes is None:
+                    self._attributes = self._build_attributes()
+        return self._attributes
+
+    @property
+    def dropped_attributes(self) -> int:
+        return self.attributes.dropped
+
+    def _build_attributes(self) -> BoundedAttributes:
+        event_attributes = {
+            "exception.type": self._type,
+            "exception.message": self._message,
+            "exception.language": "python",
+        }
+        try:
+            event_attributes["exception.stacktrace"] = self.stacktrace
+            event_attributes["exception.escaped"] = self._escaped
+            event_attributes["exception.stack_details"] = _stack_details(self._chain[0][3])
+        except Exception as e:
+            _logger.debug(f"Failed to build exception details: {e}")
+            event_attributes["exception.escaped"] = self._escaped
+        if self._extra_attributes:
+            event_attributes.update(self._extra_attributes)
+        # Built once, what was captured for it is not needed anymore.
+        self._chain = None
+        return BoundedAttributes(
+            self._limits.max_event_attributes,
+            event_attributes,
+            max_value_len=self._limits.max_attribute_length,
+        )
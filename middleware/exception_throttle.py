@@ -0,0 +1,46 @@
+import threading
+import time
+from middleware.fork import register_at_fork_reinit
+
+# Distinct fingerprints counted per window. Occurrences of fingerprints
+# beyond it are not counted and get the full details.
+_MAX_FINGERPRINTS = 10000
+
+
+class ExceptionThrottle:
+    """
+    Counts the occurrences of each exception fingerprint in fixed windows of
+    `window` seconds, the first `limit` occurrences of a fingerprint in a
+    window are recorded with their full details.
+    """
+
+    def __init__(self, limit: int, window: float, max_fingerprints: int = _MAX_FINGERPRINTS):
+        self.limit = limit
+        self.window = window
+        self._max_fingerprints = max_fingerprints
+        self._counts = {}
+        self._window_end = 0.0
+        self._lock = threading.Lock()
+        register_at_fork_reinit(self._at_fork_reinit)
+
+    def occurrence(self, fingerprint: int) -> int:
+        """Counts an occurrence of `fingerprint`, returns its count in the window."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._window_end:
+                self._counts.clear()
+                self._window_end = now + self.window
+            count = self._counts.get(fingerprint, 0) + 1
+            if count > 1 or len(self._counts) < self._max_fingerprints:
+                self._counts[fingerprint] = count
+            return count
+
+    def detailed(self, count: int) -> bool:
+        """Returns whether the occurrence numbered `count` gets the full details."""
+        return self.limit <= 0 or count <= self.limit
+
+    def _at_fork_reinit(self):
+        # A forked child counts its own occurrences.
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._window_end = 0.0
@@ -0,0 +1,517 @@
+"""
+Compact encoding of the telemetry handed over to the export worker (see
+`middleware.subprocess_export`).
+
+Spans, log records and metrics are flattened into tuples of builtin values
+and serialized with `marshal`, which is implemented in C and much cheaper
+than building the OTLP protobuf messages in the application process. The
+worker decodes them back into SDK objects and exports them with the
+regular OTLP exporters. Resources and instrumentation scopes are shared by
+most items of a batch, so they are encoded once per batch and referenced by
+index.
+"""
+import marshal
+from typing import Sequence, Tuple
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.sdk._logs import LogData, LogRecord
+from opentelemetry.sdk.metrics._internal.exemplar import Exemplar
+from opentelemetry.sdk.metrics._internal.point import Buckets
+from opentelemetry.sdk.metrics.export import (
+    AggregationTemporality,
+    ExponentialHistogram,
+    ExponentialHistogramDataPoint,
+    Gauge,
+    Histogram,
+    HistogramDataPoint,
+    Metric,
+    MetricsData,
+    NumberDataPoint,
+    ResourceMetrics,
+    ScopeMetrics,
+    Sum,
+)
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.sdk.util.instrumentation import InstrumentationScope
+from opentelemetry._logs import SeverityNumber
+from opentelemetry.trace import (
+    Link,
+    NonRecordingSpan,
+    SpanContext,
+    SpanKind,
+    Status,
+    StatusCode,
+    TraceFlags,
+    TraceState,
+    set_span_in_context,
+)
+
+# Version of the encoding, the worker is started from the same installation
+# as the application but a mismatch is refused rather than misread.
+VERSION = 1
+
+SIGNAL_SPANS = 1
+SIGNAL_LOGS = 2
+SIGNAL_METRICS = 3
+# Metrics already encoded as an OTLP request by the metrics aggregation.
+SIGNAL_METRICS_REQUEST = 4
+
+_PRIMITIVE_TYPES = frozenset((str, bool, int, float, bytes, type(None)))
+
+
+def _value(value):
+    """Returns `value` with anything `marshal` cannot serialize converted."""
+    value_type = type(value)
+    if value_type in _PRIMITIVE_TYPES:
+        return value
+    # marshal refuses subclasses, e.g. enums deriving from str or int.
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, (list, tuple)):
+        return [_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _value(item) for key, item in value.items()}
+    return str(value)
+
+
+def _attributes(attributes) -> dict:
+    if not attributes:
+        return {}
+    return {key: _value(value) for key, value in attributes.items()}
+
+
+class _Interner:
+    """Numbers the resources and scopes of a batch."""
+
+    __slots__ = ("resources", "scopes", "_resource_ids", "_scope_ids")
+
+    def __init__(self):
+        self.resources = []
+        self.scopes = []
+        self._resource_ids = {}
+        self._scope_ids = {}
+
+    def resource(self, resource: Resource) -> int:
+        index = self._resource_ids.get(id(resource))
+        if index is None:
+            index = self._resource_ids[id(resource)] = len(self.resources)
+            self.resources.append(
+                (_attributes(resource.attributes), resource.schema_url)
+            )
+        return index
+
+    def scope(self, scope: InstrumentationScope) -> int:
+        if scope is None:
+            return -1
+        index = self._scope_ids.get(id(scope))
+        if index is None:
+            index = self._scope_ids[id(scope)] = len(self.scopes)
+            self.scopes.append(
+                (
+                    scope.name,
+                    scope.version,
+                    scope.schema_url,
+                    _attributes(scope.attributes),
+                )
+            )
+        return index
+
+
+def _decode_resources(resources) -> list:
+    return [Resource(attributes, schema_url) for attributes, schema_url in resources]
+
+
+def _decode_scopes(scopes) -> list:
+    return [
+        InstrumentationScope(name, version, schema_url, attributes)
+        for name, version, schema_url, attributes in scopes
+    ]
+
+
+def _scope_at(scopes: list, index: int):
+    return scopes[index] if index >= 0 else None
+
+
+def _encode_span(span: ReadableSpan, interner: _Interner) -> tuple:
+    context = span.context
+    parent = span.parent
+    status = span.status
+    return (
+        span.name,
+        context.trace_id,
+        context.span_id,
+        int(context.trace_flags),
+        tuple(context.trace_state.items()),
+        (parent.span_id, parent.is_remote) if parent is not None else None,
+        interner.resource(span.resource),
+        interner.scope(span.instrumentation_scope),
+        _attributes(span.attributes),
+        tuple(
+            (event.name, event.timestamp, _attributes(event.attributes))
+            for event in span.events
+        ),
+        tuple(
+            (
+                link.context.trace_id,
+                link.context.span_id,
+                int(link.context.trace_flags),
+                tuple(link.context.trace_state.items()),
+                link.context.is_remote,
+                _attributes(link.attributes),
+            )
+            for link in span.links
+        ),
+        span.kind.value,
+        status.status_code.value,
+        status.description,
+        span.start_time,
+        span.end_time,
+    )
+
+
+def _decode_span(values: tuple, resources: list, scopes: list) -> ReadableSpan:
+    (
+        name,
+        trace_id,
+        span_id,
+        trace_flags,
+        trace_state,
+        parent,
+        resource,
+        scope,
+        attributes,
+        events,
+        links,
+        kind,
+        status_code,
+        status_description,
+        start_time,
+        end_time,
+    ) = values
+    return ReadableSpan(
+        name=name,
+        context=SpanContext(
+            trace_id,
+            span_id,
+            is_remote=False,
+            trace_flags=TraceFlags(trace_flags),
+            trace_state=TraceState(trace_state),
+        ),
+        parent=(
+            SpanContext(trace_id, parent[0], is_remote=parent[1])
+            if parent is not None
+            else None
+        ),
+        resource=resources[resource],
+        attributes=attributes,
+        events=[
+            Event(event_name, event_attributes, timestamp)
+            for event_name, timestamp, event_attributes in events
+        ],
+        links=[
+            Link(
+                SpanContext(
+                    link_trace_id,
+                    link_span_id,
+                    is_remote=is_remote,
+                    trace_flags=TraceFlags(link_flags),
+                    trace_state=TraceState(link_state),
+                ),
+                link_attributes,
+            )
+            for link_trace_id, link_span_id, link_flags, link_state, is_remote, link_attributes in links
+        ],
+        kind=SpanKind(kind),
+        status=Status(StatusCode(status_code), status_description),
+        start_time=start_time,
+        end_time=end_time,
+        instrumentation_scope=_scope_at(scopes, scope),
+    )
+
+
+def encode_spans(spans: Sequence[ReadableSpan]) -> bytes:
+    interner = _Interner()
+    encoded = [_encode_span(span, interner) for span in spans]
+    return marshal.dumps(
+        (VERSION, SIGNAL_SPANS, (interner.resources, interner.scopes, encoded))
+    )
+
+
+def _encode_log(log_data: LogData, interner: _Interner) -> tuple:
+    record = log_data.log_record
+    severity = record.severity_number
+    return (
+        record.timestamp,
+        record.observed_timestamp,
+        record.trace_id or 0,
+        record.span_id or 0,
+        int(record.trace_flags or 0),
+        record.severity_text,
+        severity.value if severity is not None else None,
+        _value(record.body),
+        interner.resource(record.resource),
+        interner.scope(log_data.instrumentation_scope),
+        _attributes(record.attributes),
+        record.event_name,
+    )
+
+
+def _decode_log(values: tuple, resources: list, scopes: list) -> LogData:
+    (
+        timestamp,
+        observed_timestamp,
+        trace_id,
+        span_id,
+        trace_flags,
+        severity_text,
+        severity_number,
+        body,
+        resource,
+        scope,
+        attributes,
+        event_name,
+    ) = values
+    span_context = SpanContext(
+        trace_id, span_id, is_remote=False, trace_flags=TraceFlags(trace_flags)
+    )
+    record = LogRecord(
+        timestamp=timestamp,
+        observed_timestamp=observed_timestamp,
+        context=set_span_in_context(NonRecordingSpan(span_context)),
+        severity_text=severity_text,
+        severity_number=(
+            SeverityNumber(severity_number) if severity_number is not None else None
+        ),
+        body=body,
+        resource=resources[resource],
+        attributes=attributes,
+        event_name=event_name,
+    )
+    return LogData(record, _scope_at(scopes, scope))
+
+
+def encode_logs(batch: Sequence[LogData]) -> bytes:
+    interner = _Interner()
+    encoded = [_encode_log(log_data, interner) for log_data in batch]
+    return marshal.dumps(
+        (VERSION, SIGNAL_LOGS, (interner.resources, interner.scopes, encoded))
+    )
+
+
+def _encode_exemplars(exemplars) -> tuple:
+    return tuple(
+        (
+            _attributes(exemplar.filtered_attributes),
+            exemplar.value,
+            exemplar.time_unix_nano,
+            exemplar.span_id,
+            exemplar.trace_id,
+        )
+        for exemplar in exemplars or ()
+    )
+
+
+def _decode_exemplars(exemplars) -> list:
+    return [Exemplar(*exemplar) for exemplar in exemplars]
+
+
+def _encode_point(point) -> tuple:
+    if isinstance(point, NumberDataPoint):
+        return (
+            _attributes(point.attributes),
+            point.start_time_unix_nano,
+            point.time_unix_nano,
+            _encode_exemplars(point.exemplars),
+            point.value,
+        )
+    if isinstance(point, HistogramDataPoint):
+        return (
+            _attributes(point.attributes),
+            point.start_time_unix_nano,
+            point.time_unix_nano,
+            _encode_exemplars(point.exemplars),
+            point.count,
+            point.sum,
+            list(point.bucket_counts),
+            list(point.explicit_bounds),
+            point.min,
+            point.max,
+        )
+    return (
+        _attributes(point.attributes),
+        point.start_time_unix_nano,
+        point.time_unix_nano,
+        _encode_exemplars(point.exemplars),
+        point.count,
+        point.sum,
+        point.scale,
+        point.zero_count,
+        (point.positive.offset, list(point.positive.bucket_counts)),
+        (point.negative.offset, list(point.negative.bucket_counts)),
+        point.flags,
+        point.min,
+        point.max,
+    )
+
+
+def _decode_point(point_type, values: tuple):
+    attributes, start_time, time, exemplars = values[:4]
+    exemplars = _decode_exemplars(exemplars)
+    if point_type is NumberDataPoint:
+        return NumberDataPoint(attributes, start_time, time, values[4], exemplars)
+    if point_type is HistogramDataPoint:
+        count, total, bucket_counts, explicit_bounds, minimum, maximum = values[4:]
+        return HistogramDataPoint(
+            attributes,
+            start_time,
+            time,
+            count,
+            total,
+            bucket_counts,
+            explicit_bounds,
+            minimum,
+            maximum,
+            exemplars,
+        )
+    count, total, scale, zero_count, positive, negative, flags, minimum, maximum = values[4:]
+    return ExponentialHistogramDataPoint(
+        attributes,
+        start_time,
+        time,
+        count,
+        total,
+        scale,
+        zero_count,
+        Buckets(*positive),
+        Buckets(*negative),
+        flags,
+        minimum,
+        maximum,
+        exemplars,
+    )
+
+
+_DATA_TYPES = (Sum, Gauge, Histogram, ExponentialHistogram)
+_POINT_TYPES = {
+    Sum: NumberDataPoint,
+    Gauge: NumberDataPoint,
+    Histogram: HistogramDataPoint,
+    ExponentialHistogram: ExponentialHistogramDataPoint,
+}
+
+
+def _encode_data(data) -> tuple:
+    data_type = type(data)
+    temporality = getattr(data, "aggregation_temporality", None)
+    return (
+        _DATA_TYPES.index(data_type),
+        [_encode_point(point) for point in data.data_points],
+        temporality.value if temporality is not None else None,
+        getattr(data, "is_monotonic", None),
+    )
+
+
+def _decode_data(values: tuple):
+    type_index, points, temporality, is_monotonic = values
+    data_type = _DATA_TYPES[type_index]
+    point_type = _POINT_TYPES[data_type]
+    data_points = [_decode_point(point_type, point) for point in points]
+    if data_type is Gauge:
+        return Gauge(data_points)
+    temporality = AggregationTemporality(temporality)
+    if data_type is Sum:
+        return Sum(data_points, temporality, is_monotonic)
+    return data_type(data_points, temporality)
+
+
+def encode_metrics(metrics_data: MetricsData) -> bytes:
+    interner = _Interner()
+    encoded = [
+        (
+            interner.resource(resource_metrics.resource),
+            resource_metrics.schema_url,
+            [
+                (
+                    interner.scope(scope_metrics.scope),
+                    scope_metrics.schema_url,
+                    [
+                        (
+                            metric.name,
+                            metric.description,
+                            metric.unit,
+                            _encode_data(metric.data),
+                        )
+                        for metric in scope_metrics.metrics
+                    ],
+                )
+                for scope_metrics in resource_metrics.scope_metrics
+            ],
+        )
+        for resource_metrics in metrics_data.resource_metrics
+    ]
+    return marshal.dumps(
+        (VERSION, SIGNAL_METRICS, (interner.resources, interner.scopes, encoded))
+    )
+
+
+def encode_metrics_request(request: ExportMetricsServiceRequest) -> bytes:
+    return marshal.dumps(
+        (VERSION, SIGNAL_METRICS_REQUEST, request.SerializeToString())
+    )
+
+
+def _decode_metrics(body: tuple) -> MetricsData:
+    resources, scopes, encoded = body
+    resources = _decode_resources(resources)
+    scopes = _decode_scopes(scopes)
+    return MetricsData(
+        [
+            ResourceMetrics(
+                resources[resource],
+                [
+                    ScopeMetrics(
+                        _scope_at(scopes, scope),
+                        [
+                            Metric(name, description, unit, _decode_data(data))
+                            for name, description, unit, data in metrics
+                        ],
+                        scope_schema_url,
+                    )
+                    for scope, scope_schema_url, metrics in scope_metrics
+                ],
+                schema_url,
+            )
+            for resource, schema_url, scope_metrics in encoded
+        ]
+    )
+
+
+def decode(payload: bytes) -> Tuple[int, object]:
+    """
+    Decodes a payload into its signal and the data to export: a list of
+    `ReadableSpan`, a list of `LogData`, a `MetricsData` or an
+    `ExportMetricsServiceRequest`.
+    """
+    version, signal, body = marshal.loads(payload)
+    if version != VERSION:
+        raise ValueError(f"unsupported export payload version {version}")
+    if signal == SIGNAL_METRICS_REQUEST:
+        return signal, ExportMetricsServiceRequest.FromString(body)
+    if signal == SIGNAL_METRICS:
+        return signal, _decode_metrics(body)
+    resources, scopes, encoded = body
+    resources = _decode_resources(resources)
+    scopes = _decode_scopes(scopes)
+    if signal == SIGNAL_SPANS:
+        return signal, [_decode_span(span, resources, scopes) for span in encoded]
+    if signal == SIGNAL_LOGS:
+        return signal, [_decode_log(log, resources, scopes) for log in encoded]
+    raise ValueError(f"unknown export payload signal {signal}")
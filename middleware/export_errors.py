@@ -0,0 +1,24 @@
+import threading
+
+# Exports run on the thread that calls the exporter, the outcome of the last
+# one is kept per thread.
+_last_export = threading.local()
+
+
+def record_rejection():
+    """
+    Called by the OTLP transports when the target rejected a batch for good
+    (e.g. HTTP 400 or 413, gRPC INVALID_ARGUMENT), as opposed to failures
+    worth retrying later (target unreachable, overloaded, timeouts).
+    """
+    _last_export.rejected = True
+
+
+def reset_rejection():
+    """Forgets the outcome of the previous export, call it before exporting."""
+    _last_export.rejected = False
+
+
+def was_rejected() -> bool:
+    """Returns whether the target rejected the batch of the last export."""
+    return getattr(_last_export, "rejected", False)
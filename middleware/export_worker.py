@@ -0,0 +1,138 @@
+"""
+Export worker started by `middleware.subprocess_export.ExportChannel`.
+
+    python -m middleware.export_worker <ring path> <ring capacity> <options>
+
+where options is a JSON object of the `WORKER_OPTIONS` of `MWOptions`.
+
+Reads the telemetry the application writes to the shared ring buffer,
+decodes it and exports it with the OTLP exporters, until the application
+closes the pipe on the worker's standard input.
+"""
+import json
+import os
+import sys
+import threading
+import logging
+from types import SimpleNamespace
+from middleware import export_codec
+from middleware.circuit_breaker import circuit_breaker
+from middleware.exporters import (
+    otlp_log_exporter,
+    otlp_metric_exporter,
+    otlp_span_exporter,
+)
+from middleware.persistent_queue import (
+    SIGNAL_LOGS,
+    SIGNAL_METRICS,
+    SIGNAL_SPANS,
+    persistent,
+)
+from middleware.subprocess_export import SharedRingBuffer
+
+_logger = logging.getLogger(__name__)
+
+# Seconds the worker sleeps when the ring is empty.
+_POLL_INTERVAL = 0.05
+
+
+class ExportWorker:
+    def __init__(self, ring: SharedRingBuffer, options):
+        self.ring = ring
+        self._exporters = {}
+        queue_dir = options.persistent_queue_dir
+        queue_size = options.persistent_queue_size
+        self._factories = {
+            export_codec.SIGNAL_SPANS: lambda: persistent(
+                circuit_breaker(otlp_span_exporter(options), SIGNAL_SPANS, options),
+                SIGNAL_SPANS,
+                queue_dir,
+                queue_size,
+            ),
+            export_codec.SIGNAL_LOGS: lambda: persistent(
+                circuit_breaker(otlp_log_exporter(options), SIGNAL_LOGS, options),
+                SIGNAL_LOGS,
+                queue_dir,
+                queue_size,
+            ),
+            export_codec.SIGNAL_METRICS: lambda: persistent(
+                circuit_breaker(otlp_metric_exporter(options), SIGNAL_METRICS, options),
+                SIGNAL_METRICS,
+                queue_dir,
+                queue_size,
+            ),
+        }
+        self._factories[export_codec.SIGNAL_METRICS_REQUEST] = self._factories[
+            export_codec.SIGNAL_METRICS
+        ]
+        self.stopping = threading.Event()
+
+    def _exporter(self, signal: int):
+        # Both metric signals share one exporter and so one channel.
+        if signal == export_codec.SIGNAL_METRICS_REQUEST:
+            signal = export_codec.SIGNAL_METRICS
+        exporter = self._exporters.get(signal)
+        if exporter is None:
+            exporter = self._exporters[signal] = self._factories[signal]()
+        return exporter
+
+    def export(self, payload: bytes):
+        try:
+            signal, data = export_codec.decode(payload)
+            self._exporter(signal).export(data)
+        except Exception as e:
+            _logger.debug(f"Failed to export telemetry from the application: {e}")
+
+    def drain(self) -> bool:
+        exported = False
+        while True:
+            payload = self.ring.get()
+            if payload is None:
+                return exported
+            exported = True
+            self.export(payload)
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.drain():
+                self.stopping.wait(_POLL_INTERVAL)
+        self.drain()
+        for exporter in self._exporters.values():
+            try:
+                exporter.shutdown()
+            except Exception as e:
+                _logger.debug(f"Failed to shut down exporter: {e}")
+
+
+def _wait_for_application(worker: ExportWorker):
+    # Returns once the application closed its end, or exited.
+    try:
+        sys.stdin.buffer.read()
+    except Exception as e:
+        _logger.debug(f"Failed to read from the application: {e}")
+    worker.stopping.set()
+
+
+def main(argv) -> int:
+    path, capacity, options = argv[:3]
+    options = SimpleNamespace(**json.loads(options))
+    ring = SharedRingBuffer(path, int(capacity))
+    # Both processes have it mapped now, the memory goes once both unmap it.
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    worker = ExportWorker(ring, options)
+    threading.Thread(
+        name="MWExportWorkerStdin",
+        target=_wait_for_application,
+        args=(worker,),
+        daemon=True,
+    ).start()
+    worker.run()
+    ring.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,362 @@
+import os
+import grpc
+import logging
+import threading
+from typing import Callable, Optional
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
+# Private to opentelemetry-exporter-otlp-proto-grpc 1.36, pinned in pyproject.toml.
+from opentelemetry.exporter.otlp.proto.grpc.exporter import _RETRYABLE_ERROR_CODES
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import (
+    ExportLogsServiceRequest,
+)
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.sdk.metrics.export import MetricExporter
+from opentelemetry.sdk._logs.export import LogExporter
+from middleware.options import (
+    MWOptions,
+    EXPORT_MODE_SUBPROCESS,
+    EXPORTER_COMPRESSION_DEFLATE,
+    EXPORTER_COMPRESSION_GZIP,
+    EXPORTER_COMPRESSION_NONE,
+    EXPORTER_PROTOCOL_HTTP_PROTOBUF,
+)
+from middleware.otlp_http import (
+    OTLPHTTPLogExporter,
+    OTLPHTTPMetricExporter,
+    OTLPHTTPSpanExporter,
+)
+from middleware.circuit_breaker import circuit_breaker
+from middleware.export_errors import record_rejection
+from middleware.fork import register_at_fork_reinit
+from middleware.persistent_queue import (
+    SIGNAL_LOGS,
+    SIGNAL_METRICS,
+    SIGNAL_SPANS,
+    persistent,
+)
+from middleware.subprocess_export import (
+    SubprocessLogExporter,
+    SubprocessMetricExporter,
+    SubprocessSpanExporter,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class _OTLPMetricExporter(OTLPMetricExporter):
+    """
+    An `OTLPMetricExporter` that also exports already encoded requests, as
+    handed over by the metrics aggregation (see `middleware.shared_metrics`)
+    or replayed from the persistent queue.
+    """
+
+    def _translate_data(self, data):
+        if isinstance(data, ExportMetricsServiceRequest):
+            return data
+        return super()._translate_data(data)
+
+
+class _OTLPSpanExporter(OTLPSpanExporter):
+    """
+    An `OTLPSpanExporter` that also exports already encoded requests, as
+    replayed from the persistent queue (see `middleware.persistent_queue`).
+    """
+
+    def _translate_data(self, data):
+        if isinstance(data, ExportTraceServiceRequest):
+            return data
+        return super()._translate_data(data)
+
+
+class _OTLPLogExporter(OTLPLogExporter):
+    """
+    An `OTLPLogExporter` that also exports already encoded requests, as
+    replayed from the persistent queue (see `middleware.persistent_queue`).
+    """
+
+    def _translate_data(self, data):
+        if isinstance(data, ExportLogsServiceRequest):
+            return data
+        return super()._translate_data(data)
+
+
+class _ForkAwareExporter:
+    """
+    Holds an exporter built by `factory` and builds a new one in the child
+    after a fork.
+
+    gRPC channels created before a fork cannot be used by the child, so
+    processes forked from a preloaded parent (gunicorn/uwsgi `--preload`)
+    get their own channel as soon as they start instead of failing their
+    first exports. The batch processors and metric readers restart their own
+    worker threads after a fork.
+    """
+
+    def __init__(self, factory: Callable):
+        self._factory = factory
+        self._exporter = factory()
+        register_at_fork_reinit(self._at_fork_reinit)
+
+    def _at_fork_reinit(self):
+        try:
+            self._exporter = self._factory()
+        except Exception as e:
+            _logger.debug(f"Failed to rebuild exporter after fork: {e}")
+
+
+class ForkAwareSpanExporter(_ForkAwareExporter, SpanExporter):
+    def export(self, spans):
+        return self._exporter.export(spans)
+
+    def shutdown(self):
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class ForkAwareMetricExporter(_ForkAwareExporter, MetricExporter):
+    def __init__(self, factory: Callable):
+        _ForkAwareExporter.__init__(self, factory)
+        MetricExporter.__init__(
+            self,
+            preferred_temporality=self._exporter._preferred_temporality,
+            preferred_aggregation=self._exporter._preferred_aggregation,
+        )
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs):
+        return self._exporter.export(
+            metrics_data, timeout_millis=timeout_millis, **kwargs
+        )
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        return self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class ForkAwareLogExporter(_ForkAwareExporter, LogExporter):
+    def export(self, batch):
+        return self._exporter.export(batch)
+
+    def shutdown(self):
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+_GRPC_COMPRESSIONS = {
+    EXPORTER_COMPRESSION_NONE: grpc.Compression.NoCompression,
+    EXPORTER_COMPRESSION_DEFLATE: grpc.Compression.Deflate,
+    EXPORTER_COMPRESSION_GZIP: grpc.Compression.Gzip,
+}
+
+
+class _ChannelLease:
+    """Stands for the shared channel in an exporter, see `_SharedGrpcChannel`."""
+
+    def __init__(self, shared: "_SharedGrpcChannel", channel: grpc.Channel):
+        self._shared = shared
+        self._channel = channel
+
+    def close(self):
+        self._shared.release(self._channel)
+
+
+class _RejectionRecordingClient:
+    """
+    Wraps the stub of an OTLP gRPC exporter to record the batches the
+    target rejected with a code the exporter does not retry, which the
+    exporter only logs.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def Export(self, *args, **kwargs):
+        try:
+            return self._client.Export(*args, **kwargs)
+        except grpc.RpcError as e:
+            if e.code() not in _RETRYABLE_ERROR_CODES:
+                record_rejection()
+            raise
+
+
+class _SharedGrpcChannel:
+    """
+    The gRPC channel every OTLP exporter of the process sends through, so
+    all signals share one HTTP/2 connection to the target.
+
+    The OTLP exporters open their own channel when they are built. The
+    first exporter's channel becomes the shared one, the channels of the
+    next ones are closed right away, before they ever connect, and their
+    stubs are bound to the shared channel. The channel is closed once every
+    exporter using it has shut down. A forked child starts over with its own
+    channel.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channel = None
+        self._pid = None
+        self._users = 0
+
+    def attach(self, exporter):
+        # Replaces the `_channel`, `_client` and `_stub` the OTLP gRPC
+        # exporters of opentelemetry-exporter-otlp-proto-grpc 1.36 (pinned in
+        # pyproject.toml) set in their constructor, check them on upgrades.
+        with self._lock:
+            if self._channel is None or self._pid != os.getpid():
+                self._channel = exporter._channel
+                self._pid = os.getpid()
+                self._users = 0
+            else:
+                exporter._channel.close()
+                exporter._client = exporter._stub(self._channel)
+            exporter._client = _RejectionRecordingClient(exporter._client)
+            self._users += 1
+            exporter._channel = _ChannelLease(self, self._channel)
+        return exporter
+
+    def release(self, channel: grpc.Channel):
+        with self._lock:
+            if channel is not self._channel:
+                return
+            self._users -= 1
+            if self._users > 0:
+                return
+            self._channel = None
+        channel.close()
+
+
+_grpc_channel = _SharedGrpcChannel()
+
+
+def _export_timeout(options) -> Optional[float]:
+    if options.bsp_export_timeout:
+        return options.bsp_export_timeout / 1000
+    return None
+
+
+def _is_http(options) -> bool:
+    return options.exporter_protocol == EXPORTER_PROTOCOL_HTTP_PROTOBUF
+
+
+def otlp_span_exporter(options) -> SpanExporter:
+    """Returns the OTLP span exporter for the protocol and compression of `options`."""
+    if _is_http(options):
+        return OTLPHTTPSpanExporter(
+            options.target,
+            compression=options.exporter_compression,
+            compression_level=options.exporter_compression_level,
+            timeout=_export_timeout(options),
+        )
+    return _grpc_channel.attach(
+        _OTLPSpanExporter(
+            endpoint=options.target,
+            compression=_GRPC_COMPRESSIONS.get(options.exporter_compression),
+            timeout=_export_timeout(options),
+        )
+    )
+
+
+def otlp_metric_exporter(options) -> MetricExporter:
+    """Returns the OTLP metric exporter for the protocol and compression of `options`."""
+    if _is_http(options):
+        return OTLPHTTPMetricExporter(
+            options.target,
+            compression=options.exporter_compression,
+            compression_level=options.exporter_compression_level,
+        )
+    return _grpc_channel.attach(
+        _OTLPMetricExporter(
+            endpoint=options.target,
+            compression=_GRPC_COMPRESSIONS.get(options.exporter_compression),
+        )
+    )
+
+
+def otlp_log_exporter(options) -> LogExporter:
+    """Returns the OTLP log exporter for the protocol and compression of `options`."""
+    if _is_http(options):
+        return OTLPHTTPLogExporter(
+            options.target,
+            compression=options.exporter_compression,
+            compression_level=options.exporter_compression_level,
+        )
+    return _grpc_channel.attach(
+        _OTLPLogExporter(
+            endpoint=options.target,
+            compression=_GRPC_COMPRESSIONS.get(options.exporter_compression),
+        )
+    )
+
+
+def create_span_exporter(options: MWOptions) -> SpanExporter:
+    """Returns the exporter used to send spans to `options.target`."""
+    if options.export_mode == EXPORT_MODE_SUBPROCESS:
+        return SubprocessSpanExporter(
+            options, lambda: _in_process_span_exporter(options)
+        )
+    return _in_process_span_exporter(options)
+
+
+def _in_process_span_exporter(options: MWOptions) -> SpanExporter:
+    return ForkAwareSpanExporter(
+        lambda: persistent(
+            circuit_breaker(otlp_span_exporter(options), SIGNAL_SPANS, options),
+            SIGNAL_SPANS,
+            options.persistent_queue_dir,
+            options.persistent_queue_size,
+        )
+    )
+
+
+def create_metric_exporter(options: MWOptions) -> MetricExporter:
+    """Returns the exporter used to send metrics to `options.target`."""
+    if options.export_mode == EXPORT_MODE_SUBPROCESS:
+        return SubprocessMetricExporter(
+            options, lambda: _in_process_metric_exporter(options)
+        )
+    return _in_process_metric_exporter(options)
+
+
+def _in_process_metric_exporter(options: MWOptions) -> MetricExporter:
+    return ForkAwareMetricExporter(
+        lambda: persistent(
+            circuit_breaker(otlp_metric_exporter(options), SIGNAL_METRICS, options),
+            SIGNAL_METRICS,
+            options.persistent_queue_dir,
+            options.persistent_queue_size,
+        )
+    )
+
+
+def create_log_exporter(options: MWOptions) -> LogExporter:
+    """Returns the exporter used to send logs to `options.target`."""
+    if options.export_mode == EXPORT_MODE_SUBPROCESS:
+        return SubprocessLogExporter(
+            options, lambda: _in_process_log_exporter(options)
+        )
+    return _in_process_log_exporter(options)
+
+
+def _in_process_log_exporter(options: MWOptions) -> LogExporter:
+    return ForkAwareLogExporter(
+        lambda: persistent(
+            circuit_breaker(otlp_log_exporter(options), SIGNAL_LOGS, options),
+            SIGNAL_LOGS,
+            options.persistent_queue_dir,
+            options.persistent_queue_size,
+        )
+    )
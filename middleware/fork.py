@@ -0,0 +1,77 @@
+import os
+import logging
+import weakref
+from typing import Callable
+from opentelemetry.sdk.resources import Resource, PROCESS_PID, PROCESS_PARENT_PID
+from opentelemetry.attributes import BoundedAttributes
+from middleware import options as mw_options
+from middleware.options import MWOptions, DEFAULT_SERVICE_NAME_PREFIX
+
+_logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "service.name"
+
+
+def register_at_fork_reinit(method: Callable[[], None]) -> None:
+    """
+    Calls the bound `method` in every child forked from this process, as long
+    as its object is alive: the registration does not keep the object alive.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+    weak_method = weakref.WeakMethod(method)
+
+    def _reinit():
+        reinit = weak_method()
+        if reinit is not None:
+            reinit()
+
+    os.register_at_fork(after_in_child=_reinit)
+
+
+def register_fork_handlers(options: MWOptions, resource: Resource) -> None:
+    """
+    Prepares the SDK configured by `mw_tracker` for prefork servers
+    (gunicorn/uwsgi with `--preload`).
+
+    The resource detected in the parent is kept by forked children, only
+    its per-process attributes are updated. Exporters rebuild their gRPC
+    channels themselves (see `middleware.exporters`) and the SDK restarts
+    the batch processor and metric reader threads.
+
+    Args:
+        options (MWOptions): the middleware options the SDK was configured with
+        resource (Resource): the resource shared by the tracer, meter and logger providers
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+    os.register_at_fork(after_in_child=lambda: _reinit_in_child(options, resource))
+
+
+def _reinit_in_child(options: MWOptions, resource: Resource) -> None:
+    try:
+        pid = os.getpid()
+        attributes = dict(resource.attributes)
+        if PROCESS_PID in attributes:
+            attributes[PROCESS_PID] = pid
+            attributes[PROCESS_PARENT_PID] = os.getppid()
+
+        # A default service name embeds the pid of the process that created
+        # the options, which is the parent for every preforked worker.
+        default_service_name = f"{DEFAULT_SERVICE_NAME_PREFIX}{pid}"
+        if options.service_name == mw_options.DEFAULT_SERVICE_NAME:
+            options.service_name = default_service_name
+            attributes[SERVICE_NAME] = default_service_name
+        mw_options.DEFAULT_SERVICE_NAME = default_service_name
+
+        # The resource object is shared by every provider, tracer and logger,
+        # so it is updated in place rather than replaced.
+        resource._attributes = BoundedAttributes(attributes=attributes)
+
+        # Imported here, the exporters import this module and are imported
+        # by `middleware.metrics`.
+        from middleware.metrics import reset_after_fork
+
+        reset_after_fork()
+    except Exception as e:
+        _logger.debug(f"Failed to reinitialize telemetry after fork: {e}")
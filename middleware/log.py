@@ -1,22 +1,39 @@
-import grpc
+import atexit
+import collections
+import copy
+import itertools
+import os
 import sys
+import threading
+import time
+import weakref
 import logging
+from typing import Optional
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import (
-    OTLPLogExporter,
-)
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+# Private to opentelemetry-sdk 1.36, pinned in pyproject.toml.
+from opentelemetry.sdk._logs._internal import _RESERVED_ATTRS
 from opentelemetry.sdk._logs.export import (
     BatchLogRecordProcessor,
     SimpleLogRecordProcessor,
     ConsoleLogExporter,
 )
-from opentelemetry._logs import set_logger_provider
+from opentelemetry._logs import NoOpLogger, get_logger, set_logger_provider
+from opentelemetry.context import attach, detach, get_current
+from opentelemetry.metrics import CallbackOptions, Meter, Observation
 from logging import LogRecord
-from middleware.options import MWOptions, log_levels
+from middleware.options import MWOptions, log_levels, LOG_DROP_NEWEST
+from middleware.exporters import create_log_exporter
 
 _logger = logging.getLogger(__name__)
 
+# Seconds the conversion thread of `AsyncMWLoggingHandler` sleeps when it
+# missed a wakeup, and waits on flush or close for the queue to drain.
+_IDLE_WAIT = 1.0
+_DRAIN_TIMEOUT = 5.0
+
+_async_handlers = weakref.WeakSet()
+
 
 def create_logger_handler(options: MWOptions, resource: Resource) -> LoggingHandler:
     """
@@ -29,10 +46,7 @@ def create_logger_handler(options: MWOptions, resource: Resource) -> LoggingHand
     Returns:
         LoggerProvider: the new logger provider
     """
-    exporter = OTLPLogExporter(
-        endpoint=options.target,
-        compression=grpc.Compression.Gzip,
-    )
+    exporter = create_log_exporter(options)
     logger_provider = LoggerProvider(resource=resource, shutdown_on_exit=True)
     logger_provider.add_log_record_processor(BatchLogRecordProcessor(exporter))
     if options.console_exporter:
@@ -53,28 +67,369 @@ def create_logger_handler(options: MWOptions, resource: Resource) -> LoggingHand
             )
         )
 
-    handler = MWLoggingHandler(
-        level=log_levels[options.log_level], logger_provider=logger_provider
-    )
+    if options.log_async:
+        handler = AsyncMWLoggingHandler(
+            level=log_levels[options.log_level],
+            logger_provider=logger_provider,
+            queue_size=options.log_queue_size,
+            drop_policy=options.log_drop_policy,
+        )
+    else:
+        handler = MWLoggingHandler(
+            level=log_levels[options.log_level], logger_provider=logger_provider
+        )
     set_logger_provider(logger_provider)
 
     return handler
 
+# Types of log attribute values exported as they are.
+_PRIMITIVE_TYPES = (bool, str, bytes, int, float)
+
+# Longest string other log attribute values are converted to, longer ones
+# are cut and end with "...".
+_MAX_STRINGIFIED_LENGTH = 4096
+
+# Distinct value types whose conversion is cached.
+_MAX_CONVERTER_TYPES = 1024
+
+# Items of large lists, tuples and dicts converted, the rest is left out
+# instead of being converted and cut.
+_MAX_CONTAINER_ITEMS = 100
+
+_PRIMITIVES = frozenset(_PRIMITIVE_TYPES)
+
+# The LogRecord fields the SDK does not export as attributes, and the
+# request converted apart (see `_request_attribute`).
+_SKIPPED_ATTRS = _RESERVED_ATTRS | {"request"}
+
+# The conversion of each value type seen, filled by `_convert_new_type`.
+_converters = {}
+
+_NO_FIELDS = {}
+
+# Fields `LogRecord.__init__` sets, the first ones in the `vars()` of every
+# record, none of them is an attribute.
+_INIT_FIELDS = len(vars(LogRecord("", logging.NOTSET, "", 0, "", None, None)))
+
+# Code attributes cached per call site, cleared when it grows past this.
+_MAX_CALL_SITES = 4096
+_call_site_attributes = {}
+
+
+def _keep(value):
+    return value
+
+
+def _to_str(value) -> str:
+    converted = str(value)
+    if len(converted) <= _MAX_STRINGIFIED_LENGTH:
+        return converted
+    return converted[:_MAX_STRINGIFIED_LENGTH] + "..."
+
+
+def _to_bounded_str(value) -> str:
+    # Converts like `str`, ending with "..." after the first items.
+    if len(value) <= _MAX_CONTAINER_ITEMS:
+        converted = str(value)
+    else:
+        if isinstance(value, dict):
+            head = dict(itertools.islice(value.items(), _MAX_CONTAINER_ITEMS))
+        else:
+            head = value[:_MAX_CONTAINER_ITEMS]
+        converted = str(head)
+        converted = f"{converted[:-1]}, ...{converted[-1]}"
+    if len(converted) <= _MAX_STRINGIFIED_LENGTH:
+        return converted
+    return converted[:_MAX_STRINGIFIED_LENGTH] + "..."
+
+
+def _convert_new_type(value):
+    """Converts a value of a type not seen yet, and caches its conversion."""
+    value_type = type(value)
+    if issubclass(value_type, _PRIMITIVE_TYPES):
+        converter = _keep
+    elif value_type in (list, tuple, dict):
+        converter = _to_bounded_str
+    else:
+        converter = _to_str
+    if len(_converters) < _MAX_CONVERTER_TYPES:
+        _converters[value_type] = converter
+    return converter(value)
+
+
+def _converted(attributes: dict) -> dict:
+    for key, value in attributes.items():
+        if type(value) not in _PRIMITIVES:
+            attributes[key] = _converters.get(type(value), _convert_new_type)(value)
+    return attributes
+
+
+def _request_attribute(value) -> str:
+    # Django and similar requests are shown as their method and path.
+    if isinstance(value, str):
+        return value
+    fields = getattr(value, "__dict__", None)
+    if fields is not None and len(fields) == 2:
+        if ("method" in fields and "path" in fields) or (
+            hasattr(value, "method") and hasattr(value, "path")
+        ):
+            return _to_str(f'{value.method} {value.path}')
+    return _to_str(value)
+
+
+class _RecordFields:
+    """
+    A LogRecord without its `extra` attributes: `vars()` is empty, so
+    `LoggingHandler._get_attributes` only builds the code and exception
+    attributes from the record fields.
+    """
+
+    __slots__ = ("_record", "pathname", "funcName", "lineno", "exc_info")
+
+    def __init__(self, record: LogRecord):
+        self._record = record
+        self.pathname = record.pathname
+        self.funcName = record.funcName
+        self.lineno = record.lineno
+        self.exc_info = record.exc_info
+
+    @property
+    def __dict__(self):
+        return _NO_FIELDS
+
+    def __getattr__(self, name):
+        return getattr(self._record, name)
+
+
+def _sdk_attributes(record: LogRecord, call_site: Optional[tuple]) -> dict:
+    """
+    Returns the attributes `LoggingHandler._get_attributes` builds from the
+    record fields. Without an exception they only depend on the call site
+    in opentelemetry-sdk 1.36, and are cached per `call_site`.
+    """
+    attributes = _converted(LoggingHandler._get_attributes(_RecordFields(record)))
+    if call_site is not None:
+        if len(_call_site_attributes) >= _MAX_CALL_SITES:
+            _call_site_attributes.clear()
+        _call_site_attributes[call_site] = attributes
+    return attributes
+
+
 class MWLoggingHandler(LoggingHandler):
     @staticmethod
     def _get_attributes(record: LogRecord):
-        attributes = LoggingHandler._get_attributes(record)
-
-        for key, value in attributes.items():
-            if key == "request":
-                if hasattr(value, "method") and hasattr(value, "path"):
-                    if len(vars(value)) == 2:
-                        attributes[key] = f'{value.method} {value.path}'
-                    else:
-                        attributes[key] = str(value)
-                else:
-                    attributes[key] = str(value)
-            elif not isinstance(value, (bool, str, bytes, int, float)):
-                attributes[key] = str(value)
-
-        return attributes
\ No newline at end of file
+        # The same attributes as `LoggingHandler._get_attributes`. The extra
+        # attributes come after the fields `LogRecord.__init__` sets, only
+        # they are looked at. Primitives, the most common, are kept after one
+        # set lookup, the others are converted as cached for their type.
+        record_attributes = vars(record)
+        keys = record_attributes
+        if type(record) is LogRecord and len(keys) >= _INIT_FIELDS:
+            keys = itertools.islice(keys, _INIT_FIELDS, None)
+        attributes = {}
+        for key in keys:
+            if key not in _SKIPPED_ATTRS:
+                value = record_attributes[key]
+                if type(value) not in _PRIMITIVES:
+                    value = _converters.get(type(value), _convert_new_type)(value)
+                attributes[key] = value
+        if "request" in record_attributes:
+            attributes["request"] = _request_attribute(record_attributes["request"])
+        if record.exc_info:
+            attributes.update(_sdk_attributes(record, None))
+        else:
+            call_site = (record.pathname, record.funcName, record.lineno)
+            sdk_attributes = _call_site_attributes.get(call_site)
+            if sdk_attributes is None:
+                sdk_attributes = _sdk_attributes(record, call_site)
+            attributes.update(sdk_attributes)
+        return attributes
+
+
+class AsyncMWLoggingHandler(MWLoggingHandler):
+    """
+    A `MWLoggingHandler` that converts and emits records on a background
+    thread.
+
+    `emit` only appends a snapshot of the record, the current context and
+    the time to a bounded queue, so logging never waits on a log record
+    processor or on I/O. When the queue is full, the oldest queued record is
+    dropped to make room, or the new record with `drop_policy="drop_newest"`,
+    and `dropped` is incremented. Appending relies on `collections.deque`
+    being thread safe and takes no lock.
+
+    Like `logging.handlers.QueueHandler.prepare`, the snapshot is taken on
+    the logging thread: the message is merged with its arguments, the
+    traceback is formatted and the attributes are converted, so the worker
+    never reads the arguments, `extra` objects or frames the application
+    keeps changing.
+    """
+
+    def __init__(
+        self,
+        level=logging.NOTSET,
+        logger_provider=None,
+        queue_size: int = 8192,
+        drop_policy: str = None,
+    ):
+        super().__init__(level=level, logger_provider=logger_provider)
+        self._queue_size = max(queue_size, 1)
+        self._drop_newest = drop_policy == LOG_DROP_NEWEST
+        self.dropped = 0
+        self._init_queue()
+        _async_handlers.add(self)
+        weak_self = weakref.ref(self)
+
+        def _call(method):
+            def _handler():
+                handler = weak_self()
+                if handler is not None:
+                    getattr(handler, method)()
+
+            return _handler
+
+        # Registered after the logger provider, so it runs before the
+        # provider shuts down.
+        atexit.register(_call("_close_at_exit"))
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_call("_init_queue"))
+
+    def _init_queue(self):
+        # Also run in a forked child, the worker thread is the parent's.
+        self._queue = collections.deque(maxlen=self._queue_size)
+        self._wakeup = threading.Event()
+        self._idle = False
+        self._busy = False
+        self._closed = False
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._dropped_lock = threading.Lock()
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None and not self._closed:
+                self._worker = threading.Thread(
+                    name="MWLogHandler", target=self._run, daemon=True
+                )
+                self._worker.start()
+
+    def emit(self, record: LogRecord) -> None:
+        if self._worker is None:
+            self._start_worker()
+        queue = self._queue
+        if len(queue) >= self._queue_size:
+            with self._dropped_lock:
+                self.dropped += 1
+            if self._drop_newest:
+                return
+        try:
+            prepared = self._prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        queue.append((prepared, get_current(), time.time_ns()))
+        if self._idle:
+            self._wakeup.set()
+
+    def _prepare(self, record: LogRecord) -> LogRecord:
+        """Returns a copy of `record` that holds no reference to application objects."""
+        prepared = copy.copy(record)
+        prepared._mw_attributes = MWLoggingHandler._get_attributes(record)
+        msg = record.msg
+        if record.args or isinstance(msg, str):
+            msg = record.getMessage()
+        elif isinstance(msg, (dict, list)):
+            # Structured bodies are exported as they are, see `_translate`.
+            msg = copy.copy(msg)
+        elif msg is not None and not isinstance(msg, _PRIMITIVE_TYPES):
+            msg = str(msg)
+        prepared.msg = msg
+        prepared.args = None
+        if record.exc_info and self.formatter and not record.exc_text:
+            prepared.exc_text = self.formatter.formatException(record.exc_info)
+        prepared.exc_info = None
+        return prepared
+
+    @staticmethod
+    def _get_attributes(record: LogRecord):
+        # Converted by `_prepare` on the logging thread.
+        return record._mw_attributes
+
+    def _run(self):
+        queue = self._queue
+        while True:
+            self._busy = True
+            while queue:
+                self._export(*queue.popleft())
+            self._busy = False
+            if self._closed:
+                return
+            self._idle = True
+            # A record appended right before `_idle` was set waits for the
+            # timeout at most.
+            if not queue:
+                self._wakeup.wait(_IDLE_WAIT)
+            self._wakeup.clear()
+            self._idle = False
+
+    def _export(self, record: LogRecord, context, observed_timestamp: int):
+        try:
+            logger = get_logger(record.name, logger_provider=self._logger_provider)
+            if isinstance(logger, NoOpLogger):
+                return
+            # Translated in the context of the logging call, for its trace
+            # and span ids.
+            token = attach(context)
+            try:
+                log_record = self._translate(record)
+            finally:
+                detach(token)
+            log_record.observed_timestamp = observed_timestamp
+            logger.emit(log_record)
+        except Exception:
+            self.handleError(record)
+
+    def _drain(self, timeout: float = _DRAIN_TIMEOUT):
+        """Waits until the worker converted every queued record."""
+        if self._worker is None or self._worker is threading.current_thread():
+            return
+        deadline = time.time() + timeout
+        self._wakeup.set()
+        while (self._queue or self._busy) and self._worker.is_alive():
+            if time.time() > deadline:
+                return
+            time.sleep(0.01)
+
+    def flush(self) -> None:
+        self._drain()
+        super().flush()
+
+    def close(self) -> None:
+        self._drain()
+        self._closed = True
+        self._wakeup.set()
+        super().close()
+
+    def _close_at_exit(self):
+        if not self._closed:
+            self._drain()
+            self._closed = True
+            self._wakeup.set()
+
+
+def _dropped_cb(options: CallbackOptions):
+    dropped = sum(handler.dropped for handler in list(_async_handlers))
+    yield Observation(value=dropped)
+
+
+def install_log_handler_metrics(meter: Meter):
+    """Creates the instruments of the `AsyncMWLoggingHandler` on the given meter."""
+    try:
+        meter.create_observable_counter(
+            "process.log.dropped.count",
+            unit="Count",
+            callbacks=[_dropped_cb],
+            description="The will show the number of log records dropped because the log handler queue was full",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create log dropped.count counter: {e}")
@@ -1,24 +1,33 @@
 import psutil
 import os
 import threading
+import time
 import gc
 import functools
+import collections
 from typing import Generator
-import grpc
 import sys
 import logging
 from sys import getswitchinterval
 from typing import NamedTuple
 from opentelemetry.metrics import CallbackOptions, Observation, set_meter_provider
-import grpc
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.metrics import MeterProvider, Meter
 from opentelemetry.sdk.metrics.export import (
     PeriodicExportingMetricReader,
     ConsoleMetricExporter,
 )
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from middleware.options import MWOptions
+from middleware.options import MWOptions, METRICS_BACKEND_PROCFS, EXPORT_MODE_SUBPROCESS
+from middleware.exporters import create_metric_exporter
+from middleware.procfs import ProcfsReader
+from middleware.event_loop import install_event_loop_monitor
+from middleware.cgroup import CgroupReader, PSI_RESOURCES
+from middleware.allocations import install_allocation_sampler
+from middleware.shared_metrics import install_shared_metrics, collects_host_metrics
+from middleware.circuit_breaker import install_circuit_metrics
+from middleware.log import install_log_handler_metrics
+from middleware.subprocess_export import install_export_channel_metrics
+from middleware import allocations, shared_metrics
 
 _logger = logging.getLogger(__name__)
 
@@ -35,10 +44,9 @@ def create_meter_provider(options: MWOptions, resource: Resource):
         MeterProvider: the new meter provider
     """
 
-    exporter = OTLPMetricExporter(
-        endpoint=options.target,
-        compression=grpc.Compression.Gzip,
-    )
+    exporter = create_metric_exporter(options)
+    if options.metrics_aggregation:
+        exporter = install_shared_metrics(exporter, options)
     readers = [PeriodicExportingMetricReader(exporter)]
     if options.console_exporter:
         output = sys.stdout
@@ -59,8 +67,37 @@ def create_meter_provider(options: MWOptions, resource: Resource):
 
     provider = MeterProvider(metric_readers=readers, resource=resource)
 
+    _process_snapshot.set_backend(options.metrics_backend)
+    _process_snapshot.set_intervals(
+        fast=options.metrics_fast_interval,
+        normal=options.metrics_normal_interval,
+        slow=options.metrics_slow_interval,
+    )
     meter = provider.get_meter("sdk_meter_provider")
     _generate_metrics(meter)
+    if options.collect_container_metrics and _process_snapshot.enable_cgroup():
+        _generate_container_metrics(meter)
+    if options.collect_allocations:
+        install_allocation_sampler(
+            meter,
+            interval=options.allocation_sample_interval,
+            top_n=options.allocation_top_n,
+            frame_depth=options.allocation_frame_depth,
+            overhead_budget=options.allocation_overhead_budget,
+        )
+    if options.collect_event_loop_metrics:
+        install_event_loop_monitor(
+            meter,
+            interval=options.event_loop_probe_interval / 1000,
+            slow_threshold=options.event_loop_slow_threshold / 1000,
+        )
+    # With the subprocess export mode the circuit is in the export helper.
+    if options.export_circuit_breaker and options.export_mode != EXPORT_MODE_SUBPROCESS:
+        install_circuit_metrics(meter)
+    if options.export_mode == EXPORT_MODE_SUBPROCESS:
+        install_export_channel_metrics(meter)
+    if options.collect_logs and options.log_async:
+        install_log_handler_metrics(meter)
 
     set_meter_provider(meter_provider=provider)
 
@@ -221,6 +258,35 @@ def _generate_metrics(meter: Meter):
     except Exception as e:
         _logger.debug(f"Failed to create gc.count gauge: {e}")
 
+    try:
+        _gc_monitor.histogram = meter.create_histogram(
+            "process.gc.pause.duration",
+            unit="s",
+            description="The will show the duration of each gc collection per generation",
+            explicit_bucket_boundaries_advisory=_GC_PAUSE_BUCKETS,
+        )
+        meter.create_observable_counter(
+            "process.gc.collections.count",
+            unit="Count",
+            callbacks=[_gc_collections_cb],
+            description="The will show the number of gc collections per generation",
+        )
+        meter.create_observable_counter(
+            "process.gc.collected.count",
+            unit="Count",
+            callbacks=[_gc_collected_cb],
+            description="The will show the number of objects collected by gc per generation",
+        )
+        meter.create_observable_counter(
+            "process.gc.uncollectable.count",
+            unit="Count",
+            callbacks=[_gc_uncollectable_cb],
+            description="The will show the number of uncollectable objects found by gc per generation",
+        )
+        _gc_monitor.install()
+    except Exception as e:
+        _logger.debug(f"Failed to create gc pause metrics: {e}")
+
     try:
         meter.create_observable_gauge(
             "process.context_switches.count",
@@ -251,6 +317,77 @@ def _generate_metrics(meter: Meter):
     except Exception as e:
         _logger.debug(f"Failed to create disk_usage.bytes gauge: {e}")
 
+def _generate_container_metrics(meter: Meter):
+    try:
+        meter.create_observable_gauge(
+            "container.memory.bytes",
+            unit="Bytes",
+            callbacks=[_container_memory_cb],
+            description="The will show the memory usage and limit of the container cgroup",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container memory.bytes gauge: {e}")
+
+    try:
+        meter.create_observable_gauge(
+            "container.memory_usage.percentage",
+            unit="Percent",
+            callbacks=[_container_memory_usage_cb],
+            description="The will show the memory usage of the container against its limit",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container memory_usage.percentage gauge: {e}")
+
+    try:
+        meter.create_observable_counter(
+            "container.cpu.periods.count",
+            unit="Count",
+            callbacks=[_container_cpu_periods_cb],
+            description="The will show the elapsed and throttled cpu enforcement periods of the container",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container cpu.periods.count counter: {e}")
+
+    try:
+        meter.create_observable_counter(
+            "container.cpu.throttled.time",
+            unit="s",
+            callbacks=[_container_cpu_throttled_time_cb],
+            description="The will show the total time the container was cpu throttled",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container cpu.throttled.time counter: {e}")
+
+    try:
+        meter.create_observable_gauge(
+            "container.cpu.quota",
+            unit="Count",
+            callbacks=[_container_cpu_quota_cb],
+            description="The will show the cpu quota of the container in cores",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container cpu.quota gauge: {e}")
+
+    try:
+        meter.create_observable_gauge(
+            "container.pressure.percentage",
+            unit="Percent",
+            callbacks=[_container_pressure_cb],
+            description="The will show the share of time tasks were stalled on cpu, memory or io",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container pressure.percentage gauge: {e}")
+
+    try:
+        meter.create_observable_counter(
+            "container.pressure.stall.time",
+            unit="s",
+            callbacks=[_container_pressure_stall_cb],
+            description="The will show the total time tasks were stalled on cpu, memory or io",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create container pressure.stall.time counter: {e}")
+
 # Decorator to catch exceptions in case yeilding fails
 def safe_observation(func):
     @functools.wraps(func)
@@ -261,138 +398,534 @@ def safe_observation(func):
             _logger.debug(f"Failed to collect observation in {func.__name__}: {e}")
     return wrapper
 
+
+# A snapshot younger than this is served as-is. Every callback of a single
+# collection cycle runs well within this window, so the process is read
+# once per export no matter how many instruments observe it.
+_SNAPSHOT_MAX_AGE = 1.0
+
+# Collection tiers. Fast values come from the interpreter itself, normal
+# values from a single `Process.oneshot()` read and slow values from calls
+# that walk every fd of the process or stat the filesystem.
+TIER_FAST = "fast"
+TIER_NORMAL = "normal"
+TIER_SLOW = "slow"
+
+
+def _read(func, default=None):
+    try:
+        return func()
+    except Exception as e:
+        _logger.debug(f"Failed to read {getattr(func, '__name__', func)}: {e}")
+        return default
+
+
+class ProcessSnapshot:
+    """
+    Reads the state of the current process and serves it to every observable
+    instrument created by `_generate_metrics`.
+
+    Values are grouped in fast, normal and slow tiers, each refreshed at most
+    once per its own interval (and never more than once per collection cycle).
+    Between refreshes callbacks observe the last cached value, which keeps
+    expensive reads such as `Process.connections()` off most export ticks.
+
+    A single `psutil.Process` handle is kept for the lifetime of the process
+    (it is recreated when the pid changes, e.g. after a fork) and the normal
+    tier is read inside `Process.oneshot()` so shared `/proc` files are
+    parsed once. On Linux the normal tier can instead be read directly from
+    `/proc/self` by a `ProcfsReader` (see `set_backend`). Values that cannot
+    be read on the current platform are left as `None`.
+    """
+
+    def __init__(self, max_age: float = _SNAPSHOT_MAX_AGE):
+        self.max_age = max_age
+        self.intervals = {TIER_FAST: 0, TIER_NORMAL: 0, TIER_SLOW: 0}
+        self._lock = threading.Lock()
+        self._process = None
+        self._pid = None
+        self._procfs = None
+        self.cgroup = None
+        self._taken_at = {TIER_FAST: None, TIER_NORMAL: None, TIER_SLOW: None}
+        self._refreshers = {
+            TIER_FAST: self._refresh_fast,
+            TIER_NORMAL: self._refresh_normal,
+            TIER_SLOW: self._refresh_slow,
+        }
+        self._clear_fast()
+        self._clear_normal()
+        self._clear_slow()
+
+    def reset(self):
+        """Forgets the cached process handle and values, e.g. after a fork."""
+        with self._lock:
+            self._process = None
+            self._pid = None
+            self._taken_at = {tier: None for tier in self._taken_at}
+            self._clear_fast()
+            self._clear_normal()
+            self._clear_slow()
+
+    def set_intervals(self, fast: float = 0, normal: float = 0, slow: float = 0):
+        """Sets the minimum number of seconds between refreshes of each tier."""
+        self.intervals = {TIER_FAST: fast, TIER_NORMAL: normal, TIER_SLOW: slow}
+
+    def set_backend(self, backend: str):
+        """
+        Selects how the normal tier is read: `procfs` reads `/proc/self`
+        directly and falls back to psutil when that is not possible, any
+        other value uses psutil.
+        """
+        with self._lock:
+            if self._procfs is not None:
+                self._procfs.close()
+                self._procfs = None
+            if backend == METRICS_BACKEND_PROCFS:
+                try:
+                    self._procfs = ProcfsReader()
+                except Exception as e:
+                    _logger.debug(f"procfs metrics backend unavailable, using psutil: {e}")
+
+    def enable_cgroup(self) -> bool:
+        """Starts reading the cgroup of the process with the normal tier."""
+        with self._lock:
+            if self.cgroup is None:
+                try:
+                    self.cgroup = CgroupReader()
+                except Exception as e:
+                    _logger.debug(f"cgroup metrics unavailable: {e}")
+            return self.cgroup is not None
+
+    def _clear_fast(self):
+        self.thread_count = None
+        self.gc_counts = None
+        self.switch_interval = None
+
+    def _clear_normal(self):
+        self.cpu_percent = None
+        self.memory_percent = None
+        self.cpu_user = None
+        self.cpu_system = None
+        self.cpu_children_user = None
+        self.cpu_children_system = None
+        self.cpu_iowait = None
+        self.memory_rss = None
+        self.memory_vms = None
+        self.memory_shared = None
+        self.memory_text = None
+        self.memory_data = None
+        self.num_threads = None
+        self.num_fds = None
+        self.ctx_voluntary = None
+        self.ctx_involuntary = None
+        self.io_read_bytes = None
+        self.io_write_bytes = None
+        self.cpu_affinity = None
+        self.create_time = None
+
+    def _clear_slow(self):
+        self.num_connections = None
+        self.num_open_files = None
+        self.disk_usage = None
+
+    def get(self, tier: str = TIER_NORMAL) -> "ProcessSnapshot":
+        """Returns the snapshot, refreshing the given tier first if it is stale."""
+        now = time.monotonic()
+        max_age = max(self.max_age, self.intervals[tier])
+        with self._lock:
+            taken_at = self._taken_at[tier]
+            if taken_at is None or now - taken_at >= max_age:
+                self._refreshers[tier]()
+                self._taken_at[tier] = now
+        return self
+
+    def _handle(self) -> psutil.Process:
+        pid = os.getpid()
+        if self._process is None or self._pid != pid:
+            self._process = psutil.Process(pid)
+            self._pid = pid
+        return self._process
+
+    def _refresh_fast(self):
+        self.thread_count = threading.active_count()
+        self.gc_counts = gc.get_count()
+        self.switch_interval = getswitchinterval()
+
+    def _refresh_normal(self):
+        self._clear_normal()
+        if self.cgroup is not None:
+            try:
+                self.cgroup.refresh()
+            except Exception as e:
+                _logger.debug(f"Failed to read cgroup metrics: {e}")
+        if self._procfs is not None:
+            try:
+                self._procfs.read(self)
+                return
+            except Exception as e:
+                _logger.debug(f"Failed to read procfs metrics, using psutil: {e}")
+                self._procfs.close()
+                self._procfs = None
+                self._clear_normal()
+        process = _read(self._handle)
+        if process is not None:
+            with process.oneshot():
+                self._read_process(process)
+
+    def _refresh_slow(self):
+        self._clear_slow()
+        process = _read(self._handle)
+        if process is not None:
+            connections = _read(process.connections)
+            if connections is not None:
+                self.num_connections = len(connections)
+
+            open_files = _read(process.open_files)
+            if open_files is not None:
+                self.num_open_files = len(open_files)
+        # Disk usage is the same for every worker of the host, only the
+        # process exporting host metrics reads it.
+        if collects_host_metrics():
+            self.disk_usage = _read(_disk_usage)
+
+    def _read_process(self, process: psutil.Process):
+        self.cpu_percent = _read(process.cpu_percent)
+        self.memory_percent = _read(process.memory_percent)
+
+        cpu_times = _read(process.cpu_times)
+        if cpu_times is not None:
+            self.cpu_user = cpu_times.user
+            self.cpu_system = cpu_times.system
+            self.cpu_children_user = cpu_times.children_user
+            self.cpu_children_system = cpu_times.children_system
+            self.cpu_iowait = (
+                getattr(cpu_times, "iowait", None) if not psutil.WINDOWS else 0
+            )
+
+        memory_info = _read(process.memory_info)
+        if memory_info is not None:
+            self.memory_rss = memory_info.rss
+            self.memory_vms = memory_info.vms
+            if psutil.WINDOWS:
+                self.memory_shared = self.memory_text = self.memory_data = 0
+            else:
+                self.memory_shared = getattr(memory_info, "shared", None)
+                self.memory_text = getattr(memory_info, "text", None)
+                self.memory_data = getattr(memory_info, "data", None)
+
+        self.num_threads = _read(process.num_threads)
+        self.num_fds = _read(process.num_fds) if not psutil.WINDOWS else 0
+
+        ctx_switches = _read(process.num_ctx_switches)
+        if ctx_switches is not None:
+            self.ctx_voluntary = ctx_switches.voluntary
+            self.ctx_involuntary = ctx_switches.involuntary
+
+        io_counters = _read(process.io_counters)
+        if io_counters is not None:
+            self.io_read_bytes = io_counters.read_bytes
+            self.io_write_bytes = io_counters.write_bytes
+
+        cpu_affinity = _read(process.cpu_affinity)
+        if cpu_affinity is not None:
+            self.cpu_affinity = len(cpu_affinity)
+
+        self.create_time = _read(process.create_time)
+
+
+_process_snapshot = ProcessSnapshot()
+
+
+def reset_after_fork():
+    """
+    Drops the process state inherited from the parent so a forked child
+    reports its own values from its first export.
+    """
+    _process_snapshot.reset()
+    _gc_monitor.reset()
+    if allocations._sampler is not None:
+        allocations._sampler.reset()
+    if shared_metrics._segment is not None:
+        shared_metrics._segment.claim()
+
+
+# Bucket boundaries (seconds) for gc pauses, which range from a few
+# microseconds for gen0 to hundreds of milliseconds for a large gen2.
+_GC_PAUSE_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Upper bound of pauses buffered between two exports. Older pauses are
+# dropped first if a process collects more often than this per interval.
+_GC_MAX_PENDING_PAUSES = 10000
+
+_GC_GENERATION_ATTRIBUTES = ({"type": "gc0"}, {"type": "gc1"}, {"type": "gc2"})
+
+
+class GCMonitor:
+    """
+    Times every garbage collection through `gc.callbacks` and keeps
+    cumulative per-generation collection, collected and uncollectable counts.
+
+    The gc callback must not record into the histogram directly: a collection
+    can start while the same thread holds a lock inside the metrics SDK,
+    which would deadlock. Pauses are buffered in a bounded deque instead and
+    recorded into `histogram` when the metrics are collected.
+    """
+
+    def __init__(self, max_pending: int = _GC_MAX_PENDING_PAUSES):
+        self.histogram = None
+        self.collections = [0, 0, 0]
+        self.collected = [0, 0, 0]
+        self.uncollectable = [0, 0, 0]
+        self._pending = collections.deque(maxlen=max_pending)
+        self._started_at = None
+
+    def reset(self):
+        self.collections = [0, 0, 0]
+        self.collected = [0, 0, 0]
+        self.uncollectable = [0, 0, 0]
+        self._pending.clear()
+        self._started_at = None
+
+    def install(self):
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def uninstall(self):
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def _callback(self, phase: str, info: dict):
+        if phase == "start":
+            self._started_at = time.perf_counter()
+            return
+        generation = info["generation"]
+        if self._started_at is not None:
+            self._pending.append((generation, time.perf_counter() - self._started_at))
+            self._started_at = None
+        self.collections[generation] += 1
+        self.collected[generation] += info["collected"]
+        self.uncollectable[generation] += info["uncollectable"]
+
+    def drain(self):
+        """Records the pauses buffered since the last call into the histogram."""
+        histogram = self.histogram
+        pending = self._pending
+        while pending:
+            generation, duration = pending.popleft()
+            if histogram is not None:
+                histogram.record(duration, _GC_GENERATION_ATTRIBUTES[generation])
+
+
+_gc_monitor = GCMonitor()
+
+
+def _observe(value, attributes=None):
+    if value is not None:
+        yield Observation(value=value, attributes=attributes)
+
+
+def _pressure_attributes():
+    attributes = {}
+    for resource in PSI_RESOURCES:
+        for kind in ("some", "full"):
+            for window in ("avg10", "avg60"):
+                attributes[resource, kind, window] = {
+                    "resource": resource,
+                    "type": kind,
+                    "window": window,
+                }
+    return attributes
+
+
+_PRESSURE_ATTRIBUTES = _pressure_attributes()
+
+
+@safe_observation
+def _container_memory_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    cgroup = _process_snapshot.get().cgroup
+    yield from _observe(cgroup.memory_usage, {"type": "usage"})
+    yield from _observe(cgroup.memory_limit, {"type": "limit"})
+
+@safe_observation
+def _container_memory_usage_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    cgroup = _process_snapshot.get().cgroup
+    if cgroup.memory_usage is not None and cgroup.memory_limit:
+        yield Observation(value=cgroup.memory_usage / cgroup.memory_limit * 100)
+
+@safe_observation
+def _container_cpu_periods_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    cgroup = _process_snapshot.get().cgroup
+    yield from _observe(cgroup.cpu_periods, {"type": "total"})
+    yield from _observe(cgroup.cpu_throttled_periods, {"type": "throttled"})
+
+@safe_observation
+def _container_cpu_throttled_time_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    yield from _observe(_process_snapshot.get().cgroup.cpu_throttled_time)
+
+@safe_observation
+def _container_cpu_quota_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    yield from _observe(_process_snapshot.get().cgroup.cpu_quota)
+
+@safe_observation
+def _container_pressure_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    for resource, kinds in _process_snapshot.get().cgroup.pressure.items():
+        for kind, values in kinds.items():
+            for window in ("avg10", "avg60"):
+                attributes = _PRESSURE_ATTRIBUTES.get((resource, kind, window))
+                if attributes is not None and window in values:
+                    yield Observation(value=values[window], attributes=attributes)
+
+@safe_observation
+def _container_pressure_stall_cb(options: CallbackOptions):
+    if not collects_host_metrics():
+        return
+    for resource, kinds in _process_snapshot.get().cgroup.pressure.items():
+        for kind, values in kinds.items():
+            # PSI totals are cumulative microseconds.
+            if "total" in values:
+                yield Observation(
+                    value=values["total"] / 1e6,
+                    attributes={"resource": resource, "type": kind},
+                )
+
 @safe_observation
 def _cpu_usage_cb(options: CallbackOptions):
-    yield Observation(value=psutil.Process(os.getpid()).cpu_percent())
+    yield from _observe(_process_snapshot.get().cpu_percent)
 
 @safe_observation
 def _ram_usage_cb(options: CallbackOptions):
-    yield Observation(value=psutil.Process(os.getpid()).memory_percent())
+    yield from _observe(_process_snapshot.get().memory_percent)
 
 @safe_observation
 def _cpu_time_callback(options: CallbackOptions):
-    cpu_times = psutil.Process(os.getpid()).cpu_times()
-    yield Observation(value=cpu_times.user, attributes={"state": "user"})
-    yield Observation(value=cpu_times.system, attributes={"state": "system"})
-    yield Observation(
-        value=cpu_times.children_user, attributes={"state": "children_user"}
-    )
-    yield Observation(
-        value=cpu_times.children_system, attributes={"state": "children_system"}
-    )
-
-    iowait_value = cpu_times.iowait if not psutil.WINDOWS else 0
-    yield Observation(value=iowait_value, attributes={"state": "iowait"})
+    snapshot = _process_snapshot.get()
+    yield from _observe(snapshot.cpu_user, {"state": "user"})
+    yield from _observe(snapshot.cpu_system, {"state": "system"})
+    yield from _observe(snapshot.cpu_children_user, {"state": "children_user"})
+    yield from _observe(snapshot.cpu_children_system, {"state": "children_system"})
+    yield from _observe(snapshot.cpu_iowait, {"state": "iowait"})
 
 @safe_observation
 def _memory_rss_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).memory_info().rss, attributes={"type": "rss"}
-    )
+    yield from _observe(_process_snapshot.get().memory_rss, {"type": "rss"})
 
 @safe_observation
 def _memory_vms_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).memory_info().vms, attributes={"type": "vms"}
-    )
+    yield from _observe(_process_snapshot.get().memory_vms, {"type": "vms"})
 
 @safe_observation
 def _memory_shared_cb(options: CallbackOptions):
-    shared_value = (
-        psutil.Process(os.getpid()).memory_info().shared if not psutil.WINDOWS else 0
-    )
-    yield Observation(value=shared_value, attributes={"type": "shared"})
+    yield from _observe(_process_snapshot.get().memory_shared, {"type": "shared"})
 
 @safe_observation
 def _memory_text_cb(options: CallbackOptions):
-    text_value = (
-        psutil.Process(os.getpid()).memory_info().text if not psutil.WINDOWS else 0
-    )
-    yield Observation(value=text_value, attributes={"type": "text"})
+    yield from _observe(_process_snapshot.get().memory_text, {"type": "text"})
 
 @safe_observation
 def _memory_data_cb(options: CallbackOptions):
-    data_value = (
-        psutil.Process(os.getpid()).memory_info().data if not psutil.WINDOWS else 0
-    )
-    yield Observation(value=data_value, attributes={"type": "data"})
+    yield from _observe(_process_snapshot.get().memory_data, {"type": "data"})
 
 @safe_observation
 def _num_threads_cb(options: CallbackOptions):
-    yield Observation(value=psutil.Process(os.getpid()).num_threads())
+    yield from _observe(_process_snapshot.get().num_threads)
 
 @safe_observation
 def _num_fds_cb(options: CallbackOptions):
-    num_fds_value = psutil.Process(os.getpid()).num_fds() if not psutil.WINDOWS else 0
-    yield Observation(value=num_fds_value)
+    yield from _observe(_process_snapshot.get().num_fds)
 
 @safe_observation
 def _num_vctx_switches_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).num_ctx_switches().voluntary,
-        attributes={"type": "voluntary"},
-    )
+    yield from _observe(_process_snapshot.get().ctx_voluntary, {"type": "voluntary"})
 
 @safe_observation
 def _num_ivctx_switches_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).num_ctx_switches().involuntary,
-        attributes={"type": "involuntary"},
+    yield from _observe(
+        _process_snapshot.get().ctx_involuntary, {"type": "involuntary"}
     )
 
 @safe_observation
 def _num_connections_cb(options: CallbackOptions):
-    yield Observation(value=len(psutil.Process(os.getpid()).connections()))
+    yield from _observe(_process_snapshot.get(TIER_SLOW).num_connections)
 
 @safe_observation
 def _io_read_bytes_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).io_counters().read_bytes,
-        attributes={"direction": "read"},
-    )
+    yield from _observe(_process_snapshot.get().io_read_bytes, {"direction": "read"})
 
 @safe_observation
 def _io_write_bytes_cb(options: CallbackOptions):
-    yield Observation(
-        value=psutil.Process(os.getpid()).io_counters().write_bytes,
-        attributes={"direction": "write"},
+    yield from _observe(
+        _process_snapshot.get().io_write_bytes, {"direction": "write"}
     )
 
 @safe_observation
 def _cpu_affinity_cb(options: CallbackOptions):
-    yield Observation(value=len(psutil.Process(os.getpid()).cpu_affinity()))
-    
+    yield from _observe(_process_snapshot.get().cpu_affinity)
 
 @safe_observation
 def _create_time_cb(options: CallbackOptions):
-    yield Observation(value=psutil.Process(os.getpid()).create_time())
+    yield from _observe(_process_snapshot.get().create_time)
 
 @safe_observation
 def _open_file_counts_cb(options: CallbackOptions):
-    yield Observation(value=len(psutil.Process(os.getpid()).open_files()))
+    yield from _observe(_process_snapshot.get(TIER_SLOW).num_open_files)
 
 @safe_observation
 def _thread_counts_cb(options: CallbackOptions):
-    yield Observation(value=threading.active_count())
+    yield from _observe(_process_snapshot.get(TIER_FAST).thread_count)
 
 @safe_observation
 def _gc0_cb(options: CallbackOptions):
-    yield Observation(value=gc.get_count()[0], attributes={"type": "gc0"})
+    yield Observation(
+        value=_process_snapshot.get(TIER_FAST).gc_counts[0], attributes={"type": "gc0"}
+    )
 
 @safe_observation
 def _gc1_cb(options: CallbackOptions):
-    yield Observation(value=gc.get_count()[1], attributes={"type": "gc1"})
+    yield Observation(
+        value=_process_snapshot.get(TIER_FAST).gc_counts[1], attributes={"type": "gc1"}
+    )
 
 @safe_observation
 def _gc2_cb(options: CallbackOptions):
-    yield Observation(value=gc.get_count()[2], attributes={"type": "gc2"})
+    yield Observation(
+        value=_process_snapshot.get(TIER_FAST).gc_counts[2], attributes={"type": "gc2"}
+    )
 
 @safe_observation
-def _context_switch_cb(options: CallbackOptions):
-    yield Observation(value=getswitchinterval())
+def _gc_collections_cb(options: CallbackOptions):
+    _gc_monitor.drain()
+    for generation, count in enumerate(_gc_monitor.collections):
+        yield Observation(value=count, attributes=_GC_GENERATION_ATTRIBUTES[generation])
+
+@safe_observation
+def _gc_collected_cb(options: CallbackOptions):
+    for generation, count in enumerate(_gc_monitor.collected):
+        yield Observation(value=count, attributes=_GC_GENERATION_ATTRIBUTES[generation])
 
 @safe_observation
-def __disk_usage_arr():
+def _gc_uncollectable_cb(options: CallbackOptions):
+    for generation, count in enumerate(_gc_monitor.uncollectable):
+        yield Observation(value=count, attributes=_GC_GENERATION_ATTRIBUTES[generation])
+
+@safe_observation
+def _context_switch_cb(options: CallbackOptions):
+    yield from _observe(_process_snapshot.get(TIER_FAST).switch_interval)
+
+def _disk_usage():
     if not psutil.WINDOWS:
         return psutil.disk_usage(os.sep)
     else:
@@ -405,20 +938,32 @@ def __disk_usage_arr():
 
 @safe_observation
 def _disk_usage_percent_cb(options: CallbackOptions):
-    arr_value = __disk_usage_arr()
-    yield Observation(value=arr_value.percent)
+    if not collects_host_metrics():
+        return
+    disk_usage = _process_snapshot.get(TIER_SLOW).disk_usage
+    if disk_usage is not None:
+        yield Observation(value=disk_usage.percent)
 
 @safe_observation
 def _disk_usage_total_cb(options: CallbackOptions):
-    arr_value = __disk_usage_arr()
-    yield Observation(value=arr_value.total, attributes={"type": "total"})
+    if not collects_host_metrics():
+        return
+    disk_usage = _process_snapshot.get(TIER_SLOW).disk_usage
+    if disk_usage is not None:
+        yield Observation(value=disk_usage.total, attributes={"type": "total"})
 
 @safe_observation
 def _disk_usage_used_cb(options: CallbackOptions):
-    arr_value = __disk_usage_arr()
-    yield Observation(value=arr_value.used, attributes={"type": "used"})
+    if not collects_host_metrics():
+        return
+    disk_usage = _process_snapshot.get(TIER_SLOW).disk_usage
+    if disk_usage is not None:
+        yield Observation(value=disk_usage.used, attributes={"type": "used"})
 
 @safe_observation
 def _disk_usage_free_cb(options: CallbackOptions):
-    arr_value = __disk_usage_arr()
-    yield Observation(value=arr_value.free, attributes={"type": "free"})
+    if not collects_host_metrics():
+        return
+    disk_usage = _process_snapshot.get(TIER_SLOW).disk_usage
+    if disk_usage is not None:
+        yield Observation(value=disk_usage.free, attributes={"type": "free"})
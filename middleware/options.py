@@ -31,22 +31,140 @@ MW_PROJECT_NAME = "MW_PROJECT_NAME"
 MW_SAMPLE_RATE = "MW_SAMPLE_RATE"
 MW_LOG_LEVEL = "MW_LOG_LEVEL"
 MW_DETECTORS = "MW_DETECTORS"
+MW_METRICS_FAST_INTERVAL = "MW_METRICS_FAST_INTERVAL"
+MW_METRICS_NORMAL_INTERVAL = "MW_METRICS_NORMAL_INTERVAL"
+MW_METRICS_SLOW_INTERVAL = "MW_METRICS_SLOW_INTERVAL"
+MW_METRICS_BACKEND = "MW_METRICS_BACKEND"
+MW_APM_COLLECT_EVENT_LOOP_METRICS = "MW_APM_COLLECT_EVENT_LOOP_METRICS"
+MW_EVENT_LOOP_PROBE_INTERVAL = "MW_EVENT_LOOP_PROBE_INTERVAL"
+MW_EVENT_LOOP_SLOW_THRESHOLD = "MW_EVENT_LOOP_SLOW_THRESHOLD"
+MW_APM_COLLECT_CONTAINER_METRICS = "MW_APM_COLLECT_CONTAINER_METRICS"
+MW_APM_COLLECT_ALLOCATIONS = "MW_APM_COLLECT_ALLOCATIONS"
+MW_ALLOCATION_SAMPLE_INTERVAL = "MW_ALLOCATION_SAMPLE_INTERVAL"
+MW_ALLOCATION_TOP_N = "MW_ALLOCATION_TOP_N"
+MW_ALLOCATION_FRAME_DEPTH = "MW_ALLOCATION_FRAME_DEPTH"
+MW_ALLOCATION_OVERHEAD_BUDGET = "MW_ALLOCATION_OVERHEAD_BUDGET"
+MW_METRICS_AGGREGATION = "MW_METRICS_AGGREGATION"
+MW_METRICS_AGGREGATION_SLOTS = "MW_METRICS_AGGREGATION_SLOTS"
+MW_METRICS_AGGREGATION_SLOT_SIZE = "MW_METRICS_AGGREGATION_SLOT_SIZE"
+MW_APM_COLLECT_SPAN_METRICS = "MW_APM_COLLECT_SPAN_METRICS"
+MW_SPAN_METRICS_MAX_KEYS = "MW_SPAN_METRICS_MAX_KEYS"
+MW_BSP_MAX_QUEUE_SIZE = "MW_BSP_MAX_QUEUE_SIZE"
+MW_BSP_MAX_EXPORT_BATCH_SIZE = "MW_BSP_MAX_EXPORT_BATCH_SIZE"
+MW_BSP_SCHEDULE_DELAY = "MW_BSP_SCHEDULE_DELAY"
+MW_BSP_EXPORT_TIMEOUT = "MW_BSP_EXPORT_TIMEOUT"
+MW_TAIL_SAMPLING = "MW_TAIL_SAMPLING"
+MW_TAIL_SAMPLING_DECISION_WAIT = "MW_TAIL_SAMPLING_DECISION_WAIT"
+MW_TAIL_SAMPLING_MAX_SPANS = "MW_TAIL_SAMPLING_MAX_SPANS"
+MW_TAIL_SAMPLING_LATENCY_THRESHOLD = "MW_TAIL_SAMPLING_LATENCY_THRESHOLD"
+MW_TAIL_SAMPLING_RULES = "MW_TAIL_SAMPLING_RULES"
+MW_SAMPLER = "MW_SAMPLER"
+MW_SAMPLER_RATE_LIMIT = "MW_SAMPLER_RATE_LIMIT"
+MW_SAMPLER_TARGET_RATE = "MW_SAMPLER_TARGET_RATE"
+MW_SAMPLER_KEY_ATTRIBUTE = "MW_SAMPLER_KEY_ATTRIBUTE"
+MW_SAMPLER_WINDOW = "MW_SAMPLER_WINDOW"
+MW_SAMPLER_MAX_KEYS = "MW_SAMPLER_MAX_KEYS"
+MW_SPAN_COMPRESSION = "MW_SPAN_COMPRESSION"
+MW_EXPORT_MODE = "MW_EXPORT_MODE"
+MW_EXPORT_BUFFER_SIZE = "MW_EXPORT_BUFFER_SIZE"
+MW_PERSISTENT_QUEUE_DIR = "MW_PERSISTENT_QUEUE_DIR"
+MW_PERSISTENT_QUEUE_SIZE = "MW_PERSISTENT_QUEUE_SIZE"
+MW_EXPORTER_PROTOCOL = "MW_EXPORTER_PROTOCOL"
+MW_EXPORTER_COMPRESSION = "MW_EXPORTER_COMPRESSION"
+MW_EXPORTER_COMPRESSION_LEVEL = "MW_EXPORTER_COMPRESSION_LEVEL"
+MW_EXPORT_CIRCUIT_BREAKER = "MW_EXPORT_CIRCUIT_BREAKER"
+MW_EXPORT_CIRCUIT_FAILURE_THRESHOLD = "MW_EXPORT_CIRCUIT_FAILURE_THRESHOLD"
+MW_EXPORT_CIRCUIT_PROBE_INTERVAL = "MW_EXPORT_CIRCUIT_PROBE_INTERVAL"
+MW_EXCEPTION_DETAIL_LIMIT = "MW_EXCEPTION_DETAIL_LIMIT"
+MW_EXCEPTION_DETAIL_WINDOW = "MW_EXCEPTION_DETAIL_WINDOW"
+MW_LOG_ASYNC = "MW_LOG_ASYNC"
+MW_LOG_QUEUE_SIZE = "MW_LOG_QUEUE_SIZE"
+MW_LOG_DROP_POLICY = "MW_LOG_DROP_POLICY"
 
 OTEL_PROPAGATORS = "OTEL_PROPAGATORS"
 
 # Default values
 DEFAULT_TARGET = "http://localhost:9319"
 DEFAULT_PORT = "9319"
+DEFAULT_HTTP_PORT = "9320"
 DEFAULT_COLLECT_TRACES = True
 DEFAULT_COLLECT_METRICS = True
 DEFAULT_COLLECT_LOGS = True
 DEFAULT_COLLECT_PROFILING = False
 DEFAULT_AGENT_SERVICE = "localhost"
 DEFAULT_EXPORTER_PROTOCOL = "grpc"
-DEFAULT_SERVICE_NAME = f"python-service-{os.getpid()}"
+DEFAULT_SERVICE_NAME_PREFIX = "python-service-"
+DEFAULT_SERVICE_NAME = f"{DEFAULT_SERVICE_NAME_PREFIX}{os.getpid()}"
 DEFAULT_LOG_LEVEL = "INFO"
 DEFAULT_PROPAGATORS = "b3"
 DEFAULT_SAMPLE_RATE = 1
+DEFAULT_METRICS_FAST_INTERVAL = 0
+DEFAULT_METRICS_NORMAL_INTERVAL = 0
+DEFAULT_METRICS_SLOW_INTERVAL = 300
+DEFAULT_METRICS_BACKEND = "psutil"
+DEFAULT_COLLECT_EVENT_LOOP_METRICS = False
+DEFAULT_EVENT_LOOP_PROBE_INTERVAL = 1000
+DEFAULT_EVENT_LOOP_SLOW_THRESHOLD = 100
+DEFAULT_COLLECT_CONTAINER_METRICS = True
+DEFAULT_COLLECT_ALLOCATIONS = False
+DEFAULT_ALLOCATION_SAMPLE_INTERVAL = 60
+DEFAULT_ALLOCATION_TOP_N = 10
+DEFAULT_ALLOCATION_FRAME_DEPTH = 1
+DEFAULT_ALLOCATION_OVERHEAD_BUDGET = 0.01
+DEFAULT_METRICS_AGGREGATION = False
+DEFAULT_METRICS_AGGREGATION_SLOTS = 64
+DEFAULT_METRICS_AGGREGATION_SLOT_SIZE = 256 * 1024
+DEFAULT_COLLECT_SPAN_METRICS = False
+DEFAULT_SPAN_METRICS_MAX_KEYS = 1000
+DEFAULT_TAIL_SAMPLING = False
+DEFAULT_TAIL_SAMPLING_DECISION_WAIT = 30
+DEFAULT_TAIL_SAMPLING_MAX_SPANS = 10000
+DEFAULT_TAIL_SAMPLING_LATENCY_THRESHOLD = 1000
+
+# Samplers
+SAMPLER_DETERMINISTIC = "deterministic"
+SAMPLER_PARENTBASED_DETERMINISTIC = "parentbased_deterministic"
+SAMPLER_RATE_LIMITING = "rate_limiting"
+SAMPLER_DYNAMIC = "dynamic"
+DEFAULT_SAMPLER = SAMPLER_DETERMINISTIC
+DEFAULT_SAMPLER_RATE_LIMIT = 100
+DEFAULT_SAMPLER_TARGET_RATE = 100
+DEFAULT_SAMPLER_KEY_ATTRIBUTE = "http.route"
+DEFAULT_SAMPLER_WINDOW = 30
+DEFAULT_SAMPLER_MAX_KEYS = 500
+DEFAULT_SPAN_COMPRESSION = False
+DEFAULT_PERSISTENT_QUEUE_SIZE = 64 * 1024 * 1024
+DEFAULT_EXPORT_CIRCUIT_BREAKER = True
+DEFAULT_EXPORT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_EXPORT_CIRCUIT_PROBE_INTERVAL = 10.0
+DEFAULT_EXCEPTION_DETAIL_LIMIT = 10
+DEFAULT_EXCEPTION_DETAIL_WINDOW = 60
+DEFAULT_LOG_ASYNC = False
+DEFAULT_LOG_QUEUE_SIZE = 8192
+
+# Metrics backends
+METRICS_BACKEND_PSUTIL = "psutil"
+METRICS_BACKEND_PROCFS = "procfs"
+
+# Export modes
+EXPORT_MODE_INPROCESS = "inprocess"
+EXPORT_MODE_SUBPROCESS = "subprocess"
+DEFAULT_EXPORT_MODE = EXPORT_MODE_INPROCESS
+DEFAULT_EXPORT_BUFFER_SIZE = 16 * 1024 * 1024
+
+# Exporter protocols and compressions
+EXPORTER_PROTOCOL_GRPC = "grpc"
+EXPORTER_PROTOCOL_HTTP_PROTOBUF = "http/protobuf"
+EXPORTER_COMPRESSION_NONE = "none"
+EXPORTER_COMPRESSION_DEFLATE = "deflate"
+EXPORTER_COMPRESSION_GZIP = "gzip"
+DEFAULT_EXPORTER_COMPRESSION = EXPORTER_COMPRESSION_GZIP
+DEFAULT_EXPORTER_COMPRESSION_LEVEL = 6
+
+# Log handler drop policies
+LOG_DROP_OLDEST = "drop_oldest"
+LOG_DROP_NEWEST = "drop_newest"
+DEFAULT_LOG_DROP_POLICY = LOG_DROP_OLDEST
 
 
 # DETECTORS
@@ -189,6 +307,293 @@ class MWOptions:
                 detectors_string = "aws_lambda,gcp" for MW_DETECTORS
                 detectors_list = [DETECT_AWS_LAMBDA, DETECT_GCP]
 
+    - `metrics_fast_interval (int)`: Seconds between refreshes of cheap interpreter metrics (threads, gc, switch interval).
+      - Environment Variable: `MW_METRICS_FAST_INTERVAL` (default: 0, every export).
+      - Example usage:
+                metrics_fast_interval = 0
+
+    - `metrics_normal_interval (int)`: Seconds between refreshes of process metrics (cpu, memory, fds, io).
+      - Environment Variable: `MW_METRICS_NORMAL_INTERVAL` (default: 0, every export).
+      - Example usage:
+                metrics_normal_interval = 60
+
+    - `metrics_slow_interval (int)`: Seconds between refreshes of expensive metrics (connections, open files, disk usage).
+      - The last collected value is reported on exports in between.
+      - Environment Variable: `MW_METRICS_SLOW_INTERVAL` (default: 300).
+      - Example usage:
+                metrics_slow_interval = 600
+
+    - `metrics_backend (str)`: How process metrics are read, `psutil` or `procfs`.
+      - `procfs` parses `/proc/self` directly on Linux and falls back to psutil elsewhere.
+      - Environment Variable: `MW_METRICS_BACKEND` (default: "psutil").
+      - Example usage:
+                metrics_backend = "procfs"
+
+    - `collect_event_loop_metrics (bool)`: Flag to collect asyncio event loop lag, pending tasks and slow callbacks.
+      - Environment Variable: `MW_APM_COLLECT_EVENT_LOOP_METRICS` (default: False).
+      - Example usage:
+                collect_event_loop_metrics = True
+
+    - `event_loop_probe_interval (int)`: Milliseconds between two lag probes of the same event loop.
+      - Environment Variable: `MW_EVENT_LOOP_PROBE_INTERVAL` (default: 1000).
+      - Example usage:
+                event_loop_probe_interval = 500
+
+    - `event_loop_slow_threshold (int)`: Lag in milliseconds above which a probe counts as a slow callback.
+      - Environment Variable: `MW_EVENT_LOOP_SLOW_THRESHOLD` (default: 100).
+      - Example usage:
+                event_loop_slow_threshold = 50
+
+    - `collect_container_metrics (bool)`: Flag to collect cgroup memory, cpu throttling, quota and pressure metrics.
+      - Only reported on Linux when the process runs in a cgroup v1 or v2 hierarchy.
+      - Environment Variable: `MW_APM_COLLECT_CONTAINER_METRICS` (default: True).
+      - Example usage:
+                collect_container_metrics = False
+
+    - `collect_allocations (bool)`: Flag to report the fastest growing memory allocation sites using tracemalloc.
+      - Environment Variable: `MW_APM_COLLECT_ALLOCATIONS` (default: False).
+      - Example usage:
+                collect_allocations = True
+
+    - `allocation_sample_interval (int)`: Minimum seconds between two allocation snapshots.
+      - Environment Variable: `MW_ALLOCATION_SAMPLE_INTERVAL` (default: 60).
+      - Example usage:
+                allocation_sample_interval = 300
+
+    - `allocation_top_n (int)`: Number of growing allocation sites reported per snapshot.
+      - Environment Variable: `MW_ALLOCATION_TOP_N` (default: 10).
+      - Example usage:
+                allocation_top_n = 20
+
+    - `allocation_frame_depth (int)`: Frames stored per traced allocation. Higher values cost more per allocation.
+      - Environment Variable: `MW_ALLOCATION_FRAME_DEPTH` (default: 1).
+      - Example usage:
+                allocation_frame_depth = 1
+
+    - `allocation_overhead_budget (float)`: Share of wall time snapshots may take. Snapshots are spaced out to stay within it.
+      - Environment Variable: `MW_ALLOCATION_OVERHEAD_BUDGET` (default: 0.01).
+      - Example usage:
+                allocation_overhead_budget = 0.005
+
+    - `metrics_aggregation (bool)`: Flag to export the metrics of all prefork workers from a single elected process.
+      - Workers hand their metrics over through shared memory, which requires the SDK to be set up
+        in the parent before workers are forked (e.g. gunicorn `--preload`).
+      - Environment Variable: `MW_METRICS_AGGREGATION` (default: False).
+      - Example usage:
+                metrics_aggregation = True
+
+    - `metrics_aggregation_slots (int)`: Maximum number of processes sharing the metrics aggregation segment.
+      - Processes that find no free slot export their metrics themselves.
+      - Environment Variable: `MW_METRICS_AGGREGATION_SLOTS` (default: 64).
+      - Example usage:
+                metrics_aggregation_slots = 128
+
+    - `metrics_aggregation_slot_size (int)`: Bytes reserved for the encoded metrics of each process.
+      - A process whose metrics do not fit exports them itself.
+      - Environment Variable: `MW_METRICS_AGGREGATION_SLOT_SIZE` (default: 262144).
+      - Example usage:
+                metrics_aggregation_slot_size = 1048576
+
+    - `collect_span_metrics (bool)`: Flag to aggregate request rate, error count and duration metrics from every span.
+      - Metrics are computed before sampling, so they stay exact at any `sample_rate`.
+        Spans that are not sampled are still recorded (not exported) to be counted.
+      - Environment Variable: `MW_APM_COLLECT_SPAN_METRICS` (default: False).
+      - Example usage:
+                collect_span_metrics = True
+
+    - `span_metrics_max_keys (int)`: Maximum number of span name and kind pairs tracked by span metrics.
+      - Further spans are counted into a single series with the `otel.metric.overflow` attribute.
+      - Environment Variable: `MW_SPAN_METRICS_MAX_KEYS` (default: 1000).
+      - Example usage:
+                span_metrics_max_keys = 500
+
+    - `bsp_max_queue_size (int)`: Maximum number of spans waiting for export. Spans ending while it is full are dropped.
+      - Environment Variable: `MW_BSP_MAX_QUEUE_SIZE` (alternative: `OTEL_BSP_MAX_QUEUE_SIZE`, default: 2048).
+      - Example usage:
+                bsp_max_queue_size = 65536
+
+    - `bsp_max_export_batch_size (int)`: Maximum number of spans sent in one export request.
+      - Environment Variable: `MW_BSP_MAX_EXPORT_BATCH_SIZE` (alternative: `OTEL_BSP_MAX_EXPORT_BATCH_SIZE`, default: 512).
+      - Example usage:
+                bsp_max_export_batch_size = 2048
+
+    - `bsp_schedule_delay (int)`: Milliseconds between two exports when the queue holds less than a full batch.
+      - Environment Variable: `MW_BSP_SCHEDULE_DELAY` (alternative: `OTEL_BSP_SCHEDULE_DELAY`, default: 5000).
+      - Example usage:
+                bsp_schedule_delay = 1000
+
+    - `bsp_export_timeout (int)`: Milliseconds one span export request may take, retries included.
+      - Environment Variable: `MW_BSP_EXPORT_TIMEOUT` (alternative: `OTEL_EXPORTER_OTLP_TRACES_TIMEOUT`, default: 10000).
+      - Example usage:
+                bsp_export_timeout = 5000
+
+    - `tail_sampling (bool)`: Flag to sample whole traces once they end instead of when they start.
+      - Traces with an error, a slow span or a span matching `tail_sampling_rules` are always kept,
+        others are kept at `sample_rate`, none of them with a `sample_rate` of 0 (or less).
+      - Environment Variable: `MW_TAIL_SAMPLING` (default: False).
+      - Example usage:
+                tail_sampling = True
+
+    - `tail_sampling_decision_wait (int)`: Seconds without a new span after which a trace whose local root did not end is decided.
+      - Environment Variable: `MW_TAIL_SAMPLING_DECISION_WAIT` (default: 30).
+      - Example usage:
+                tail_sampling_decision_wait = 10
+
+    - `tail_sampling_max_spans (int)`: Maximum number of spans buffered while their traces are not decided.
+      - Above it the least recently active trace is decided with the spans it has.
+      - Environment Variable: `MW_TAIL_SAMPLING_MAX_SPANS` (default: 10000).
+      - Example usage:
+                tail_sampling_max_spans = 50000
+
+    - `tail_sampling_latency_threshold (int)`: Milliseconds a span has to last for its trace to be kept.
+      - Environment Variable: `MW_TAIL_SAMPLING_LATENCY_THRESHOLD` (default: 1000).
+      - Example usage:
+                tail_sampling_latency_threshold = 500
+
+    - `tail_sampling_rules (str)`: Span attributes that make a trace be kept, as `key=value` or just `key`.
+      - Environment Variable: `MW_TAIL_SAMPLING_RULES`.
+      - Example usage:
+                tail_sampling_rules = "http.status_code=500,enduser.id=admin,db.error"
+
+    - `sampler (str)`: How spans are sampled, one of `deterministic`, `parentbased_deterministic`, `rate_limiting` or `dynamic`.
+      - `deterministic` samples 1/N traces from the trace id and ignores the parent span's decision.
+      - `parentbased_deterministic` follows the parent span's decision and samples 1/N root spans.
+      - `rate_limiting` also follows the parent span and samples at most `sampler_rate_limit` root spans per second.
+      - `dynamic` follows the parent span and adapts the rate of each span name and `sampler_key_attribute` value
+        to sample about `sampler_target_rate` root spans per second, fairly shared between them.
+      - Environment Variable: `MW_SAMPLER` (default: "deterministic").
+      - Example usage:
+                sampler = "parentbased_deterministic"
+
+    - `sampler_rate_limit (int)`: Maximum number of root spans sampled per second by the `rate_limiting` sampler.
+      - Environment Variable: `MW_SAMPLER_RATE_LIMIT` (default: 100).
+      - Example usage:
+                sampler_rate_limit = 500
+
+    - `sampler_target_rate (int)`: Root spans per second the `dynamic` sampler aims to sample.
+      - Environment Variable: `MW_SAMPLER_TARGET_RATE` (default: 100).
+      - Example usage:
+                sampler_target_rate = 20
+
+    - `sampler_key_attribute (str)`: Span attribute the `dynamic` sampler keys rates on, along with the span name.
+      - Environment Variable: `MW_SAMPLER_KEY_ATTRIBUTE` (default: "http.route").
+      - Example usage:
+                sampler_key_attribute = "http.target"
+
+    - `sampler_window (int)`: Seconds of traffic the `dynamic` sampler counts before recomputing its rates.
+      - Environment Variable: `MW_SAMPLER_WINDOW` (default: 30).
+      - Example usage:
+                sampler_window = 60
+
+    - `sampler_max_keys (int)`: Maximum number of keys the `dynamic` sampler tracks, others share one rate.
+      - Environment Variable: `MW_SAMPLER_MAX_KEYS` (default: 500).
+      - Example usage:
+                sampler_max_keys = 1000
+
+    - `span_compression (bool)`: Merge consecutive sibling spans with the same name, kind and database statement
+      (e.g. the queries of an N+1 pattern) into one composite span with their count and total, min and max durations.
+      - Environment Variable: `MW_SPAN_COMPRESSION` (default: False).
+      - Example usage:
+                span_compression = True
+
+    - `export_mode (str)`: Where telemetry is encoded and sent, `inprocess` or `subprocess`.
+      - `subprocess` hands spans, logs and metrics over to a helper process through shared memory, the helper
+        does the OTLP encoding, compression and gRPC calls so they do not hold the application's GIL.
+        A helper that exits is started again, up to 3 times, then telemetry is exported in-process.
+      - Environment Variable: `MW_EXPORT_MODE` (default: "inprocess").
+      - Example usage:
+                export_mode = "subprocess"
+
+    - `export_buffer_size (int)`: Bytes of shared memory between the application and the `subprocess` export helper.
+      Telemetry that does not fit is dropped and counted by the `process.export.subprocess.dropped.count` metric.
+      - Environment Variable: `MW_EXPORT_BUFFER_SIZE` (default: 16777216).
+      - Example usage:
+                export_buffer_size = 64 * 1024 * 1024
+
+    - `persistent_queue_dir (str)`: Directory of the persistent export queues. When set, batches that fail to export
+      are written to one memory mapped file per signal and replayed in order, with backoff, once `target` is
+      reachable again, also after a restart of the application.
+      - Environment Variable: `MW_PERSISTENT_QUEUE_DIR` (default: None, disabled).
+      - Example usage:
+                persistent_queue_dir = "/var/lib/mw-agent/queue"
+
+    - `persistent_queue_size (int)`: Bytes of disk each persistent export queue file uses, the oldest batches
+      are dropped when it is full.
+      - Environment Variable: `MW_PERSISTENT_QUEUE_SIZE` (default: 67108864).
+      - Example usage:
+                persistent_queue_size = 256 * 1024 * 1024
+
+    - `exporter_protocol (str)`: OTLP transport used to send telemetry to `target`, `grpc` or `http/protobuf`.
+      - `grpc` sends every signal over a single channel.
+      - `http/protobuf` posts to `target` + `/v1/traces`, `/v1/metrics` and `/v1/logs` over one pooled keep-alive session.
+        With the agent (a `target` without https), telemetry is sent to its OTLP/HTTP port 9320 instead of 9319,
+        an https `target` has to accept OTLP/HTTP.
+      - Environment Variable: `MW_EXPORTER_PROTOCOL` (default: "grpc").
+      - Example usage:
+                exporter_protocol = "http/protobuf"
+
+    - `exporter_compression (str)`: Compression of exported telemetry, `none`, `deflate` or `gzip`.
+      Compression only costs CPU when the agent runs on the same host.
+      - Environment Variable: `MW_EXPORTER_COMPRESSION` (default: "gzip").
+      - Example usage:
+                exporter_compression = "none"
+
+    - `exporter_compression_level (int)`: Compression level from 1 (fastest) to 9 (smallest) of the `http/protobuf`
+      exporters, gRPC compresses at its own level.
+      - Environment Variable: `MW_EXPORTER_COMPRESSION_LEVEL` (default: 6).
+      - Example usage:
+                exporter_compression_level = 1
+
+    - `export_circuit_breaker (bool)`: Stop exporting while `target` is down. After `export_circuit_failure_threshold`
+      consecutive failed exports of any signal, batches are dropped, or spilled to the persistent export queue,
+      before they are encoded, until a TCP connection to `target` succeeds again.
+      - The `process.export.circuit.*` metrics are only exported with the `inprocess` `export_mode`, with
+        `subprocess` the circuit lives in the export helper, which does not report metrics.
+      - Environment Variable: `MW_EXPORT_CIRCUIT_BREAKER` (default: True).
+      - Example usage:
+                export_circuit_breaker = False
+
+    - `export_circuit_failure_threshold (int)`: Consecutive failed exports that open the export circuit.
+      - Environment Variable: `MW_EXPORT_CIRCUIT_FAILURE_THRESHOLD` (default: 5).
+      - Example usage:
+                export_circuit_failure_threshold = 3
+
+    - `export_circuit_probe_interval (float)`: Seconds between two connection probes of `target` while the export
+      circuit is open.
+      - Environment Variable: `MW_EXPORT_CIRCUIT_PROBE_INTERVAL` (default: 10.0).
+      - Example usage:
+                export_circuit_probe_interval = 30.0
+
+    - `exception_detail_limit (int)`: Occurrences of the same exception, same type raised from the same stack, recorded
+      with the full stack details per `exception_detail_window`. Later occurrences are recorded as a light exception
+      event with the fingerprint of the exception and its occurrence count. 0 records every occurrence in full.
+      - Environment Variable: `MW_EXCEPTION_DETAIL_LIMIT` (default: 10).
+      - Example usage:
+                exception_detail_limit = 100
+
+    - `exception_detail_window (int)`: Seconds after which the occurrences of every exception are counted afresh.
+      - Environment Variable: `MW_EXCEPTION_DETAIL_WINDOW` (default: 60).
+      - Example usage:
+                exception_detail_window = 300
+
+    - `log_async (bool)`: Hand log records over to a background thread. The logging call only appends the record
+      and its trace context to a bounded queue, the conversion and every log record processor, including the
+      console exporter, run on the background thread.
+      - Environment Variable: `MW_LOG_ASYNC` (default: False).
+      - Example usage:
+                log_async = True
+
+    - `log_queue_size (int)`: Log records the queue of `log_async` holds, records are dropped when it is full.
+      - Environment Variable: `MW_LOG_QUEUE_SIZE` (default: 8192).
+      - Example usage:
+                log_queue_size = 65536
+
+    - `log_drop_policy (str)`: Records dropped when the queue of `log_async` is full: `drop_oldest` makes room for
+      the new record, `drop_newest` drops the new record.
+      - Environment Variable: `MW_LOG_DROP_POLICY` (default: "drop_oldest").
+      - Example usage:
+                log_drop_policy = "drop_newest"
+
     **Defaults**:
 
     - Target: http://localhost:9319
@@ -201,6 +606,16 @@ class MWOptions:
     - Service Name: 'unknown_service:python'
     - Propagators: 'b3'
     - Sample Rate: 1
+    - Metrics Fast/Normal/Slow Interval: 0/0/300 seconds
+    - Metrics Backend: 'psutil'
+    - Collect Event Loop Metrics: False
+    - Collect Container Metrics: True
+    - Collect Allocations: False
+    - Metrics Aggregation: False
+    - Collect Span Metrics: False
+    - Span Batch Queue/Batch Size/Schedule Delay: 2048/512/5000 ms
+    - Tail Sampling: False
+    - Sampler: 'deterministic'
 
     """
 
@@ -220,6 +635,55 @@ class MWOptions:
     project_name = None
     sample_rate = None
     detectors = None
+    metrics_fast_interval = DEFAULT_METRICS_FAST_INTERVAL
+    metrics_normal_interval = DEFAULT_METRICS_NORMAL_INTERVAL
+    metrics_slow_interval = DEFAULT_METRICS_SLOW_INTERVAL
+    metrics_backend = DEFAULT_METRICS_BACKEND
+    collect_event_loop_metrics = DEFAULT_COLLECT_EVENT_LOOP_METRICS
+    event_loop_probe_interval = DEFAULT_EVENT_LOOP_PROBE_INTERVAL
+    event_loop_slow_threshold = DEFAULT_EVENT_LOOP_SLOW_THRESHOLD
+    collect_container_metrics = DEFAULT_COLLECT_CONTAINER_METRICS
+    collect_allocations = DEFAULT_COLLECT_ALLOCATIONS
+    allocation_sample_interval = DEFAULT_ALLOCATION_SAMPLE_INTERVAL
+    allocation_top_n = DEFAULT_ALLOCATION_TOP_N
+    allocation_frame_depth = DEFAULT_ALLOCATION_FRAME_DEPTH
+    allocation_overhead_budget = DEFAULT_ALLOCATION_OVERHEAD_BUDGET
+    metrics_aggregation = DEFAULT_METRICS_AGGREGATION
+    metrics_aggregation_slots = DEFAULT_METRICS_AGGREGATION_SLOTS
+    metrics_aggregation_slot_size = DEFAULT_METRICS_AGGREGATION_SLOT_SIZE
+    collect_span_metrics = DEFAULT_COLLECT_SPAN_METRICS
+    span_metrics_max_keys = DEFAULT_SPAN_METRICS_MAX_KEYS
+    bsp_max_queue_size = None
+    bsp_max_export_batch_size = None
+    bsp_schedule_delay = None
+    bsp_export_timeout = None
+    tail_sampling = DEFAULT_TAIL_SAMPLING
+    tail_sampling_decision_wait = DEFAULT_TAIL_SAMPLING_DECISION_WAIT
+    tail_sampling_max_spans = DEFAULT_TAIL_SAMPLING_MAX_SPANS
+    tail_sampling_latency_threshold = DEFAULT_TAIL_SAMPLING_LATENCY_THRESHOLD
+    tail_sampling_rules = None
+    sampler = DEFAULT_SAMPLER
+    sampler_rate_limit = DEFAULT_SAMPLER_RATE_LIMIT
+    sampler_target_rate = DEFAULT_SAMPLER_TARGET_RATE
+    sampler_key_attribute = DEFAULT_SAMPLER_KEY_ATTRIBUTE
+    sampler_window = DEFAULT_SAMPLER_WINDOW
+    sampler_max_keys = DEFAULT_SAMPLER_MAX_KEYS
+    span_compression = DEFAULT_SPAN_COMPRESSION
+    export_mode = DEFAULT_EXPORT_MODE
+    export_buffer_size = DEFAULT_EXPORT_BUFFER_SIZE
+    persistent_queue_dir = None
+    persistent_queue_size = DEFAULT_PERSISTENT_QUEUE_SIZE
+    exporter_protocol = DEFAULT_EXPORTER_PROTOCOL
+    exporter_compression = DEFAULT_EXPORTER_COMPRESSION
+    exporter_compression_level = DEFAULT_EXPORTER_COMPRESSION_LEVEL
+    export_circuit_breaker = DEFAULT_EXPORT_CIRCUIT_BREAKER
+    export_circuit_failure_threshold = DEFAULT_EXPORT_CIRCUIT_FAILURE_THRESHOLD
+    export_circuit_probe_interval = DEFAULT_EXPORT_CIRCUIT_PROBE_INTERVAL
+    exception_detail_limit = DEFAULT_EXCEPTION_DETAIL_LIMIT
+    exception_detail_window = DEFAULT_EXCEPTION_DETAIL_WINDOW
+    log_async = DEFAULT_LOG_ASYNC
+    log_queue_size = DEFAULT_LOG_QUEUE_SIZE
+    log_drop_policy = DEFAULT_LOG_DROP_POLICY
 
     def __init__(
         self,
@@ -239,6 +703,55 @@ class MWOptions:
         project_name: str = None,
         sample_rate: int = None,
         detectors: Union[str, List[Detector]] = None,
+        metrics_fast_interval: int = DEFAULT_METRICS_FAST_INTERVAL,
+        metrics_normal_interval: int = DEFAULT_METRICS_NORMAL_INTERVAL,
+        metrics_slow_interval: int = DEFAULT_METRICS_SLOW_INTERVAL,
+        metrics_backend: str = DEFAULT_METRICS_BACKEND,
+        collect_event_loop_metrics: bool = DEFAULT_COLLECT_EVENT_LOOP_METRICS,
+        event_loop_probe_interval: int = DEFAULT_EVENT_LOOP_PROBE_INTERVAL,
+        event_loop_slow_threshold: int = DEFAULT_EVENT_LOOP_SLOW_THRESHOLD,
+        collect_container_metrics: bool = DEFAULT_COLLECT_CONTAINER_METRICS,
+        collect_allocations: bool = DEFAULT_COLLECT_ALLOCATIONS,
+        allocation_sample_interval: int = DEFAULT_ALLOCATION_SAMPLE_INTERVAL,
+        allocation_top_n: int = DEFAULT_ALLOCATION_TOP_N,
+        allocation_frame_depth: int = DEFAULT_ALLOCATION_FRAME_DEPTH,
+        allocation_overhead_budget: float = DEFAULT_ALLOCATION_OVERHEAD_BUDGET,
+        metrics_aggregation: bool = DEFAULT_METRICS_AGGREGATION,
+        metrics_aggregation_slots: int = DEFAULT_METRICS_AGGREGATION_SLOTS,
+        metrics_aggregation_slot_size: int = DEFAULT_METRICS_AGGREGATION_SLOT_SIZE,
+        collect_span_metrics: bool = DEFAULT_COLLECT_SPAN_METRICS,
+        span_metrics_max_keys: int = DEFAULT_SPAN_METRICS_MAX_KEYS,
+        bsp_max_queue_size: int = None,
+        bsp_max_export_batch_size: int = None,
+        bsp_schedule_delay: int = None,
+        bsp_export_timeout: int = None,
+        tail_sampling: bool = DEFAULT_TAIL_SAMPLING,
+        tail_sampling_decision_wait: int = DEFAULT_TAIL_SAMPLING_DECISION_WAIT,
+        tail_sampling_max_spans: int = DEFAULT_TAIL_SAMPLING_MAX_SPANS,
+        tail_sampling_latency_threshold: int = DEFAULT_TAIL_SAMPLING_LATENCY_THRESHOLD,
+        tail_sampling_rules: str = None,
+        sampler: str = DEFAULT_SAMPLER,
+        sampler_rate_limit: int = DEFAULT_SAMPLER_RATE_LIMIT,
+        sampler_target_rate: int = DEFAULT_SAMPLER_TARGET_RATE,
+        sampler_key_attribute: str = DEFAULT_SAMPLER_KEY_ATTRIBUTE,
+        sampler_window: int = DEFAULT_SAMPLER_WINDOW,
+        sampler_max_keys: int = DEFAULT_SAMPLER_MAX_KEYS,
+        span_compression: bool = DEFAULT_SPAN_COMPRESSION,
+        export_mode: str = DEFAULT_EXPORT_MODE,
+        export_buffer_size: int = DEFAULT_EXPORT_BUFFER_SIZE,
+        persistent_queue_dir: str = None,
+        persistent_queue_size: int = DEFAULT_PERSISTENT_QUEUE_SIZE,
+        exporter_protocol: str = DEFAULT_EXPORTER_PROTOCOL,
+        exporter_compression: str = DEFAULT_EXPORTER_COMPRESSION,
+        exporter_compression_level: int = DEFAULT_EXPORTER_COMPRESSION_LEVEL,
+        export_circuit_breaker: bool = DEFAULT_EXPORT_CIRCUIT_BREAKER,
+        export_circuit_failure_threshold: int = DEFAULT_EXPORT_CIRCUIT_FAILURE_THRESHOLD,
+        export_circuit_probe_interval: float = DEFAULT_EXPORT_CIRCUIT_PROBE_INTERVAL,
+        exception_detail_limit: int = DEFAULT_EXCEPTION_DETAIL_LIMIT,
+        exception_detail_window: int = DEFAULT_EXCEPTION_DETAIL_WINDOW,
+        log_async: bool = DEFAULT_LOG_ASYNC,
+        log_queue_size: int = DEFAULT_LOG_QUEUE_SIZE,
+        log_drop_policy: str = DEFAULT_LOG_DROP_POLICY,
     ):
         self.access_token = os.environ.get(MW_API_KEY, access_token)
         self.service_name = os.environ.get(
@@ -284,6 +797,177 @@ class MWOptions:
         self.project_name = os.environ.get(MW_PROJECT_NAME, project_name)
         self.sample_rate = parse_int(MW_SAMPLE_RATE, sample_rate, DEFAULT_SAMPLE_RATE)
         self.detectors = os.environ.get(MW_DETECTORS, detectors)
+        self.metrics_fast_interval = parse_int(
+            MW_METRICS_FAST_INTERVAL,
+            metrics_fast_interval,
+            DEFAULT_METRICS_FAST_INTERVAL,
+        )
+        self.metrics_normal_interval = parse_int(
+            MW_METRICS_NORMAL_INTERVAL,
+            metrics_normal_interval,
+            DEFAULT_METRICS_NORMAL_INTERVAL,
+        )
+        self.metrics_slow_interval = parse_int(
+            MW_METRICS_SLOW_INTERVAL,
+            metrics_slow_interval,
+            DEFAULT_METRICS_SLOW_INTERVAL,
+        )
+        self.metrics_backend = os.environ.get(MW_METRICS_BACKEND, metrics_backend)
+        self.collect_event_loop_metrics = parse_bool(
+            MW_APM_COLLECT_EVENT_LOOP_METRICS, collect_event_loop_metrics
+        )
+        self.event_loop_probe_interval = parse_int(
+            MW_EVENT_LOOP_PROBE_INTERVAL,
+            event_loop_probe_interval,
+            DEFAULT_EVENT_LOOP_PROBE_INTERVAL,
+        )
+        self.event_loop_slow_threshold = parse_int(
+            MW_EVENT_LOOP_SLOW_THRESHOLD,
+            event_loop_slow_threshold,
+            DEFAULT_EVENT_LOOP_SLOW_THRESHOLD,
+        )
+        self.collect_container_metrics = parse_bool(
+            MW_APM_COLLECT_CONTAINER_METRICS, collect_container_metrics
+        )
+        self.collect_allocations = parse_bool(
+            MW_APM_COLLECT_ALLOCATIONS, collect_allocations
+        )
+        self.allocation_sample_interval = parse_int(
+            MW_ALLOCATION_SAMPLE_INTERVAL,
+            allocation_sample_interval,
+            DEFAULT_ALLOCATION_SAMPLE_INTERVAL,
+        )
+        self.allocation_top_n = parse_int(
+            MW_ALLOCATION_TOP_N, allocation_top_n, DEFAULT_ALLOCATION_TOP_N
+        )
+        self.allocation_frame_depth = parse_int(
+            MW_ALLOCATION_FRAME_DEPTH,
+            allocation_frame_depth,
+            DEFAULT_ALLOCATION_FRAME_DEPTH,
+        )
+        self.allocation_overhead_budget = parse_float(
+            MW_ALLOCATION_OVERHEAD_BUDGET,
+            allocation_overhead_budget,
+            DEFAULT_ALLOCATION_OVERHEAD_BUDGET,
+        )
+        self.metrics_aggregation = parse_bool(
+            MW_METRICS_AGGREGATION, metrics_aggregation
+        )
+        self.metrics_aggregation_slots = parse_int(
+            MW_METRICS_AGGREGATION_SLOTS,
+            metrics_aggregation_slots,
+            DEFAULT_METRICS_AGGREGATION_SLOTS,
+        )
+        self.metrics_aggregation_slot_size = parse_int(
+            MW_METRICS_AGGREGATION_SLOT_SIZE,
+            metrics_aggregation_slot_size,
+            DEFAULT_METRICS_AGGREGATION_SLOT_SIZE,
+        )
+        self.collect_span_metrics = parse_bool(
+            MW_APM_COLLECT_SPAN_METRICS, collect_span_metrics
+        )
+        self.span_metrics_max_keys = parse_int(
+            MW_SPAN_METRICS_MAX_KEYS,
+            span_metrics_max_keys,
+            DEFAULT_SPAN_METRICS_MAX_KEYS,
+        )
+        self.bsp_max_queue_size = parse_int(
+            MW_BSP_MAX_QUEUE_SIZE, bsp_max_queue_size, None
+        )
+        self.bsp_max_export_batch_size = parse_int(
+            MW_BSP_MAX_EXPORT_BATCH_SIZE, bsp_max_export_batch_size, None
+        )
+        self.bsp_schedule_delay = parse_int(
+            MW_BSP_SCHEDULE_DELAY, bsp_schedule_delay, None
+        )
+        self.bsp_export_timeout = parse_int(
+            MW_BSP_EXPORT_TIMEOUT, bsp_export_timeout, None
+        )
+        self.tail_sampling = parse_bool(MW_TAIL_SAMPLING, tail_sampling)
+        self.tail_sampling_decision_wait = parse_int(
+            MW_TAIL_SAMPLING_DECISION_WAIT,
+            tail_sampling_decision_wait,
+            DEFAULT_TAIL_SAMPLING_DECISION_WAIT,
+        )
+        self.tail_sampling_max_spans = parse_int(
+            MW_TAIL_SAMPLING_MAX_SPANS,
+            tail_sampling_max_spans,
+            DEFAULT_TAIL_SAMPLING_MAX_SPANS,
+        )
+        self.tail_sampling_latency_threshold = parse_int(
+            MW_TAIL_SAMPLING_LATENCY_THRESHOLD,
+            tail_sampling_latency_threshold,
+            DEFAULT_TAIL_SAMPLING_LATENCY_THRESHOLD,
+        )
+        self.tail_sampling_rules = os.environ.get(
+            MW_TAIL_SAMPLING_RULES, tail_sampling_rules
+        )
+        self.sampler = os.environ.get(MW_SAMPLER, sampler)
+        self.sampler_rate_limit = parse_int(
+            MW_SAMPLER_RATE_LIMIT, sampler_rate_limit, DEFAULT_SAMPLER_RATE_LIMIT
+        )
+        self.sampler_target_rate = parse_int(
+            MW_SAMPLER_TARGET_RATE, sampler_target_rate, DEFAULT_SAMPLER_TARGET_RATE
+        )
+        self.sampler_key_attribute = os.environ.get(
+            MW_SAMPLER_KEY_ATTRIBUTE, sampler_key_attribute
+        )
+        self.sampler_window = parse_int(
+            MW_SAMPLER_WINDOW, sampler_window, DEFAULT_SAMPLER_WINDOW
+        )
+        self.sampler_max_keys = parse_int(
+            MW_SAMPLER_MAX_KEYS, sampler_max_keys, DEFAULT_SAMPLER_MAX_KEYS
+        )
+        self.span_compression = parse_bool(MW_SPAN_COMPRESSION, span_compression)
+        self.export_mode = os.environ.get(MW_EXPORT_MODE, export_mode)
+        self.export_buffer_size = parse_int(
+            MW_EXPORT_BUFFER_SIZE, export_buffer_size, DEFAULT_EXPORT_BUFFER_SIZE
+        )
+        self.persistent_queue_dir = os.environ.get(
+            MW_PERSISTENT_QUEUE_DIR, persistent_queue_dir
+        )
+        self.persistent_queue_size = parse_int(
+            MW_PERSISTENT_QUEUE_SIZE, persistent_queue_size, DEFAULT_PERSISTENT_QUEUE_SIZE
+        )
+        self.exporter_protocol = os.environ.get(MW_EXPORTER_PROTOCOL, exporter_protocol)
+        # The agent receives OTLP/HTTP on another port than gRPC.
+        if (
+            self.exporter_protocol == EXPORTER_PROTOCOL_HTTP_PROTOBUF
+            and self.target == f"http://{self.mw_agent_service}:{DEFAULT_PORT}"
+        ):
+            self.target = f"http://{self.mw_agent_service}:{DEFAULT_HTTP_PORT}"
+        self.exporter_compression = os.environ.get(
+            MW_EXPORTER_COMPRESSION, exporter_compression
+        )
+        self.exporter_compression_level = parse_int(
+            MW_EXPORTER_COMPRESSION_LEVEL,
+            exporter_compression_level,
+            DEFAULT_EXPORTER_COMPRESSION_LEVEL,
+        )
+        self.export_circuit_breaker = parse_bool(
+            MW_EXPORT_CIRCUIT_BREAKER, export_circuit_breaker
+        )
+        self.export_circuit_failure_threshold = parse_int(
+            MW_EXPORT_CIRCUIT_FAILURE_THRESHOLD,
+            export_circuit_failure_threshold,
+            DEFAULT_EXPORT_CIRCUIT_FAILURE_THRESHOLD,
+        )
+        self.export_circuit_probe_interval = parse_float(
+            MW_EXPORT_CIRCUIT_PROBE_INTERVAL,
+            export_circuit_probe_interval,
+            DEFAULT_EXPORT_CIRCUIT_PROBE_INTERVAL,
+        )
+        self.exception_detail_limit = parse_int(
+            MW_EXCEPTION_DETAIL_LIMIT, exception_detail_limit, DEFAULT_EXCEPTION_DETAIL_LIMIT
+        )
+        self.exception_detail_window = parse_int(
+            MW_EXCEPTION_DETAIL_WINDOW, exception_detail_window, DEFAULT_EXCEPTION_DETAIL_WINDOW
+        )
+        self.log_async = parse_bool(MW_LOG_ASYNC, log_async)
+        self.log_queue_size = parse_int(
+            MW_LOG_QUEUE_SIZE, log_queue_size, DEFAULT_LOG_QUEUE_SIZE
+        )
+        self.log_drop_policy = os.environ.get(MW_LOG_DROP_POLICY, log_drop_policy)
         _health_check(options=self)
         _get_instrument_info(options=self)
 
@@ -345,6 +1029,38 @@ def parse_int(
     else:
         return default_value
 
+def parse_float(
+    environment_variable: str,
+    param: float,
+    default_value: float,
+    error_message: str = None,
+) -> float:
+    """
+    Attempts to parse the provided environment variable into a float. If it
+    does not exist or fails parse, the default value is returned instead.
+
+    Args:
+        environment_variable (str): the environment variable name to use
+        param(float): fallback parameter to check before setting default
+        default_value (float): the default value if not found or unable parse
+        error_message (str): the error message to log if unable to parse
+
+    Returns:
+        float: either the parsed environment variable, param, or default value
+    """
+    val = os.getenv(environment_variable, None)
+    if val:
+        try:
+            return float(val)
+        except ValueError:
+            if error_message is not None:
+                _logger.warning(error_message)
+            return default_value
+    elif isinstance(param, (int, float)):
+        return param
+    else:
+        return default_value
+
 def _health_check(options: MWOptions):
     if options.target == "" or ("https" not in options.target) :
         try:
@@ -0,0 +1,219 @@
+import gzip
+import os
+import random
+import threading
+import time
+import zlib
+import logging
+from typing import Optional, Sequence
+import requests
+from requests.adapters import HTTPAdapter
+from opentelemetry.exporter.otlp.proto.common._internal.metrics_encoder import (
+    OTLPMetricExporterMixin,
+)
+from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import (
+    ExportLogsServiceRequest,
+)
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+from opentelemetry.sdk._logs import LogData
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.environment_variables import OTEL_EXPORTER_OTLP_HEADERS
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.util.re import parse_env_headers
+from middleware.options import (
+    EXPORTER_COMPRESSION_DEFLATE,
+    EXPORTER_COMPRESSION_GZIP,
+)
+from middleware.export_errors import record_rejection
+
+_logger = logging.getLogger(__name__)
+
+_MAX_RETRIES = 6
+_RETRYABLE_STATUS_CODES = frozenset((408, 429, 502, 503, 504))
+_DEFAULT_TIMEOUT = 10.0
+
+# Connections kept alive to the endpoint: one per signal and one for the
+# replay of the persistent queue.
+_POOL_SIZE = 4
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def shared_session() -> requests.Session:
+    """
+    Returns the keep-alive session every OTLP/HTTP exporter of the process
+    posts with, a new one after a fork since the pooled connections belong
+    to the parent.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(
+                parse_env_headers(os.environ.get(OTEL_EXPORTER_OTLP_HEADERS, ""), liberal=True)
+            )
+            session.headers["Content-Type"] = "application/x-protobuf"
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+class _OTLPHTTPExporter:
+    """
+    Posts OTLP protobuf requests to `endpoint` + `path`, compressed with
+    `compression` at `compression_level`, retrying with backoff on the
+    errors the OTLP specification deems transient.
+
+    Requests already encoded, as replayed from the persistent queue or
+    merged by the metrics aggregation, are posted as they are.
+    """
+
+    _path = ""
+    _request_type = None
+
+    def __init__(
+        self,
+        endpoint: str,
+        compression: Optional[str] = None,
+        compression_level: int = 6,
+        timeout: Optional[float] = None,
+        session: Optional[requests.Session] = None,
+    ):
+        self._url = endpoint.rstrip("/") + self._path
+        self._compression = compression
+        self._compression_level = compression_level
+        self._timeout = timeout or _DEFAULT_TIMEOUT
+        self._session = session or shared_session()
+        self._headers = {}
+        if compression in (EXPORTER_COMPRESSION_GZIP, EXPORTER_COMPRESSION_DEFLATE):
+            self._headers["Content-Encoding"] = compression
+        self._shutdown = threading.Event()
+
+    def _encode(self, data):
+        raise NotImplementedError
+
+    def _compress(self, body: bytes) -> bytes:
+        if self._compression == EXPORTER_COMPRESSION_GZIP:
+            return gzip.compress(body, self._compression_level)
+        if self._compression == EXPORTER_COMPRESSION_DEFLATE:
+            return zlib.compress(body, self._compression_level)
+        return body
+
+    def _post(self, data) -> bool:
+        if self._shutdown.is_set():
+            _logger.warning("Exporter already shutdown, ignoring batch")
+            return False
+        if not isinstance(data, self._request_type):
+            data = self._encode(data)
+        body = self._compress(data.SerializeToString())
+        deadline = time.time() + self._timeout
+        for retry in range(_MAX_RETRIES):
+            status = None
+            try:
+                response = self._session.post(
+                    self._url,
+                    data=body,
+                    headers=self._headers,
+                    timeout=max(deadline - time.time(), 0.001),
+                )
+                if response.ok:
+                    return True
+                status = response.status_code
+                if status not in _RETRYABLE_STATUS_CODES:
+                    _logger.error(
+                        f"Failed to export to {self._url}, status: {status}, reason: {response.text}"
+                    )
+                    record_rejection()
+                    return False
+            except requests.RequestException as e:
+                status = e
+            backoff = 2**retry * random.uniform(0.8, 1.2)
+            if retry + 1 == _MAX_RETRIES or backoff > deadline - time.time():
+                break
+            _logger.warning(
+                f"Transient error {status} exporting to {self._url}, retrying in {backoff:.2f}s."
+            )
+            if self._shutdown.wait(backoff):
+                break
+        _logger.error(f"Failed to export to {self._url}: {status}")
+        return False
+
+    def _close(self):
+        # The session is shared with the other signals and stays open.
+        self._shutdown.set()
+
+
+class OTLPHTTPSpanExporter(_OTLPHTTPExporter, SpanExporter):
+    _path = "/v1/traces"
+    _request_type = ExportTraceServiceRequest
+
+    def _encode(self, spans: Sequence[ReadableSpan]):
+        return encode_spans(spans)
+
+    def export(self, spans) -> SpanExportResult:
+        if self._post(spans):
+            return SpanExportResult.SUCCESS
+        return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        self._close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+class OTLPHTTPMetricExporter(_OTLPHTTPExporter, OTLPMetricExporterMixin, MetricExporter):
+    _path = "/v1/metrics"
+    _request_type = ExportMetricsServiceRequest
+
+    def __init__(self, *args, **kwargs):
+        _OTLPHTTPExporter.__init__(self, *args, **kwargs)
+        self._common_configuration()
+
+    def _encode(self, metrics_data):
+        return encode_metrics(metrics_data)
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        if self._post(metrics_data):
+            return MetricExportResult.SUCCESS
+        return MetricExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._close()
+
+
+class OTLPHTTPLogExporter(_OTLPHTTPExporter, LogExporter):
+    _path = "/v1/logs"
+    _request_type = ExportLogsServiceRequest
+
+    def _encode(self, batch: Sequence[LogData]):
+        return encode_logs(batch)
+
+    def export(self, batch) -> LogExportResult:
+        if self._post(batch):
+            return LogExportResult.SUCCESS
+        return LogExportResult.FAILURE
+
+    def shutdown(self):
+        self._close()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
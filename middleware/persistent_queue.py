@@ -0,0 +1,430 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+import logging
+from typing import Callable, Optional
+from opentelemetry.context import (
+    _SUPPRESS_INSTRUMENTATION_KEY,
+    attach,
+    create_key,
+    detach,
+    get_value,
+    set_value,
+)
+from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.proto.collector.logs.v1.logs_service_pb2 import (
+    ExportLogsServiceRequest,
+)
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from middleware.export_errors import reset_rejection, was_rejected
+from middleware.fork import register_at_fork_reinit
+
+_logger = logging.getLogger(__name__)
+
+# File header: magic, write position and read position. Positions count
+# bytes since the file was created so they never wrap.
+_MAGIC = b"MWPQ0001"
+_HEADER = struct.Struct("=8sQQ")
+_POSITIONS = struct.Struct("=QQ")
+_POSITIONS_OFFSET = 8
+# Record header: payload length, payload crc32 and spill time (seconds).
+_RECORD = struct.Struct("=IId")
+
+# Batches older than this are not worth replaying.
+_MAX_RECORD_AGE = 3600.0
+
+# Replay backoff (seconds) after a failed export, doubled up to the max.
+_MIN_BACKOFF = 1.0
+_MAX_BACKOFF = 60.0
+
+# Set in the context of the exports of queued batches.
+_REPLAY_KEY = create_key("mw-export-replay")
+
+SIGNAL_SPANS = "spans"
+SIGNAL_METRICS = "metrics"
+SIGNAL_LOGS = "logs"
+
+
+class PersistentQueue:
+    """
+    A FIFO of byte records in a memory mapped file of `capacity` bytes.
+
+    Records are framed with their length and crc32 and may wrap around the
+    end of the file. The header positions are only moved once a record is
+    fully written or fully consumed and the mapping is flushed after each
+    change, so after a crash the queue holds every record appended before
+    it. A record failing its crc, e.g. after a torn write, drops the rest of
+    the queue rather than replaying garbage.
+
+    When a record does not fit, the oldest records are dropped to make room:
+    the file never grows past `capacity`.
+    """
+
+    def __init__(self, path: str, capacity: int, fd: int):
+        self.path = path
+        self.capacity = capacity
+        self.dropped = 0
+        self._fd = fd
+        size = _HEADER.size + capacity
+        # Records of a file with another capacity would be read at the
+        # wrong offsets.
+        resized = os.fstat(fd).st_size != size
+        if resized:
+            os.ftruncate(fd, size)
+        self._mmap = mmap.mmap(fd, size)
+        magic, write, read = _HEADER.unpack_from(self._mmap, 0)
+        if resized or magic != _MAGIC or read > write or write - read > capacity:
+            if magic == _MAGIC:
+                _logger.debug(f"Resetting export queue {path}")
+            _HEADER.pack_into(self._mmap, 0, _MAGIC, 0, 0)
+            self._mmap.flush()
+
+    def _positions(self) -> tuple:
+        return _POSITIONS.unpack_from(self._mmap, _POSITIONS_OFFSET)
+
+    def _set_positions(self, write: int, read: int):
+        _POSITIONS.pack_into(self._mmap, _POSITIONS_OFFSET, write, read)
+        self._mmap.flush()
+
+    def _copy_in(self, position: int, data: bytes):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        base = _HEADER.size
+        self._mmap[base + start : base + start + first] = data[:first]
+        if first < len(data):
+            self._mmap[base : base + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        base = _HEADER.size
+        data = self._mmap[base + start : base + start + first]
+        if first < length:
+            data += self._mmap[base : base + length - first]
+        return data
+
+    def __len__(self) -> int:
+        write, read = self._positions()
+        return write - read
+
+    def append(self, payload: bytes) -> bool:
+        size = _RECORD.size + len(payload)
+        if size > self.capacity:
+            self.dropped += 1
+            return False
+        write, read = self._positions()
+        while size > self.capacity - (write - read):
+            length = _RECORD.unpack(self._copy_out(read, _RECORD.size))[0]
+            read += _RECORD.size + length
+            self.dropped += 1
+        self._copy_in(
+            write, _RECORD.pack(len(payload), zlib.crc32(payload), time.time())
+        )
+        self._copy_in(write + _RECORD.size, payload)
+        self._mmap.flush()
+        self._set_positions(write + size, read)
+        return True
+
+    def peek(self) -> Optional[tuple]:
+        """
+        Returns the oldest record as (payload, spill time, read position,
+        next read position), None if the queue is empty.
+        """
+        write, read = self._positions()
+        if read == write:
+            return None
+        length, crc, spilled_at = _RECORD.unpack(self._copy_out(read, _RECORD.size))
+        end = read + _RECORD.size + length
+        payload = None
+        if end <= write:
+            payload = self._copy_out(read + _RECORD.size, length)
+        if payload is None or zlib.crc32(payload) != crc:
+            _logger.debug(f"Dropping corrupted records of export queue {self.path}")
+            self._set_positions(write, write)
+            return None
+        return payload, spilled_at, read, end
+
+    def pop(self, read: int, position: int) -> bool:
+        """
+        Consumes the record `peek` returned at `read`, moving the read
+        position to `position`. Returns False, leaving the queue as it is,
+        if appends evicted the record since.
+        """
+        write, current = self._positions()
+        if current != read:
+            return False
+        self._set_positions(write, position)
+        return True
+
+    def close(self):
+        try:
+            self._mmap.close()
+            os.close(self._fd)
+        except Exception as e:
+            _logger.debug(f"Failed to close export queue {self.path}: {e}")
+
+
+def replaying() -> bool:
+    """Returns whether the current export is the replay of a queued batch."""
+    return bool(get_value(_REPLAY_KEY))
+
+
+def open_queue(directory: str, signal: str, capacity: int) -> Optional[PersistentQueue]:
+    """
+    Opens the first queue file of `signal` in `directory` no other process
+    holds, so every process of an application gets its own file and a
+    restarted process replays the files of the processes that stopped.
+    """
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        _logger.error(f"Cannot create the export queue directory {directory}: {e}")
+        return None
+    index = 0
+    while True:
+        path = os.path.join(directory, f"{signal}-{index}.queue")
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            _logger.error(f"Cannot open the export queue {path}: {e}")
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            index += 1
+            continue
+        try:
+            return PersistentQueue(path, capacity, fd)
+        except Exception as e:
+            os.close(fd)
+            _logger.error(f"Cannot map the export queue {path}: {e}")
+            return None
+
+
+class _PersistentExporter:
+    """
+    Spills the batches `exporter` fails to export to a `PersistentQueue` as
+    encoded OTLP requests, unless the target rejected them (see
+    `middleware.export_errors`), and replays them in order from a background
+    thread, backing off while the endpoint stays unreachable.
+
+    While the queue holds batches, new batches are appended behind them
+    instead of being exported directly, so telemetry reaches the endpoint in
+    the order it was produced. Batches queued by a previous run of the
+    application are replayed as well.
+    """
+
+    def __init__(self, exporter, queue: PersistentQueue, encode: Callable, decode: Callable):
+        self._exporter = exporter
+        self._queue = queue
+        self._encode = encode
+        self._decode = decode
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._wakeup = threading.Event()
+        self._replayer = None
+        if len(queue):
+            with self._lock:
+                self._start_replay()
+        register_at_fork_reinit(self._at_fork_reinit)
+
+    def _at_fork_reinit(self):
+        # The queue file belongs to the parent, the child builds its own
+        # exporter (see `_ForkAwareExporter`).
+        self._shutdown = True
+        self._queue.close()
+
+    def _start_replay(self):
+        """Starts the replay thread if it is not running, must hold the lock."""
+        if self._replayer is None and not self._shutdown:
+            self._replayer = threading.Thread(
+                name="MWExportReplay", target=self._replay, daemon=True
+            )
+            self._replayer.start()
+
+    def _spill(self, batch) -> bool:
+        try:
+            payload = self._encode(batch).SerializeToString()
+        except Exception as e:
+            _logger.debug(f"Failed to encode batch for the export queue: {e}")
+            return False
+        with self._lock:
+            if self._shutdown:
+                return False
+            spilled = self._queue.append(payload)
+            self._start_replay()
+        return spilled
+
+    def _export(self, batch, export: Callable, success):
+        if self._shutdown:
+            return export(batch)
+        if not len(self._queue):
+            reset_rejection()
+            result = export(batch)
+            if result is success:
+                return success
+            # A batch the target rejected would be rejected again on replay.
+            if not was_rejected() and self._spill(batch):
+                return success
+            return result
+        if self._spill(batch):
+            return success
+        return export(batch)
+
+    def _replay(self):
+        backoff = _MIN_BACKOFF
+        while True:
+            with self._lock:
+                record = None if self._shutdown else self._queue.peek()
+                if record is None:
+                    self._replayer = None
+                    return
+            payload, spilled_at, read, position = record
+            exported = time.time() - spilled_at > _MAX_RECORD_AGE
+            if not exported:
+                reset_rejection()
+                # Like the SDK batch processors, so the requests of the
+                # export are not traced themselves.
+                token = attach(
+                    set_value(_REPLAY_KEY, True, set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+                )
+                try:
+                    exported = self._replay_payload(self._decode(payload))
+                except Exception as e:
+                    _logger.debug(f"Failed to replay queued batch: {e}")
+                finally:
+                    detach(token)
+                if not exported and was_rejected():
+                    # Replaying it again would only hold the batches behind.
+                    _logger.debug("Dropping queued batch rejected by the target")
+                    self._queue.dropped += 1
+                    exported = True
+            if exported:
+                # Batches spilled during the export may have evicted the
+                # record, which is then already gone.
+                with self._lock:
+                    if not self._shutdown:
+                        self._queue.pop(read, position)
+                backoff = _MIN_BACKOFF
+                continue
+            if self._wakeup.wait(backoff):
+                return
+            backoff = min(backoff * 2, _MAX_BACKOFF)
+
+    def _close(self):
+        # Queued batches stay on disk for the next run.
+        with self._lock:
+            self._shutdown = True
+            self._queue.close()
+        self._wakeup.set()
+
+
+class PersistentSpanExporter(_PersistentExporter, SpanExporter):
+    def __init__(self, exporter: SpanExporter, queue: PersistentQueue):
+        super().__init__(
+            exporter, queue, encode_spans, ExportTraceServiceRequest.FromString
+        )
+
+    def export(self, spans):
+        return self._export(spans, self._exporter.export, SpanExportResult.SUCCESS)
+
+    def _replay_payload(self, request) -> bool:
+        return self._exporter.export(request) is SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self._close()
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class PersistentMetricExporter(_PersistentExporter, MetricExporter):
+    def __init__(self, exporter: MetricExporter, queue: PersistentQueue):
+        _PersistentExporter.__init__(
+            self, exporter, queue, self._encode_metrics, ExportMetricsServiceRequest.FromString
+        )
+        MetricExporter.__init__(
+            self,
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+
+    @staticmethod
+    def _encode_metrics(metrics_data):
+        if isinstance(metrics_data, ExportMetricsServiceRequest):
+            return metrics_data
+        return encode_metrics(metrics_data)
+
+    def export(self, metrics_data, timeout_millis: float = 10_000, **kwargs):
+        return self._export(
+            metrics_data,
+            lambda data: self._exporter.export(data, timeout_millis=timeout_millis, **kwargs),
+            MetricExportResult.SUCCESS,
+        )
+
+    def _replay_payload(self, request) -> bool:
+        return self._exporter.export(request) is MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._close()
+        return self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class PersistentLogExporter(_PersistentExporter, LogExporter):
+    def __init__(self, exporter: LogExporter, queue: PersistentQueue):
+        super().__init__(
+            exporter, queue, encode_logs, ExportLogsServiceRequest.FromString
+        )
+
+    def export(self, batch):
+        return self._export(batch, self._exporter.export, LogExportResult.SUCCESS)
+
+    def _replay_payload(self, request) -> bool:
+        return self._exporter.export(request) is LogExportResult.SUCCESS
+
+    def shutdown(self):
+        self._close()
+        return self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+_PERSISTENT_EXPORTERS = {
+    SIGNAL_SPANS: PersistentSpanExporter,
+    SIGNAL_METRICS: PersistentMetricExporter,
+    SIGNAL_LOGS: PersistentLogExporter,
+}
+
+
+def persistent(exporter, signal: str, directory: Optional[str], capacity: int):
+    """
+    Returns `exporter` spilling failed batches of `signal` to a queue file
+    in `directory`, or `exporter` itself if no directory is set or the queue
+    cannot be opened.
+    """
+    if not directory:
+        return exporter
+    queue = open_queue(directory, signal, capacity)
+    if queue is None:
+        return exporter
+    return _PERSISTENT_EXPORTERS[signal](exporter, queue)
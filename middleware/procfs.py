@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import logging
+import psutil
+
+_logger = logging.getLogger(__name__)
+
+IS_LINUX = sys.platform.startswith("linux")
+
+# Initial size of the buffers the /proc files are read into. A buffer grows
+# when a file turns out to be larger, e.g. /proc/self/status on hosts with
+# many cpus.
+_DEFAULT_BUFFER_SIZE = 4096
+
+
+class ProcFile:
+    """
+    A procfs or sysfs file that is kept open and re-read in place.
+
+    Each read is a single `os.preadv` at offset 0 into a buffer allocated when
+    the file is opened, so no file objects or intermediate buffers are
+    created per read.
+    """
+
+    def __init__(self, path: str, size: int = _DEFAULT_BUFFER_SIZE):
+        self.path = path
+        self._buffer = bytearray(size)
+        self._fd = os.open(path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+
+    def read(self) -> bytes:
+        """Returns the current content of the file."""
+        size = os.preadv(self._fd, [self._buffer], 0)
+        while size == len(self._buffer):
+            self._buffer = bytearray(len(self._buffer) * 2)
+            size = os.preadv(self._fd, [self._buffer], 0)
+        return bytes(memoryview(self._buffer)[:size])
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def parse_keyed(data: bytes, keys: dict) -> dict:
+    """
+    Parses `key: value` lines of a proc file, keeping only the wanted keys.
+    `keys` maps the raw key to the name it is returned as.
+    """
+    values = {}
+    for line in data.splitlines():
+        key, _, value = line.partition(b":")
+        name = keys.get(key)
+        if name is not None:
+            values[name] = int(value.split()[0])
+    return values
+
+
+_IO_KEYS = {b"read_bytes": "read_bytes", b"write_bytes": "write_bytes"}
+_STATUS_KEYS = {
+    b"voluntary_ctxt_switches": "voluntary",
+    b"nonvoluntary_ctxt_switches": "involuntary",
+}
+
+
+class ProcfsReader:
+    """
+    Reads the normal tier of `middleware.metrics.ProcessSnapshot` straight
+    from `/proc/self/{stat,statm,io,status}` instead of going through psutil.
+
+    The files stay open between collections. Since an open `/proc/self`
+    file keeps pointing at the process that opened it, they are reopened
+    when the pid changes (after a fork).
+    """
+
+    def __init__(self):
+        if not IS_LINUX:
+            raise OSError("procfs metrics are only available on Linux")
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._total_memory = psutil.virtual_memory().total
+        self._boot_time = psutil.boot_time()
+        self._pid = None
+        self._stat = None
+        self._statm = None
+        self._io = None
+        self._status = None
+        self._last_cpu_time = None
+        self._last_wall_time = None
+        self._open()
+
+    def _open(self):
+        self.close()
+        self._pid = os.getpid()
+        self._stat = ProcFile("/proc/self/stat")
+        self._statm = ProcFile("/proc/self/statm")
+        self._status = ProcFile("/proc/self/status")
+        try:
+            self._io = ProcFile("/proc/self/io")
+        except OSError as e:
+            # /proc/self/io needs ptrace access, which some sandboxes deny.
+            _logger.debug(f"Cannot open /proc/self/io: {e}")
+        self._last_cpu_time = None
+        self._last_wall_time = None
+
+    def close(self):
+        for proc_file in (self._stat, self._statm, self._io, self._status):
+            if proc_file is not None:
+                proc_file.close()
+        self._stat = self._statm = self._io = self._status = None
+
+    def read(self, snapshot):
+        """Fills the normal tier fields of the given snapshot."""
+        if self._pid != os.getpid():
+            self._open()
+
+        stat = self._stat.read()
+        fields = stat[stat.rindex(b")") + 2 :].split()
+        ticks = self._clock_ticks
+        snapshot.cpu_user = int(fields[11]) / ticks
+        snapshot.cpu_system = int(fields[12]) / ticks
+        snapshot.cpu_children_user = int(fields[13]) / ticks
+        snapshot.cpu_children_system = int(fields[14]) / ticks
+        snapshot.num_threads = int(fields[17])
+        snapshot.create_time = self._boot_time + int(fields[19]) / ticks
+        snapshot.cpu_iowait = int(fields[39]) / ticks if len(fields) > 39 else None
+
+        # Same definition as psutil's cpu_percent(): cpu time spent since the
+        # previous read over the wall time elapsed, 0.0 on the first read.
+        cpu_time = snapshot.cpu_user + snapshot.cpu_system
+        wall_time = time.monotonic()
+        if self._last_wall_time is None or wall_time <= self._last_wall_time:
+            snapshot.cpu_percent = 0.0
+        else:
+            snapshot.cpu_percent = round(
+                (cpu_time - self._last_cpu_time)
+                / (wall_time - self._last_wall_time)
+                * 100,
+                1,
+            )
+        self._last_cpu_time = cpu_time
+        self._last_wall_time = wall_time
+
+        statm = self._statm.read().split()
+        page_size = self._page_size
+        snapshot.memory_vms = int(statm[0]) * page_size
+        snapshot.memory_rss = int(statm[1]) * page_size
+        snapshot.memory_shared = int(statm[2]) * page_size
+        snapshot.memory_text = int(statm[3]) * page_size
+        snapshot.memory_data = int(statm[5]) * page_size
+        snapshot.memory_percent = snapshot.memory_rss / self._total_memory * 100
+
+        status = parse_keyed(self._status.read(), _STATUS_KEYS)
+        snapshot.ctx_voluntary = status.get("voluntary")
+        snapshot.ctx_involuntary = status.get("involuntary")
+
+        if self._io is not None:
+            io = parse_keyed(self._io.read(), _IO_KEYS)
+            snapshot.io_read_bytes = io.get("read_bytes")
+            snapshot.io_write_bytes = io.get("write_bytes")
+
+        snapshot.num_fds = len(os.listdir("/proc/self/fd"))
+        snapshot.cpu_affinity = len(os.sched_getaffinity(0))
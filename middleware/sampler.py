@@ -1,77 +1,250 @@
+import itertools
+import math
+import threading
+import time
+from collections.abc import Mapping
 from logging import getLogger
 from typing import Optional
 
 from opentelemetry.sdk.trace.sampling import (
-    ALWAYS_OFF,
-    ALWAYS_ON,
     TraceIdRatioBased,
+    Decision,
     Sampler,
     SamplingResult,
 )
 
-from opentelemetry.trace import Link, SpanKind
+from opentelemetry.trace import Link, SpanKind, get_current_span
 from opentelemetry.trace.span import TraceState
 from opentelemetry.util.types import Attributes
 from opentelemetry.context import Context
 
-from middleware.options import DEFAULT_SAMPLE_RATE, MWOptions
+from middleware.options import (
+    DEFAULT_SAMPLE_RATE,
+    SAMPLER_DETERMINISTIC,
+    SAMPLER_DYNAMIC,
+    SAMPLER_PARENTBASED_DETERMINISTIC,
+    SAMPLER_RATE_LIMITING,
+    MWOptions,
+)
 
 _logger = getLogger(__name__)
 
+SAMPLE_RATE = "SampleRate"
+
+# Sampling results without caller attributes are shared per sample rate. A
+# varying sample rate (rate limiting) can produce many values, the cache is
+# cleared when it grows past this.
+_MAX_CACHED_RESULTS = 64
+
+# Key the dynamic sampler counts spans under once it tracks `max_keys` keys.
+_OVERFLOW_KEY = ("", None)
+
 
 def configure_sampler(
     options: Optional[MWOptions] = None,
 ):
     """Configures and returns an OpenTelemetry Sampler that is
-    configured based on the sample_rate determined in MWOptions.
-    The configuration initializes a DeterministicSampler with
-    an inner sampler of either AlwaysOn (1), AlwaysOff (0),
-    or a TraceIdRatio as 1/N.
+    configured based on the sampler and sample_rate determined in
+    MWOptions:
 
-    These samplers do not take into account the parent span's
-    sampling decision.
+    - `deterministic` samples 1/N traces from the trace id. It does
+      not take into account the parent span's sampling decision.
+    - `parentbased_deterministic` follows the decision of the parent
+      span and samples 1/N root spans from the trace id.
+    - `rate_limiting` follows the decision of the parent span, samples
+      1/N root spans and never more than `sampler_rate_limit` per second.
+    - `dynamic` follows the decision of the parent span and adapts the
+      rate of root spans per span name and `sampler_key_attribute` to
+      sample about `sampler_target_rate` spans per second.
+
+    A sample_rate of 1 samples everything and 0 (or less) nothing.
 
     Args:
         options (MWOptions): the MWOptions containing
-        sample_rate used to configure the deterministic sampler.
+        sampler and sample_rate used to configure the sampler.
 
     Returns:
-        DeterministicSampler: the configured Sampler based on sample_rate
+        Sampler: the configured Sampler based on sampler and sample_rate
     """
     if options is None:
         return DeterministicSampler(DEFAULT_SAMPLE_RATE)
 
-    return DeterministicSampler(options.sample_rate)
+    record_unsampled = options.collect_span_metrics
+    # Tail sampling takes the decision once traces end, every span has to
+    # reach it.
+    if options.tail_sampling:
+        return DeterministicSampler(1, record_unsampled=record_unsampled)
+
+    if options.sampler == SAMPLER_PARENTBASED_DETERMINISTIC:
+        return ParentBasedDeterministicSampler(
+            options.sample_rate, record_unsampled=record_unsampled
+        )
+    if options.sampler == SAMPLER_RATE_LIMITING:
+        return RateLimitingSampler(
+            options.sample_rate,
+            options.sampler_rate_limit,
+            record_unsampled=record_unsampled,
+        )
+    if options.sampler == SAMPLER_DYNAMIC:
+        return DynamicSampler(
+            options.sampler_target_rate,
+            options.sampler_key_attribute,
+            options.sampler_window,
+            options.sampler_max_keys,
+            record_unsampled=record_unsampled,
+        )
+    if options.sampler != SAMPLER_DETERMINISTIC:
+        _logger.warning(
+            f"Unknown sampler {options.sampler}, using {SAMPLER_DETERMINISTIC}"
+        )
+    return DeterministicSampler(
+        options.sample_rate, record_unsampled=record_unsampled
+    )
+
+
+class _SampleRateAttributes(Mapping):
+    """
+    Read-only view of the attributes given to the sampler with the
+    SampleRate attribute added. `Tracer.start_span` copies the attributes
+    of the sampling result, `copy` builds that dict directly, so it is the
+    only dict built per span and the caller's dict is never modified.
+    """
+
+    __slots__ = ("_attributes", "_sample_rate")
+
+    def __init__(self, attributes: Attributes, sample_rate: int):
+        self._attributes = attributes
+        self._sample_rate = sample_rate
+
+    def __getitem__(self, key):
+        if key == SAMPLE_RATE:
+            return self._sample_rate
+        return self._attributes[key]
+
+    def __iter__(self):
+        yield from self._attributes
+        if SAMPLE_RATE not in self._attributes:
+            yield SAMPLE_RATE
+
+    def __len__(self):
+        return len(self._attributes) + (SAMPLE_RATE not in self._attributes)
+
+    def copy(self) -> dict:
+        attributes = dict(self._attributes)
+        attributes[SAMPLE_RATE] = self._sample_rate
+        return attributes
 
 
-class DeterministicSampler(Sampler):
-    """Implementation of :class:`Sampler` that uses an inner sampler
-    of either AlwaysOn (1), AlwaysOff (0), or a TraceIdRatio as 1/N
-    to determine a SamplingResult and SamplingDecision for a given span
-    in a trace. We append a SampleRate attribute to the span with the
-    given sample rate.
+def _parent_span_context(parent_context: Optional[Context]):
+    span_context = get_current_span(parent_context).get_span_context()
+    return span_context if span_context.is_valid else None
+
+
+def _parent_sample_rate(parent_context: Optional[Context], default: int) -> int:
+    """Returns the SampleRate of a local parent span, `default` otherwise."""
+    attributes = getattr(get_current_span(parent_context), "attributes", None)
+    if attributes:
+        return attributes.get(SAMPLE_RATE, default)
+    return default
+
+
+class _MWSampler(Sampler):
+    """
+    Builds the sampling results of our samplers. Results of spans without
+    attributes and without a parent trace state, the common case, are built
+    once and shared.
+    """
+
+    def __init__(self, record_unsampled: bool = False):
+        self.record_unsampled = record_unsampled
+        self._unsampled_decision = (
+            Decision.RECORD_ONLY if record_unsampled else Decision.DROP
+        )
+        self._unsampled_result = SamplingResult(self._unsampled_decision)
+        self._sampled_results = {}
+
+    def _sampled(
+        self,
+        sample_rate: int,
+        attributes: Attributes,
+        trace_state: Optional[TraceState],
+    ) -> SamplingResult:
+        if attributes is None and not trace_state:
+            result = self._sampled_results.get(sample_rate)
+            if result is None:
+                if len(self._sampled_results) >= _MAX_CACHED_RESULTS:
+                    self._sampled_results.clear()
+                result = self._sampled_results[sample_rate] = SamplingResult(
+                    Decision.RECORD_AND_SAMPLE, {SAMPLE_RATE: sample_rate}
+                )
+            return result
+        return SamplingResult(
+            Decision.RECORD_AND_SAMPLE,
+            _SampleRateAttributes(attributes or {}, sample_rate),
+            trace_state,
+        )
+
+    def _unsampled(self, trace_state: Optional[TraceState]) -> SamplingResult:
+        if not trace_state:
+            return self._unsampled_result
+        return SamplingResult(self._unsampled_decision, None, trace_state)
+
+
+class DeterministicSampler(_MWSampler):
+    """Implementation of :class:`Sampler` that samples either every
+    span (1), no span (0), or 1/N traces chosen from the trace id like
+    `TraceIdRatioBased`, to determine a SamplingResult and
+    SamplingDecision for a given span in a trace. We append a
+    SampleRate attribute to the span with the given sample rate.
+
+    With `record_unsampled`, spans that are not sampled are recorded
+    instead of dropped: span processors see them end (e.g. to aggregate
+    span metrics) but they are not exported.
 
     Note: These samplers do not take into account the parent span's
     sampling decision.
     """
 
-    def __init__(self, rate: int):
+    def __init__(self, rate: int, record_unsampled: bool = False):
+        super().__init__(record_unsampled)
         self.rate = rate
+        if self.rate > 0 and self.rate != 1:
+            self._bound = TraceIdRatioBased.get_bound_for_rate(1.0 / self.rate)
 
+    def _sample_trace(self, trace_id: int) -> bool:
         if self.rate <= 0:
-            # Sampler that never samples spans, regardless of the
-            # parent span's sampling decision
-            self._sampler = ALWAYS_OFF
+            return False
+        if self.rate == 1:
+            return True
+        return trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._bound
 
-        elif self.rate == 1:
-            # Sampler that always samples spans, regardless of the
-            # parent span's sampling decision
-            self._sampler = ALWAYS_ON
+    # pylint: disable=too-many-arguments
+    def should_sample(
+        self,
+        parent_context: Context,
+        trace_id: int,
+        name: str,
+        kind: SpanKind = None,
+        attributes: Attributes = None,
+        links: Link = None,
+        trace_state: "TraceState" = None,
+    ) -> "SamplingResult":
+        parent = _parent_span_context(parent_context)
+        parent_trace_state = parent.trace_state if parent is not None else None
+        if self._sample_trace(trace_id):
+            return self._sampled(self.rate, attributes, parent_trace_state)
+        return self._unsampled(parent_trace_state)
+
+    def get_description(self) -> str:
+        return "MWDeterministicSampler"
 
-        else:
-            # Sampler that samples probabilistically based on rate..
-            ratio = 1.0 / self.rate
-            self._sampler = TraceIdRatioBased(ratio)
+
+class ParentBasedDeterministicSampler(DeterministicSampler):
+    """A :class:`DeterministicSampler` for root spans that follows the
+    sampling decision of the parent span, local or remote, for every
+    other span, so traces are never broken up. Spans with a local parent
+    get the SampleRate of their parent.
+    """
 
     # pylint: disable=too-many-arguments
     def should_sample(
@@ -84,16 +257,178 @@ class DeterministicSampler(Sampler):
         links: Link = None,
         trace_state: "TraceState" = None,
     ) -> "SamplingResult":
-        # append our SampleRate field to attributes
-        sample_rate = {"SampleRate": self.rate}
-        if attributes is None:
-            attributes = sample_rate
+        parent = _parent_span_context(parent_context)
+        if parent is None:
+            sample_rate = self._sample_root(trace_id, name, attributes)
+            if sample_rate:
+                return self._sampled(sample_rate, attributes, None)
+            return self._unsampled(None)
+        if parent.trace_flags.sampled:
+            return self._sampled(
+                _parent_sample_rate(parent_context, self.rate),
+                attributes,
+                parent.trace_state,
+            )
+        return self._unsampled(parent.trace_state)
+
+    def _sample_root(self, trace_id: int, name: str, attributes: Attributes) -> int:
+        """Returns the SampleRate of a sampled root span, 0 if it is not sampled."""
+        return self.rate if self._sample_trace(trace_id) else 0
+
+    def get_description(self) -> str:
+        return "MWParentBasedDeterministicSampler"
+
+
+class RateLimitingSampler(ParentBasedDeterministicSampler):
+    """A :class:`ParentBasedDeterministicSampler` that samples at most
+    `spans_per_second` root spans per second, so bursts of traffic do not
+    turn into bursts of exports.
+
+    Root spans are counted in fixed one-second windows with
+    `itertools.count`, whose `next` is atomic, so the hot path takes no
+    lock. Threads racing on a window change may let a few extra spans
+    through. The SampleRate attribute of a root span is its sample rate
+    multiplied by the ratio of sampled root spans to admitted ones in the
+    previous window, so the backend can still reweight them. The weight
+    lags the traffic by one window, and is 1 after a window without
+    sampled root spans.
+    """
+
+    def __init__(
+        self, rate: int, spans_per_second: int, record_unsampled: bool = False
+    ):
+        super().__init__(rate, record_unsampled)
+        self.spans_per_second = spans_per_second
+        self._window = None
+        self._candidates = itertools.count()
+        self._admitted = itertools.count()
+        self._throttle = 1
+
+    def _admit(self) -> bool:
+        window = int(time.monotonic())
+        if window != self._window:
+            candidates = next(self._candidates)
+            if (
+                self._window is not None
+                and window == self._window + 1
+                and self.spans_per_second > 0
+            ):
+                # Rounded up, so SampleRate stays an integer.
+                self._throttle = max(1, -(-candidates // self.spans_per_second))
+            else:
+                # No traffic in the window right before, e.g. after an idle gap.
+                self._throttle = 1
+            self._window = window
+            self._candidates = itertools.count()
+            self._admitted = itertools.count()
+        next(self._candidates)
+        return next(self._admitted) < self.spans_per_second
+
+    def _sample_root(self, trace_id: int, name: str, attributes: Attributes) -> int:
+        if self._sample_trace(trace_id) and self._admit():
+            return self.rate * self._throttle
+        return 0
+
+    def get_description(self) -> str:
+        return "MWRateLimitingSampler"
+
+
+def fair_share_rates(counts: dict, budget: float) -> dict:
+    """
+    Splits `budget` spans between keys seen `counts` times each, giving
+    every key the same share and handing the share a key does not use over
+    to the busier keys. Returns the sample rate (1/N) of each key.
+    """
+    rates = {}
+    remaining_keys = len(counts)
+    for key, count in sorted(counts.items(), key=lambda item: item[1]):
+        share = budget / remaining_keys
+        remaining_keys -= 1
+        if count <= share:
+            rates[key] = 1
+            budget -= count
         else:
-            attributes.update(sample_rate)
-        # using _sampler logic based on rate (OFF, ON, TraceIdRatio)
-        return self._sampler.should_sample(
-            parent_context, trace_id, name, kind, attributes, links, trace_state
-        )
+            rates[key] = max(1, math.ceil(count / share)) if share > 0 else count
+            budget -= count / rates[key]
+    return rates
+
+
+class DynamicSampler(ParentBasedDeterministicSampler):
+    """A :class:`ParentBasedDeterministicSampler` that adapts the sample
+    rate of root spans to the traffic of each key, the span name and the
+    value of `key_attribute` (e.g. `http.route`).
+
+    Root spans are counted per key over windows of `window` seconds. At the
+    end of each window the rates of the next one are computed so that about
+    `spans_per_second` root spans are sampled, shared fairly between keys:
+    a rare key keeps all its spans while a key taking most of the traffic
+    is sampled down (see `fair_share_rates`). Keys seen for the first time
+    are sampled fully until the next window. The SampleRate attribute of
+    each span is the rate of its key, so the backend can reweight them.
+
+    At most `max_keys` keys are tracked per window, other keys share one
+    overflow key. Counting is not locked, concurrent spans may be missed
+    by a count, which only nudges the next rates.
+    """
+
+    def __init__(
+        self,
+        spans_per_second: int,
+        key_attribute: Optional[str],
+        window: float,
+        max_keys: int,
+        record_unsampled: bool = False,
+    ):
+        super().__init__(1, record_unsampled)
+        self.spans_per_second = spans_per_second
+        self.key_attribute = key_attribute
+        self.window = window
+        self.max_keys = max_keys
+        self._counts = {}
+        self._rates = {}
+        self._window_end = time.monotonic() + window
+        self._roll_lock = threading.Lock()
+
+    def _key(self, name: str, attributes: Attributes):
+        value = None
+        if self.key_attribute and attributes:
+            value = attributes.get(self.key_attribute)
+        key = (name, value)
+        counts = self._counts
+        if key not in counts and len(counts) >= self.max_keys:
+            return _OVERFLOW_KEY
+        return key
+
+    def _roll(self, now: float):
+        if not self._roll_lock.acquire(blocking=False):
+            return
+        try:
+            if now < self._window_end:
+                return
+            counts, self._counts = self._counts, {}
+            rates = fair_share_rates(counts, self.spans_per_second * self.window)
+            self._rates = {
+                key: (rate, TraceIdRatioBased.get_bound_for_rate(1.0 / rate))
+                for key, rate in rates.items()
+            }
+            self._window_end = now + self.window
+        finally:
+            self._roll_lock.release()
+
+    def _sample_root(self, trace_id: int, name: str, attributes: Attributes) -> int:
+        now = time.monotonic()
+        if now >= self._window_end:
+            self._roll(now)
+        key = self._key(name, attributes)
+        counts = self._counts
+        counts[key] = counts.get(key, 0) + 1
+        rate = self._rates.get(key)
+        if rate is None:
+            return 1
+        sample_rate, bound = rate
+        if trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < bound:
+            return sample_rate
+        return 0
 
     def get_description(self) -> str:
-        return "MWDeterministicSampler"
+        return "MWDynamicSampler"
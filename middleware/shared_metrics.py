@@ -0,0 +1,277 @@
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+import logging
+from typing import List, Optional
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.sdk.environment_variables import OTEL_METRIC_EXPORT_INTERVAL
+from opentelemetry.sdk.metrics.export import (
+    MetricExporter,
+    MetricExportResult,
+    MetricsData,
+)
+from middleware.options import MWOptions
+
+_logger = logging.getLogger(__name__)
+
+# Slot header: sequence counter, owner pid, heartbeat (wall clock seconds),
+# payload generation and payload length.
+_SLOT_HEADER = struct.Struct("=QqdQQ")
+_SEQUENCE = struct.Struct("=Q")
+
+# A process that has not exported for this many export intervals is no
+# longer considered alive: it can neither lead nor have its metrics exported.
+_STALE_INTERVALS = 3
+
+_DEFAULT_EXPORT_INTERVAL_MILLIS = 60000
+
+_segment = None
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedMetricsSegment:
+    """
+    A shared memory segment with one slot per process, through which prefork
+    workers hand their encoded metrics over to a single exporting process.
+
+    The segment is an anonymous shared mapping, so it has to be created before
+    the workers are forked. Each slot has a single writer, the process owning
+    it, and is guarded by a sequence counter: the writer makes the counter odd
+    while the slot is being written, and a reader drops what it copied if the
+    counter was odd or changed meanwhile. Slots are claimed under a
+    process-shared lock, and slots of processes that exited are reused.
+
+    The leader is the owner of the first slot whose heartbeat is younger than
+    `stale_after` seconds, so leadership moves on by itself when the leader
+    exits or stops exporting.
+    """
+
+    def __init__(self, slots: int, slot_size: int, stale_after: float):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stale_after = stale_after
+        self.slot = None
+        self._stride = _SLOT_HEADER.size + slot_size
+        self._mmap = mmap.mmap(-1, slots * self._stride)
+        self._lock = multiprocessing.Lock()
+        self._generation = 0
+        self._consumed = {}
+
+    def claim(self) -> Optional[int]:
+        """Claims a free slot for the current process, e.g. after a fork."""
+        pid = os.getpid()
+        self.slot = None
+        self._generation = 0
+        self._consumed = {}
+        with self._lock:
+            for slot in range(self.slots):
+                owner = self._header(slot)[1]
+                if owner == 0 or owner == pid or not _is_alive(owner):
+                    self.slot = slot
+                    self._write(slot, pid, b"")
+                    break
+        if self.slot is None:
+            _logger.debug("No free metrics aggregation slot, exporting directly")
+        return self.slot
+
+    def release(self):
+        if self.slot is not None:
+            with self._lock:
+                self._write(self.slot, 0, b"")
+            self.slot = None
+
+    def _header(self, slot: int) -> tuple:
+        return _SLOT_HEADER.unpack_from(self._mmap, slot * self._stride)
+
+    def _write(self, slot: int, pid: int, payload: bytes):
+        offset = slot * self._stride
+        start = offset + _SLOT_HEADER.size
+        sequence = _SEQUENCE.unpack_from(self._mmap, offset)[0]
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 1)
+        self._mmap[start : start + len(payload)] = payload
+        self._generation += 1
+        _SLOT_HEADER.pack_into(
+            self._mmap,
+            offset,
+            sequence + 1,
+            pid,
+            time.time(),
+            self._generation,
+            len(payload),
+        )
+        _SEQUENCE.pack_into(self._mmap, offset, sequence + 2)
+
+    def _read(self, slot: int) -> Optional[tuple]:
+        offset = slot * self._stride
+        sequence, pid, heartbeat, generation, length = self._header(slot)
+        if sequence & 1 or length > self.slot_size:
+            return None
+        start = offset + _SLOT_HEADER.size
+        payload = self._mmap[start : start + length]
+        if _SEQUENCE.unpack_from(self._mmap, offset)[0] != sequence:
+            return None
+        return pid, heartbeat, generation, payload
+
+    def publish(self, payload: bytes) -> bool:
+        """Stores the encoded metrics of this process for the leader."""
+        if self.slot is None or len(payload) > self.slot_size:
+            return False
+        self._write(self.slot, os.getpid(), payload)
+        return True
+
+    def heartbeat(self):
+        if self.slot is not None:
+            self._write(self.slot, os.getpid(), b"")
+
+    def leader(self) -> Optional[int]:
+        now = time.time()
+        for slot in range(self.slots):
+            _, pid, heartbeat, _, _ = self._header(slot)
+            if pid and now - heartbeat < self.stale_after:
+                return slot
+        return None
+
+    def is_leader(self) -> bool:
+        return self.slot is not None and self.leader() == self.slot
+
+    def collect(self) -> List[bytes]:
+        """
+        Returns the metrics published by the other processes since the last
+        call, skipping processes that stopped exporting.
+        """
+        payloads = []
+        now = time.time()
+        for slot in range(self.slots):
+            if slot == self.slot:
+                continue
+            entry = self._read(slot)
+            if entry is None:
+                continue
+            pid, heartbeat, generation, payload = entry
+            if not pid or not payload or now - heartbeat >= self.stale_after:
+                continue
+            if self._consumed.get(slot) == (pid, generation):
+                continue
+            self._consumed[slot] = (pid, generation)
+            payloads.append(payload)
+        return payloads
+
+
+class AggregatingMetricExporter(MetricExporter):
+    """
+    Exports the metrics of every process sharing a `SharedMetricsSegment`
+    from the leader, in a single request where each process keeps its own
+    resource (and so its own `process.pid`).
+
+    Other processes only encode their metrics into their slot, they never
+    open a connection. Points keep the cumulative temporality of the OTLP
+    exporter, so a point handed over twice or skipped once while the
+    leadership moves does not skew the series.
+    """
+
+    def __init__(self, exporter: MetricExporter, segment: SharedMetricsSegment):
+        super().__init__(
+            preferred_temporality=exporter._preferred_temporality,
+            preferred_aggregation=exporter._preferred_aggregation,
+        )
+        self._exporter = exporter
+        self._segment = segment
+
+    def export(
+        self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs
+    ) -> MetricExportResult:
+        segment = self._segment
+        if segment.slot is None:
+            return self._exporter.export(
+                metrics_data, timeout_millis=timeout_millis, **kwargs
+            )
+
+        request = encode_metrics(metrics_data)
+        if not segment.is_leader():
+            if segment.publish(request.SerializeToString()):
+                return MetricExportResult.SUCCESS
+            _logger.debug("Metrics do not fit the aggregation slot, exporting directly")
+            return self._exporter.export(
+                request, timeout_millis=timeout_millis, **kwargs
+            )
+
+        segment.heartbeat()
+        for payload in segment.collect():
+            try:
+                request.resource_metrics.extend(
+                    ExportMetricsServiceRequest.FromString(payload).resource_metrics
+                )
+            except Exception as e:
+                _logger.debug(f"Failed to decode aggregated metrics: {e}")
+        return self._exporter.export(request, timeout_millis=timeout_millis, **kwargs)
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._segment.release()
+        return self._exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+def install_shared_metrics(
+    exporter: MetricExporter, options: MWOptions
+) -> MetricExporter:
+    """
+    Wraps the metric exporter so that the metrics of all prefork workers are
+    exported by a single elected process.
+
+    Must be called in the parent before the workers are forked (e.g. with
+    gunicorn `--preload`), the workers claim their slot right after the fork.
+
+    Args:
+        exporter (MetricExporter): the exporter sending metrics to `options.target`
+        options (MWOptions): the middleware options to configure with
+
+    Returns:
+        MetricExporter: the aggregating exporter, or `exporter` if shared memory is not available
+    """
+    global _segment
+    if not hasattr(os, "register_at_fork"):
+        _logger.debug("Metrics aggregation requires fork support, exporting directly")
+        return exporter
+    try:
+        interval = float(
+            os.environ.get(OTEL_METRIC_EXPORT_INTERVAL, _DEFAULT_EXPORT_INTERVAL_MILLIS)
+        )
+    except ValueError:
+        interval = _DEFAULT_EXPORT_INTERVAL_MILLIS
+    try:
+        segment = SharedMetricsSegment(
+            slots=options.metrics_aggregation_slots,
+            slot_size=options.metrics_aggregation_slot_size,
+            stale_after=_STALE_INTERVALS * interval / 1e3,
+        )
+        segment.claim()
+    except Exception as e:
+        _logger.debug(f"Failed to set up metrics aggregation: {e}")
+        return exporter
+    _segment = segment
+    return AggregatingMetricExporter(exporter, segment)
+
+
+def collects_host_metrics() -> bool:
+    """
+    Tells whether this process reports the metrics shared by every worker of
+    the host or container, such as disk usage and cgroup limits.
+    """
+    segment = _segment
+    return segment is None or segment.slot is None or segment.is_leader()
@@ -0,0 +1,72 @@
+import collections
+import os
+import threading
+from typing import Callable, NamedTuple, Optional
+
+# Snippets kept, one per distinct (code object, line) of recorded tracebacks.
+_MAX_ENTRIES = 1024
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+def _mtime(filename: str) -> Optional[float]:
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+class SourceSnippetCache:
+    """
+    A bounded LRU cache of the source snippets of traceback frames, keyed by
+    code object and line.
+
+    The snippets are extracted with `inspect`, which reads the files through
+    `linecache`. A snippet is extracted again once the modification time of
+    its file changed, so a reloaded module never shows stale source.
+    """
+
+    def __init__(self, maxsize: int = _MAX_ENTRIES):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, code, lineno: int, extract: Callable) -> dict:
+        """
+        Returns the snippet of the code object `code` around `lineno`,
+        calling `extract(code, lineno)` on a miss. The snippet is shared
+        with other callers and must not be modified.
+        """
+        key = (code, lineno)
+        mtime = _mtime(code.co_filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        snippet = extract(code, lineno)
+        with self._lock:
+            self._entries[key] = (mtime, snippet)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return snippet
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, len(self._entries), self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,187 @@
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+_logger = logging.getLogger(__name__)
+
+# Statement attributes of database client spans, the current and the
+# deprecated semantic conventions.
+_STATEMENT_KEYS = ("db.query.text", "db.statement")
+
+# Parents with a run of compressible children at most, the run of the
+# least recently active parent is flushed above that.
+_MAX_PENDING_RUNS = 10000
+
+# Spans started and not ended yet that are tracked at most, the oldest are
+# forgotten above that (spans that never end) and are no longer compressed,
+# nor are their children.
+_MAX_OPEN_SPANS = _MAX_PENDING_RUNS
+
+COMPOSITE_COUNT = "span.composite.count"
+COMPOSITE_SUM = "span.composite.sum"
+COMPOSITE_MIN = "span.composite.min"
+COMPOSITE_MAX = "span.composite.max"
+
+
+def _statement(span: ReadableSpan):
+    attributes = span.attributes
+    for key in _STATEMENT_KEYS:
+        statement = attributes.get(key)
+        if statement is not None:
+            return statement
+    return None
+
+
+class _Run:
+    __slots__ = ("key", "first", "count", "total", "min", "max", "end_time")
+
+    def __init__(self, key: tuple, span: ReadableSpan):
+        duration = span.end_time - span.start_time
+        self.key = key
+        self.first = span
+        self.count = 1
+        self.total = duration
+        self.min = duration
+        self.max = duration
+        self.end_time = span.end_time
+
+    def add(self, span: ReadableSpan):
+        duration = span.end_time - span.start_time
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        if span.end_time > self.end_time:
+            self.end_time = span.end_time
+
+    def span(self) -> ReadableSpan:
+        first = self.first
+        if self.count == 1:
+            return first
+        attributes = dict(first.attributes)
+        attributes[COMPOSITE_COUNT] = self.count
+        attributes[COMPOSITE_SUM] = self.total / 1e6
+        attributes[COMPOSITE_MIN] = self.min / 1e6
+        attributes[COMPOSITE_MAX] = self.max / 1e6
+        return ReadableSpan(
+            name=first.name,
+            context=first.context,
+            parent=first.parent,
+            resource=first.resource,
+            attributes=attributes,
+            links=first.links,
+            kind=first.kind,
+            status=first.status,
+            start_time=first.start_time,
+            end_time=self.end_time,
+            instrumentation_scope=first.instrumentation_scope,
+        )
+
+
+class SpanCompressionProcessor(SpanProcessor):
+    """
+    Merges consecutive sibling spans with the same name, kind and database
+    statement, like the identical queries of an N+1 pattern, into one
+    composite span before handing spans over to `processor`.
+
+    The composite span is the first span of the run, ending when the last
+    one ends, with attributes telling how many spans it stands for and
+    their total, min and max durations in milliseconds:
+    `span.composite.count`, `span.composite.sum`, `span.composite.min` and
+    `span.composite.max`. A run of a single span is forwarded as is.
+
+    Only leaf spans under a local parent that did not end yet, without
+    events and not errored are compressed, so no span is orphaned, errors
+    stay visible and the children of a parent that already ended, like
+    fire-and-forget tasks, are forwarded without waiting. The
+    run of each parent is flushed when a different sibling ends, when the
+    parent ends, and on `force_flush`. Only the first span of a run is
+    held, the spans merged into it are released right away.
+    """
+
+    def __init__(self, processor: SpanProcessor):
+        self.processor = processor
+        self._runs = OrderedDict()
+        # Whether each span started and not ended yet had a child.
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span, parent_context: Optional[Context] = None) -> None:
+        self._open[span.context.span_id] = False
+        if len(self._open) > _MAX_OPEN_SPANS:
+            try:
+                self._open.popitem(last=False)
+            except KeyError:
+                pass
+        parent = span.parent
+        if parent is not None and parent.span_id in self._open:
+            self._open[parent.span_id] = True
+        self.processor.on_start(span, parent_context=parent_context)
+
+    def _is_compressible(self, span: ReadableSpan, has_children: bool) -> bool:
+        parent = span.parent
+        return (
+            parent is not None
+            and not parent.is_remote
+            and parent.span_id in self._open
+            and not has_children
+            and not span.events
+            and span.status.status_code is not StatusCode.ERROR
+        )
+
+    def on_end(self, span: ReadableSpan) -> None:
+        # A forgotten span may have had children, it is not compressed.
+        has_children = self._open.pop(span.context.span_id, True)
+        if not span.context.trace_flags.sampled:
+            self.processor.on_end(span)
+            return
+        ready = []
+        with self._lock:
+            if has_children:
+                run = self._runs.pop(span.context.span_id, None)
+                if run is not None:
+                    ready.append(run.span())
+            if self._is_compressible(span, has_children):
+                parent_id = span.parent.span_id
+                key = (span.name, span.kind, _statement(span))
+                run = self._runs.get(parent_id)
+                if run is not None and run.key == key:
+                    run.add(span)
+                    self._runs.move_to_end(parent_id)
+                else:
+                    if run is not None:
+                        ready.append(run.span())
+                    self._runs[parent_id] = _Run(key, span)
+                    self._runs.move_to_end(parent_id)
+                    if len(self._runs) > _MAX_PENDING_RUNS:
+                        ready.append(self._runs.popitem(last=False)[1].span())
+            else:
+                # Any other sibling ends the run of its parent.
+                parent = span.parent
+                if parent is not None and not parent.is_remote:
+                    run = self._runs.pop(parent.span_id, None)
+                    if run is not None:
+                        ready.append(run.span())
+                ready.append(span)
+        for ready_span in ready:
+            self.processor.on_end(ready_span)
+
+    def _flush_runs(self):
+        with self._lock:
+            runs, self._runs = self._runs, OrderedDict()
+        for run in runs.values():
+            self.processor.on_end(run.span())
+
+    def shutdown(self) -> None:
+        self._flush_runs()
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self._flush_runs()
+        return self.processor.force_flush(timeout_millis)
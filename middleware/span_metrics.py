@@ -0,0 +1,93 @@
+import threading
+import logging
+from opentelemetry import metrics
+from opentelemetry.sdk.trace import SpanProcessor, ReadableSpan
+from opentelemetry.trace import StatusCode
+
+_logger = logging.getLogger(__name__)
+
+# Bucket boundaries (seconds) for span durations, those recommended by the
+# OpenTelemetry HTTP semantic conventions.
+_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0,
+)
+
+# Attributes of the series every span beyond `max_keys` is counted into.
+_OVERFLOW_ATTRIBUTES = {"otel.metric.overflow": True}
+
+
+class SpanMetricsProcessor(SpanProcessor):
+    """
+    Aggregates request rate, error count and duration (RED) metrics from
+    every span that ends, per service, span name and span kind.
+
+    The processor sees spans before they are dropped by sampling: the
+    sampler records the spans it does not sample instead of dropping them
+    (see `DeterministicSampler`), so the metrics stay exact at any sample
+    rate while unsampled spans are still never exported.
+
+    Instruments come from the global meter provider, so the metrics are
+    exported by the meter provider `mw_tracker` sets up once it exists. The
+    attributes of each series are built once and reused. At most `max_keys`
+    series are tracked, further span names are counted into a single
+    overflow series.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._attributes = {}
+        self._lock = threading.Lock()
+        meter = metrics.get_meter(__name__)
+        self._calls = meter.create_counter(
+            "span.calls.count",
+            unit="Count",
+            description="The will show the number of spans ended per service, span name and kind",
+        )
+        self._errors = meter.create_counter(
+            "span.errors.count",
+            unit="Count",
+            description="The will show the number of spans ended with an error status per service, span name and kind",
+        )
+        self._duration = meter.create_histogram(
+            "span.duration",
+            unit="s",
+            description="The will show the duration of spans per service, span name and kind",
+            explicit_bucket_boundaries_advisory=_DURATION_BUCKETS,
+        )
+
+    def _series_attributes(self, key: tuple, span: ReadableSpan) -> dict:
+        with self._lock:
+            attributes = self._attributes.get(key)
+            if attributes is not None:
+                return attributes
+            if len(self._attributes) >= self.max_keys:
+                return _OVERFLOW_ATTRIBUTES
+            attributes = {
+                "service.name": span.resource.attributes.get("service.name", ""),
+                "span.name": span.name,
+                "span.kind": span.kind.name,
+            }
+            self._attributes[key] = attributes
+            return attributes
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span: ReadableSpan):
+        try:
+            key = (span.name, span.kind)
+            attributes = self._attributes.get(key)
+            if attributes is None:
+                attributes = self._series_attributes(key, span)
+            self._calls.add(1, attributes)
+            if span.status.status_code is StatusCode.ERROR:
+                self._errors.add(1, attributes)
+            self._duration.record((span.end_time - span.start_time) / 1e9, attributes)
+        except Exception as e:
+            _logger.debug(f"Failed to record span metrics: {e}")
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
@@ -0,0 +1,461 @@
+import atexit
+import json
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import logging
+from typing import Callable, Optional, Sequence
+from opentelemetry.exporter.otlp.proto.common._internal.metrics_encoder import (
+    OTLPMetricExporterMixin,
+)
+from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+    ExportMetricsServiceRequest,
+)
+from opentelemetry.metrics import CallbackOptions, Meter, Observation
+from opentelemetry.sdk._logs import LogData
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import (
+    MetricExporter,
+    MetricExportResult,
+    MetricsData,
+)
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from middleware import export_codec
+from middleware.options import MWOptions
+
+_logger = logging.getLogger(__name__)
+
+# Ring header: write position then read position, both counting bytes since
+# the ring was created so they never wrap.
+_RING_HEADER = struct.Struct("=QQ")
+_POSITION = struct.Struct("=Q")
+_READ_OFFSET = _POSITION.size
+_RECORD_LENGTH = struct.Struct("=I")
+
+# Seconds the application waits on exit for the worker to export what is
+# left in the ring.
+_CLOSE_TIMEOUT = 10.0
+
+# Options the export worker needs to build its exporters.
+WORKER_OPTIONS = (
+    "target",
+    "bsp_export_timeout",
+    "exporter_protocol",
+    "exporter_compression",
+    "exporter_compression_level",
+    "persistent_queue_dir",
+    "persistent_queue_size",
+    "export_circuit_breaker",
+    "export_circuit_failure_threshold",
+    "export_circuit_probe_interval",
+)
+
+# Times the export worker of a process is started again after it exited,
+# telemetry is then exported in-process.
+_MAX_RESTARTS = 3
+
+_channel = None
+_channel_lock = threading.Lock()
+_users = 0
+_restarts = 0
+_failed = False
+# Records dropped by the channels of this process that were replaced.
+_dropped = 0
+
+
+class SharedRingBuffer:
+    """
+    A byte ring buffer in a shared memory file, with a single writer process
+    and a single reader process.
+
+    Records are a length followed by the payload and may wrap around the end
+    of the ring. The writer only moves the write position and the reader the
+    read position, each after copying a whole record, so neither side ever
+    sees a partial record. Threads of the writer process have to serialize
+    their `put` calls (see `ExportChannel`).
+    """
+
+    def __init__(self, path: str, capacity: int, create: bool = False):
+        self.path = path
+        self.capacity = capacity
+        size = _RING_HEADER.size + capacity
+        fd = os.open(path, os.O_RDWR)
+        try:
+            if create:
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _copy_in(self, position: int, data: bytes):
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        base = _RING_HEADER.size
+        self._mmap[base + start : base + start + first] = data[:first]
+        if first < len(data):
+            self._mmap[base : base + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        base = _RING_HEADER.size
+        data = self._mmap[base + start : base + start + first]
+        if first < length:
+            data += self._mmap[base : base + length - first]
+        return data
+
+    def put(self, payload: bytes) -> bool:
+        """Appends a record, returns False if the ring has no room for it."""
+        write, read = _RING_HEADER.unpack_from(self._mmap, 0)
+        size = _RECORD_LENGTH.size + len(payload)
+        if size > self.capacity - (write - read):
+            return False
+        self._copy_in(write, _RECORD_LENGTH.pack(len(payload)))
+        self._copy_in(write + _RECORD_LENGTH.size, payload)
+        _POSITION.pack_into(self._mmap, 0, write + size)
+        return True
+
+    def get(self) -> Optional[bytes]:
+        """Removes and returns the oldest record, None if the ring is empty."""
+        write, read = _RING_HEADER.unpack_from(self._mmap, 0)
+        if read == write:
+            return None
+        length = _RECORD_LENGTH.unpack(self._copy_out(read, _RECORD_LENGTH.size))[0]
+        payload = self._copy_out(read + _RECORD_LENGTH.size, length)
+        _POSITION.pack_into(self._mmap, _READ_OFFSET, read + _RECORD_LENGTH.size + length)
+        return payload
+
+    def used(self) -> int:
+        write, read = _RING_HEADER.unpack_from(self._mmap, 0)
+        return write - read
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except Exception as e:
+            _logger.debug(f"Failed to close export ring: {e}")
+
+
+def _worker_environment() -> dict:
+    """
+    Returns the environment of the export worker: the application's, without
+    the auto-instrumentation hooks so the worker does not trace itself.
+    """
+    env = dict(os.environ)
+    paths = [
+        path
+        for path in env.get("PYTHONPATH", "").split(os.pathsep)
+        if path and "auto_instrumentation" not in path
+    ]
+    # The worker imports this package from wherever the application did.
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if package_root not in paths:
+        paths.append(package_root)
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    env["OTEL_SDK_DISABLED"] = "true"
+    env.pop("OTEL_PYTHON_CONFIGURATOR", None)
+    env.pop("OTEL_PYTHON_DISTRO", None)
+    return env
+
+
+def _ring_directory() -> Optional[str]:
+    # Memory backed on Linux, so the ring never reaches the disk.
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+class ExportChannel:
+    """
+    Hands encoded telemetry over to an export worker subprocess
+    (`python -m middleware.export_worker`) through a `SharedRingBuffer`.
+
+    The worker decodes, encodes to OTLP, compresses and sends the telemetry
+    with its own interpreter, so none of that holds the application's GIL.
+    The worker exits once the application closes its end of the pipe it
+    reads from, by closing the channel or by exiting, after exporting what
+    is left in the ring.
+    """
+
+    def __init__(self, options: MWOptions):
+        self.pid = os.getpid()
+        self.dropped = 0
+        self._lock = threading.Lock()
+        fd, path = tempfile.mkstemp(prefix="mw-export-", dir=_ring_directory())
+        os.close(fd)
+        self.ring = SharedRingBuffer(path, options.export_buffer_size, create=True)
+        # The worker builds its exporters from these options only, it does
+        # not build `MWOptions` which would check the agent's health again.
+        worker_options = {name: getattr(options, name) for name in WORKER_OPTIONS}
+        try:
+            self._process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "middleware.export_worker",
+                    path,
+                    str(options.export_buffer_size),
+                    json.dumps(worker_options),
+                ],
+                stdin=subprocess.PIPE,
+                env=_worker_environment(),
+                close_fds=True,
+            )
+        except Exception:
+            self.ring.close()
+            os.unlink(path)
+            raise
+
+    def send(self, payload: bytes) -> bool:
+        with self._lock:
+            if self.ring.put(payload):
+                return True
+            self.dropped += 1
+        _logger.debug("Export ring is full, dropping telemetry")
+        return False
+
+    def is_alive(self) -> bool:
+        return self._process.poll() is None
+
+    def returncode(self) -> Optional[int]:
+        return self._process.returncode
+
+    def close(self, timeout: float = _CLOSE_TIMEOUT):
+        try:
+            self._process.stdin.close()
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            _logger.debug("Export worker did not exit in time, stopping it")
+            self._process.kill()
+        except Exception as e:
+            _logger.debug(f"Failed to stop export worker: {e}")
+        self.ring.close()
+        try:
+            os.unlink(self.ring.path)
+        except OSError:
+            pass
+
+    def abandon(self):
+        """Lets go of the parent's worker in a forked child."""
+        try:
+            self._process.stdin.close()
+        except Exception as e:
+            _logger.debug(f"Failed to release export worker after fork: {e}")
+        self.ring.close()
+
+
+def get_export_channel(options: MWOptions) -> Optional[ExportChannel]:
+    """
+    Returns the export channel of the current process, starting its worker
+    on first use. Each process forked from the application starts its own.
+
+    A worker that exited (crashed, killed, or never ran because
+    `sys.executable` is not a Python interpreter, as under uwsgi) is started
+    again up to `_MAX_RESTARTS` times. Returns None once the worker cannot be
+    started, the caller then exports in-process.
+    """
+    global _channel, _restarts, _failed, _dropped
+    channel = _channel
+    if channel is not None and channel.is_alive():
+        return channel
+    with _channel_lock:
+        if _channel is not None and not _channel.is_alive():
+            dead, _channel = _channel, None
+            _logger.warning(
+                f"Export worker exited with status {dead.returncode()}, "
+                f"{dead.ring.used()} bytes of telemetry are lost"
+            )
+            _dropped += dead.dropped
+            dead.close(timeout=0)
+            _restarts += 1
+            if _restarts > _MAX_RESTARTS:
+                _logger.error("Export worker keeps exiting, exporting in-process")
+                _failed = True
+        if _channel is None and not _failed:
+            try:
+                _channel = ExportChannel(options)
+            except Exception as e:
+                _logger.error(f"Failed to start the export worker, exporting in-process: {e}")
+                _failed = True
+        return _channel
+
+
+def _acquire_channel():
+    global _users
+    with _channel_lock:
+        _users += 1
+
+
+def _release_channel():
+    global _users, _channel
+    with _channel_lock:
+        _users -= 1
+        if _users > 0 or _channel is None:
+            return
+        channel, _channel = _channel, None
+    channel.close()
+
+
+def _close_channel_at_exit():
+    global _channel
+    channel, _channel = _channel, None
+    if channel is not None and channel.pid == os.getpid():
+        channel.close()
+
+
+def _abandon_channel_after_fork():
+    global _channel, _channel_lock, _restarts, _failed, _dropped
+    _channel_lock = threading.Lock()
+    _restarts = 0
+    _failed = False
+    _dropped = 0
+    channel, _channel = _channel, None
+    if channel is not None:
+        channel.abandon()
+
+
+# Exporters release the channel when their provider shuts down, this only
+# stops the worker of providers that were never shut down.
+atexit.register(_close_channel_at_exit)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_abandon_channel_after_fork)
+
+
+def _dropped_cb(options: CallbackOptions):
+    channel = _channel
+    dropped = _dropped + (channel.dropped if channel is not None else 0)
+    yield Observation(value=dropped)
+
+
+def install_export_channel_metrics(meter: Meter):
+    """Creates the instruments of the `ExportChannel` on the given meter."""
+    try:
+        meter.create_observable_counter(
+            "process.export.subprocess.dropped.count",
+            unit="Count",
+            callbacks=[_dropped_cb],
+            description="The will show the number of batches dropped because the export helper buffer was full",
+        )
+    except Exception as e:
+        _logger.debug(f"Failed to create export subprocess dropped.count counter: {e}")
+
+
+class _SubprocessExporter:
+    """
+    Base of the subprocess exporters. `fallback` builds the in-process
+    exporter used once the export worker cannot be started.
+    """
+
+    def __init__(self, options: MWOptions, fallback: Callable):
+        self._options = options
+        self._shutdown = False
+        self._fallback_factory = fallback
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+        _acquire_channel()
+
+    def _in_process(self):
+        if self._fallback is None:
+            with self._fallback_lock:
+                if self._fallback is None:
+                    self._fallback = self._fallback_factory()
+        return self._fallback
+
+    def _release(self):
+        if not self._shutdown:
+            self._shutdown = True
+            _release_channel()
+            if self._fallback is not None:
+                self._fallback.shutdown()
+
+    def _flush_fallback(self, timeout_millis) -> bool:
+        if self._fallback is None:
+            return True
+        return self._fallback.force_flush(timeout_millis)
+
+
+class SubprocessSpanExporter(_SubprocessExporter, SpanExporter):
+    """Hands spans over to the export worker, see `ExportChannel`."""
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._shutdown:
+            return SpanExportResult.FAILURE
+        channel = get_export_channel(self._options)
+        if channel is None:
+            return self._in_process().export(spans)
+        try:
+            if channel.send(export_codec.encode_spans(spans)):
+                return SpanExportResult.SUCCESS
+        except Exception as e:
+            _logger.debug(f"Failed to encode spans for the export worker: {e}")
+        return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        self._release()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._flush_fallback(timeout_millis)
+
+
+class SubprocessLogExporter(_SubprocessExporter, LogExporter):
+    """Hands log records over to the export worker, see `ExportChannel`."""
+
+    def export(self, batch: Sequence[LogData]) -> LogExportResult:
+        if self._shutdown:
+            return LogExportResult.FAILURE
+        channel = get_export_channel(self._options)
+        if channel is None:
+            return self._in_process().export(batch)
+        try:
+            if channel.send(export_codec.encode_logs(batch)):
+                return LogExportResult.SUCCESS
+        except Exception as e:
+            _logger.debug(f"Failed to encode logs for the export worker: {e}")
+        return LogExportResult.FAILURE
+
+    def shutdown(self):
+        self._release()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._flush_fallback(timeout_millis)
+
+
+class SubprocessMetricExporter(
+    _SubprocessExporter, OTLPMetricExporterMixin, MetricExporter
+):
+    """
+    Hands metrics over to the export worker, see `ExportChannel`. Prefers
+    the same temporality and aggregation as the OTLP metric exporter.
+    """
+
+    def __init__(self, options: MWOptions, fallback: Callable):
+        _SubprocessExporter.__init__(self, options, fallback)
+        self._common_configuration()
+
+    def export(
+        self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs
+    ) -> MetricExportResult:
+        if self._shutdown:
+            return MetricExportResult.FAILURE
+        channel = get_export_channel(self._options)
+        if channel is None:
+            return self._in_process().export(metrics_data, timeout_millis=timeout_millis)
+        try:
+            if isinstance(metrics_data, ExportMetricsServiceRequest):
+                payload = export_codec.encode_metrics_request(metrics_data)
+            else:
+                payload = export_codec.encode_metrics(metrics_data)
+            if channel.send(payload):
+                return MetricExportResult.SUCCESS
+        except Exception as e:
+            _logger.debug(f"Failed to encode metrics for the export worker: {e}")
+        return MetricExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._flush_fallback(timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._release()
@@ -0,0 +1,211 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+from opentelemetry.trace import StatusCode
+from middleware.fork import register_at_fork_reinit
+
+_logger = logging.getLogger(__name__)
+
+# Decisions are remembered for this many traces after they are taken, so
+# spans ending after their local root follow the decision of their trace.
+_MAX_DECIDED_TRACES = 10000
+
+_CHECK_INTERVAL = 1.0
+
+
+def parse_rules(rules: Optional[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Parses attribute rules like "http.status_code=500,error.type" into
+    (key, value) pairs. A rule without a value matches any span that has
+    the attribute.
+    """
+    parsed = []
+    for rule in (rules or "").split(","):
+        rule = rule.strip()
+        if not rule:
+            continue
+        key, sep, value = rule.partition("=")
+        parsed.append((key.strip(), value.strip() if sep else None))
+    return parsed
+
+
+class _PendingTrace:
+    __slots__ = ("spans", "keep", "updated_at")
+
+    def __init__(self, updated_at: float):
+        self.spans = []
+        self.keep = False
+        self.updated_at = updated_at
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers the spans of each local trace until the trace is complete, then
+    hands the whole trace over to `processor` if any of its spans errored,
+    lasted at least `latency_threshold` seconds or matched one of the
+    attribute `rules`. Other traces are kept at the base `rate` (1/N), chosen
+    from the trace id like `TraceIdRatioBased`, and get their `SampleRate`
+    attribute set to it so the backend can reweight them. A `rate` of 0 (or
+    less) keeps only the traces above.
+
+    A trace is complete when its local root span ends, or when none of its
+    spans ended for `decision_wait` seconds. Whether a trace is interesting is
+    tracked while its spans end, so buffered traces hold only their spans
+    and one flag. At most `max_spans` spans are buffered: above that the
+    least recently active trace is decided right away with the spans it has.
+
+    Head sampling has to keep every span for this to see them, see
+    `configure_sampler`.
+    """
+
+    def __init__(
+        self,
+        processor: SpanProcessor,
+        rate: int,
+        decision_wait: float,
+        max_spans: int,
+        latency_threshold: float,
+        rules: Optional[List[Tuple[str, Optional[str]]]] = None,
+    ):
+        self.processor = processor
+        self.rate = rate
+        self.decision_wait = decision_wait
+        self.max_spans = max_spans
+        self.latency_threshold_ns = int(latency_threshold * 1e9)
+        self.rules = rules or []
+        self._bound = TraceIdRatioBased.get_bound_for_rate(1.0 / rate) if rate > 0 else 0
+        self._traces = OrderedDict()
+        self._decided = OrderedDict()
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._start_worker()
+        register_at_fork_reinit(self._at_fork_reinit)
+
+    def _start_worker(self):
+        self._worker_awaken = threading.Event()
+        self._worker = threading.Thread(
+            name="MWTailSamplingProcessor", target=self._run, daemon=True
+        )
+        self._worker.start()
+
+    def _at_fork_reinit(self):
+        self._lock = threading.Lock()
+        self._traces.clear()
+        self._decided.clear()
+        self._buffered = 0
+        self._start_worker()
+
+    def _run(self):
+        while not self._shutdown:
+            self._worker_awaken.wait(min(_CHECK_INTERVAL, self.decision_wait))
+            if self._shutdown:
+                break
+            self._decide_expired(time.monotonic())
+
+    def _is_interesting(self, span: ReadableSpan) -> bool:
+        if span.status.status_code is StatusCode.ERROR:
+            return True
+        if span.end_time - span.start_time >= self.latency_threshold_ns:
+            return True
+        if self.rules:
+            attributes = span.attributes
+            for key, value in self.rules:
+                if key in attributes and (value is None or str(attributes[key]) == value):
+                    return True
+        return False
+
+    def _keep_by_rate(self, trace_id: int) -> bool:
+        return trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._bound
+
+    def on_start(self, span, parent_context: Optional[Context] = None) -> None:
+        self.processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        ready = []
+        with self._lock:
+            sample_rate = self._decided.get(trace_id)
+            if sample_rate is not None:
+                if sample_rate:
+                    ready.append((span, sample_rate))
+            else:
+                now = time.monotonic()
+                trace = self._traces.get(trace_id)
+                if trace is None:
+                    trace = self._traces[trace_id] = _PendingTrace(now)
+                else:
+                    trace.updated_at = now
+                    self._traces.move_to_end(trace_id)
+                trace.spans.append(span)
+                self._buffered += 1
+                if not trace.keep and self._is_interesting(span):
+                    trace.keep = True
+                if is_local_root:
+                    ready.extend(self._decide(trace_id))
+                while self._buffered > self.max_spans and self._traces:
+                    ready.extend(self._decide(next(iter(self._traces))))
+        self._forward(ready)
+
+    def _decide(self, trace_id: int) -> list:
+        """Takes the decision for a buffered trace, must hold the lock."""
+        trace = self._traces.pop(trace_id)
+        self._buffered -= len(trace.spans)
+        # The decision is the SampleRate of the kept spans, 0 if dropped.
+        if trace.keep:
+            sample_rate = 1
+        elif self._keep_by_rate(trace_id):
+            sample_rate = self.rate
+        else:
+            sample_rate = 0
+        self._decided[trace_id] = sample_rate
+        if len(self._decided) > _MAX_DECIDED_TRACES:
+            self._decided.popitem(last=False)
+        if not sample_rate:
+            return []
+        return [(span, sample_rate) for span in trace.spans]
+
+    def _decide_expired(self, now: float):
+        ready = []
+        with self._lock:
+            # Traces are ordered from the least recently active.
+            while self._traces:
+                trace_id, trace = next(iter(self._traces.items()))
+                if now - trace.updated_at < self.decision_wait:
+                    break
+                ready.extend(self._decide(trace_id))
+        self._forward(ready)
+
+    def _forward(self, ready: list):
+        for span, sample_rate in ready:
+            if sample_rate > 1:
+                try:
+                    span._attributes["SampleRate"] = sample_rate
+                except Exception as e:
+                    _logger.debug(f"Failed to set SampleRate on span: {e}")
+            self.processor.on_end(span)
+
+    def _decide_all(self):
+        ready = []
+        with self._lock:
+            while self._traces:
+                ready.extend(self._decide(next(iter(self._traces))))
+        self._forward(ready)
+
+    def shutdown(self) -> None:
+        self._shutdown = True
+        self._worker_awaken.set()
+        self._decide_all()
+        self.processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self._decide_all()
+        return self.processor.force_flush(timeout_millis)
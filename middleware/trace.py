@@ -1,44 +1,87 @@
-import grpc
+import re
 import sys
 import logging
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider, SpanProcessor, ReadableSpan
 from opentelemetry.sdk.trace.export import (
-    BatchSpanProcessor,
     SimpleSpanProcessor,
     ConsoleSpanExporter,
 )
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.processor.baggage import ALLOW_ALL_BAGGAGE_KEYS, BaggageSpanProcessor
 from middleware.options import MWOptions
+from middleware.exporters import create_span_exporter
 from opentelemetry.trace import set_tracer_provider, Span
 from middleware.sampler import configure_sampler
+from middleware.span_metrics import SpanMetricsProcessor
+from middleware.batch import ObservableBatchSpanProcessor
+from middleware.tail_sampling import TailSamplingSpanProcessor, parse_rules
+from middleware.span_compression import SpanCompressionProcessor
+from middleware.exception_event import ExceptionEvent
 
 _logger = logging.getLogger(__name__)
 
+# The lines of `^~` marking positions in Python 3.11+ stack traces.
+_POSITION_MARKERS = re.compile(r"^ *[~^]+ *\n", re.MULTILINE)
+
+def _has_stack_details(event) -> bool:
+    # The details of an `ExceptionEvent` are only built on export.
+    if isinstance(event, ExceptionEvent):
+        return True
+    return event.name == "exception" and "exception.stack_details" in event.attributes
+
+
+def _stack_trace(event) -> str:
+    if isinstance(event, ExceptionEvent):
+        stack_trace = event.stacktrace
+    else:
+        stack_trace = event.attributes.get("exception.stacktrace")
+    # The stack trace of an `ExceptionEvent` has no position markers.
+    if stack_trace:
+        stack_trace = _POSITION_MARKERS.sub("", stack_trace)
+    return stack_trace
+
+
 class ExceptionFilteringSpanProcessor(SpanProcessor):
+    """
+    Drops standard "exception" events that duplicate an event carrying
+    "exception.stack_details".
+
+    Exceptions recorded through `Span.record_exception` are already recorded
+    once per span with their details (see `custom_record_exception_wrapper`),
+    so only spans holding events added some other way have anything to
+    filter. Spans with fewer than two events return right away.
+
+    Must be added before the processors that export spans: the events are
+    rewritten in place, which is only safe before the span is queued for
+    export.
+    """
+
     def on_start(self, span: ReadableSpan, parent_context):
         pass
 
     def on_end(self, span: ReadableSpan):
+        events = span._events
+        if events is None or len(events) < 2:
+            return
+
         # Check if there is any "exception" event with "exception.stack_details"
-        has_stack_details = any(
-            event.name == "exception" and "exception.stack_details" in event.attributes
-            for event in span.events
+        # along with a standard one
+        has_stack_details = any(_has_stack_details(event) for event in events)
+        has_standard = any(
+            event.name == "exception" and not _has_stack_details(event)
+            for event in events
         )
 
-        if has_stack_details:
-            # Keep only the unique "exception" events based on "exception.stack_trace"
+        if has_stack_details and has_standard:
+            # Keep only the unique "exception" events based on "exception.stacktrace"
             seen_stack_traces = set()
             filtered_events = []
-            for event in span.events:
-                if event.name == "exception" and "exception.stack_details" in event.attributes:
-                    stack_trace = event.attributes.get("exception.stack_trace")
-                    seen_stack_traces.add(stack_trace)
+            for event in events:
+                if _has_stack_details(event):
+                    seen_stack_traces.add(_stack_trace(event))
                     filtered_events.append(event)
                 elif event.name == "exception":
-                    stack_trace = event.attributes.get("exception.stack_trace")
-                    if stack_trace not in seen_stack_traces:
+                    if _stack_trace(event) not in seen_stack_traces:
                         filtered_events.append(event)
                 elif event.name != "exception":
                     filtered_events.append(event)
@@ -62,20 +105,39 @@ def create_tracer_provider(options: MWOptions, resource: Resource) -> TracerProv
         TracerProvider: the new tracer provider
     """
 
-    exporter = OTLPSpanExporter(
-        endpoint=options.target,
-        compression=grpc.Compression.Gzip,
-    )
+    exporter = create_span_exporter(options)
     trace_provider = TracerProvider(
         resource=resource, shutdown_on_exit=True, sampler=configure_sampler(options)
     )
     trace_provider.add_span_processor(BaggageSpanProcessor(ALLOW_ALL_BAGGAGE_KEYS))
-    trace_provider.add_span_processor(
-        BatchSpanProcessor(
-            exporter,
+    if options.collect_span_metrics:
+        trace_provider.add_span_processor(
+            SpanMetricsProcessor(max_keys=options.span_metrics_max_keys)
         )
-    )
+    # Processors run in the order they are added, events are filtered before
+    # the span is handed over to the export thread.
     trace_provider.add_span_processor(ExceptionFilteringSpanProcessor())
+    batch_processor = ObservableBatchSpanProcessor(
+        exporter,
+        max_queue_size=options.bsp_max_queue_size,
+        schedule_delay_millis=options.bsp_schedule_delay,
+        max_export_batch_size=options.bsp_max_export_batch_size,
+        export_timeout_millis=options.bsp_export_timeout,
+    )
+    if options.tail_sampling:
+        batch_processor = TailSamplingSpanProcessor(
+            batch_processor,
+            rate=options.sample_rate,
+            decision_wait=options.tail_sampling_decision_wait,
+            max_spans=options.tail_sampling_max_spans,
+            latency_threshold=options.tail_sampling_latency_threshold / 1000,
+            rules=parse_rules(options.tail_sampling_rules),
+        )
+    if options.span_compression:
+        # Runs are flushed before their parent, so tail sampling still sees
+        # the local root span last.
+        batch_processor = SpanCompressionProcessor(batch_processor)
+    trace_provider.add_span_processor(batch_processor)
     if options.console_exporter:
         output = sys.stdout
         if options.debug_log_file: